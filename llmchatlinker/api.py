@@ -1,10 +1,24 @@
 # llmchatlinker/api.py
 
-from fastapi import FastAPI, HTTPException
+import os
+import uuid
+import time
+import asyncio
+import logging
+import threading
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from typing import Optional, List, Dict, Any, Callable
+from datetime import datetime, date
 from .client import LLMChatLinkerClient
+from .message_queue import EventSubscriber, CHAT_ROUTING_PREFIX, RETRY_DELAY
+from .providers.generation import LLM_MAX_READ_TIMEOUT, LLM_MAX_STOP_SEQUENCES
+from .versions import (
+    VersionCache, make_etag, etag_matches, USERS_VERSION, CHATS_VERSION, LLM_CONFIG_VERSION, VERSION_ROUTING_PREFIX
+)
 
 app = FastAPI(
     title="LLMChatLinker API",
@@ -12,8 +26,117 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Configure CORS settings here, so every process that imports the app serves them
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],       # Allow all origins
+    allow_credentials=True,    # Allow credentials
+    allow_methods=["*"],       # Allow all HTTP methods
+    allow_headers=["*"],       # Allow all HTTP headers
+)
+
 client = LLMChatLinkerClient()
 
+# Seconds between checks whether the HTTP client waiting for a generation is still connected
+DISCONNECT_POLL_INTERVAL = float(os.getenv('DISCONNECT_POLL_INTERVAL', 0.5))
+
+async def call_until_disconnected(http_request: Request, call: Callable[..., Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]:
+    """Run a blocking client call in a thread and cancel its instruction if the HTTP client disconnects."""
+    correlation_id = str(uuid.uuid4())
+    task = asyncio.ensure_future(run_in_threadpool(call, *args, correlation_id=correlation_id, **kwargs))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            # The waiting thread returns once the orchestrator answers the cancelled instruction
+            await run_in_threadpool(client.cancel_instruction, correlation_id)
+            return {"status": "error", "message": "Client disconnected", "data": {"cancelled": True}}
+
+# Versions of the listed entities, used to answer If-None-Match without asking an orchestrator
+entity_versions = VersionCache()
+
+# Version counters a mutating request may have changed, by path prefix
+MUTATED_VERSIONS = {
+    '/user/': (USERS_VERSION, CHATS_VERSION),
+    '/chat/': (CHATS_VERSION,),
+    '/llm_provider/': (LLM_CONFIG_VERSION,),
+    '/llm/': (LLM_CONFIG_VERSION, CHATS_VERSION)
+}
+
+def sync_params(updated_since: Optional[datetime], sync_token: Optional[str]) -> Dict[str, Any]:
+    """Client keyword arguments of a listing's change feed query parameters."""
+    return {"updated_since": updated_since.isoformat() if updated_since else None, "sync_token": sync_token}
+
+def projection_params(fields: Optional[str], view: Optional[str]) -> Dict[str, Any]:
+    """Client keyword arguments of a read's comma separated fields and view query parameters."""
+    return {"fields": fields, "view": view}
+
+def listen_for_versions():
+    """Keep entity_versions up to date with the version events of the orchestrators"""
+    while True:
+        subscriber = None
+        try:
+            subscriber = EventSubscriber([f"{VERSION_ROUTING_PREFIX}.*"])
+            entity_versions.set_listening(True)
+            for _, event in subscriber.events():
+                entity_versions.update(event['name'], event['version'])
+        except Exception as e:
+            logging.error(f"Version listener failed: {e}")
+        finally:
+            entity_versions.set_listening(False)
+            if subscriber is not None:
+                try:
+                    subscriber.close()
+                except Exception:
+                    pass
+        time.sleep(RETRY_DELAY)
+
+@app.on_event("startup")
+def start_version_listener():
+    threading.Thread(target=listen_for_versions, name='api-versions', daemon=True).start()
+
+# Longest Idempotency-Key header accepted
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+@app.middleware("http")
+async def apply_idempotency_key(request: Request, call_next):
+    """Send the instructions of a POST, PUT or DELETE with its Idempotency-Key header, if any"""
+    key = request.headers.get('idempotency-key')
+    if not key or request.method not in ('POST', 'PUT', 'DELETE'):
+        return await call_next(request)
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return JSONResponse(
+            status_code=400, content={"detail": f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters"}
+        )
+    # The endpoint runs in a copy of this context, so its client calls carry the key
+    with client.idempotency_key(key):
+        return await call_next(request)
+
+@app.middleware("http")
+async def invalidate_mutated_versions(request: Request, call_next):
+    """Stop answering If-None-Match for what a request may have changed until its new version is known"""
+    response = await call_next(request)
+    if request.method not in ('GET', 'HEAD'):
+        for prefix, names in MUTATED_VERSIONS.items():
+            if request.url.path.startswith(prefix):
+                for name in names:
+                    entity_versions.invalidate(name)
+    return response
+
+def conditional_get(http_request: Request, response: Response, name: str, call: Callable[..., Dict[str, Any]], *args, **kwargs) -> Any:
+    """Answer 304 if the client has the current version of name, otherwise call and tag the result with its ETag."""
+    version = entity_versions.get(name)
+    if version is not None and etag_matches(http_request.headers.get('if-none-match'), make_etag(name, version)):
+        return Response(status_code=304, headers={"ETag": make_etag(name, version), "Cache-Control": "no-cache"})
+    result = call(*args, **kwargs)
+    version = result.get('data', {}).get('version')
+    if result.get('status') == 'success' and version is not None:
+        entity_versions.update(name, version)
+        response.headers['ETag'] = make_etag(name, version)
+        response.headers['Cache-Control'] = 'no-cache'
+    return result
+
 class BaseResponse(BaseModel):
     status: str
     message: str
@@ -27,12 +150,17 @@ class UserCreateRequest(BaseModel):
     username: str = Field(..., min_length=3, max_length=30, pattern=r'^[a-zA-Z][a-zA-Z0-9_]{2,29}$')
     display_name: Optional[str] = Field(None, max_length=50)
     profile: Optional[str] = None
+    daily_token_quota: Optional[int] = Field(None, ge=0)
+    priority_tier: Optional[str] = Field(None, max_length=20)
 
 class UserUpdateRequest(BaseModel):
     user_id: str
     username: Optional[str] = Field(None, min_length=3, max_length=30, pattern=r'^[a-zA-Z][a-zA-Z0-9_]{2,29}$')
     display_name: Optional[str] = Field(None, max_length=50)
     profile: Optional[str] = None
+    daily_token_quota: Optional[int] = Field(None, ge=0)
+    # '' returns the user to the default tier
+    priority_tier: Optional[str] = Field(None, max_length=20)
 
 class UserResponse(DataResponse):
     data: Dict[str, Any]
@@ -50,24 +178,64 @@ class ChatResponse(DataResponse):
     data: Dict[str, Any]
 
 # LLM Provider Management Models
+class ProviderEndpoint(BaseModel):
+    url: str = Field(..., min_length=1, max_length=255)
+    weight: float = Field(1, gt=0)
+
+PROVIDER_KIND_PATTERN = r'^(openai|ollama)$'
+
 class LLMProviderAddRequest(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
-    api_endpoint: str = Field(..., max_length=255)
+    kind: Optional[str] = Field(None, pattern=PROVIDER_KIND_PATTERN)
+    api_endpoint: Optional[str] = Field(None, max_length=255)
+    endpoints: Optional[List[ProviderEndpoint]] = None
     api_key: Optional[str] = Field(None, max_length=255)
+    requests_per_minute: Optional[int] = Field(None, ge=1)
+    tokens_per_minute: Optional[int] = Field(None, ge=1)
+    max_concurrency: Optional[int] = Field(None, ge=1)
+    batch_window_ms: Optional[int] = Field(None, ge=1, le=1000)
+    batch_max_size: Optional[int] = Field(None, ge=1)
 
 class LLMProviderUpdateRequest(BaseModel):
     provider_id: str
     name: Optional[str] = Field(None, min_length=1, max_length=100)
+    kind: Optional[str] = Field(None, pattern=PROVIDER_KIND_PATTERN)
     api_endpoint: Optional[str] = Field(None, max_length=255)
+    endpoints: Optional[List[ProviderEndpoint]] = None
+    # 0 removes the corresponding limit
+    requests_per_minute: Optional[int] = Field(None, ge=0)
+    tokens_per_minute: Optional[int] = Field(None, ge=0)
+    max_concurrency: Optional[int] = Field(None, ge=0)
+    # 0 turns micro-batching off
+    batch_window_ms: Optional[int] = Field(None, ge=0, le=1000)
+    batch_max_size: Optional[int] = Field(None, ge=0)
 
 # LLM Management Models
+class GenerationParams(BaseModel):
+    max_tokens: Optional[int] = Field(None, ge=1)
+    temperature: Optional[float] = Field(None, ge=0, le=2)
+    stop: Optional[List[str]] = Field(None, min_items=1, max_items=LLM_MAX_STOP_SEQUENCES)
+    # Seconds; the read timeout also caps the endpoint's adaptive timeout
+    connect_timeout: Optional[float] = Field(None, gt=0, le=LLM_MAX_READ_TIMEOUT)
+    read_timeout: Optional[float] = Field(None, gt=0, le=LLM_MAX_READ_TIMEOUT)
+
+def generation_params_dict(params: Optional[GenerationParams]) -> Optional[Dict[str, Any]]:
+    return params.dict(exclude_none=True) if params is not None else None
+
 class LLMAddRequest(BaseModel):
     provider_id: str
     llm_name: str = Field(..., min_length=1, max_length=100)
+    fallback_llm_ids: Optional[List[str]] = None
+    # Defaults to LLM_WARMUP_ON_ADD
+    warmup: Optional[bool] = None
+    generation_params: Optional[GenerationParams] = None
 
 class LLMUpdateRequest(BaseModel):
     llm_id: str
-    llm_name: str = Field(..., min_length=1, max_length=100)
+    llm_name: Optional[str] = Field(None, min_length=1, max_length=100)
+    fallback_llm_ids: Optional[List[str]] = None
+    # Replaces the stored settings; {} clears them
+    generation_params: Optional[GenerationParams] = None
 
 class LLMResponseGenerateRequest(BaseModel):
     user_id: str
@@ -75,20 +243,40 @@ class LLMResponseGenerateRequest(BaseModel):
     provider_id: str
     llm_id: str
     user_input: str = Field(..., min_length=1)
+    generation_params: Optional[GenerationParams] = None
+    run_async: bool = False
+
+class LLMResponseGenerateMultiRequest(BaseModel):
+    user_id: str
+    chat_id: str
+    llm_ids: List[str] = Field(..., min_items=1)
+    user_input: str = Field(..., min_length=1)
+    deadline: Optional[float] = Field(None, gt=0)
+    generation_params: Optional[GenerationParams] = None
+    run_async: bool = False
+    # Store the answers that arrived before the client disconnected
+    keep_partial: bool = False
 
 class LLMResponseRegenerateRequest(BaseModel):
     message_id: str
+    n: int = Field(1, ge=1)
+    generation_params: Optional[GenerationParams] = None
+    run_async: bool = False
+    # Store the candidates that arrived before the client disconnected
+    keep_partial: bool = False
 
 # User Management Endpoints
 @app.post("/user/create", response_model=UserResponse, tags=["User Management"])
 async def create_user(request: UserCreateRequest):
     """Create a new user with a username and profile."""
-    return client.create_user(request.username, request.display_name, request.profile)
+    return client.create_user(request.username, request.display_name, request.profile, request.daily_token_quota, request.priority_tier)
 
 @app.put("/user/update", response_model=UserResponse, tags=["User Management"])
 async def update_user(request: UserUpdateRequest):
     """Update an existing user's username and profile."""
-    return client.update_user(request.user_id, request.username, request.display_name, request.profile)
+    return client.update_user(
+        request.user_id, request.username, request.display_name, request.profile, request.daily_token_quota, request.priority_tier
+    )
 
 @app.delete("/user/delete", response_model=BaseResponse, tags=["User Management"])
 async def delete_user(request: UserUpdateRequest):
@@ -96,19 +284,24 @@ async def delete_user(request: UserUpdateRequest):
     return client.delete_user(request.user_id)
 
 @app.get("/user/list", response_model=DataResponse, tags=["User Management"])
-async def list_users():
+async def list_users(
+    http_request: Request, response: Response, updated_since: Optional[datetime] = None, sync_token: Optional[str] = None,
+    fields: Optional[str] = None, view: Optional[str] = None
+):
     """List all users."""
-    return client.list_users()
+    return conditional_get(
+        http_request, response, USERS_VERSION, client.list_users, **sync_params(updated_since, sync_token), **projection_params(fields, view)
+    )
 
 @app.get("/user/{username}", response_model=UserResponse, tags=["User Management"])
-async def get_user(username: str):
+async def get_user(username: str, fields: Optional[str] = None, view: Optional[str] = None):
     """Get user details by username."""
-    return client.get_user(username=username)
+    return client.get_user(username=username, **projection_params(fields, view))
 
 @app.get("/user/id/{user_id}", response_model=UserResponse, tags=["User Management"])
-async def get_user_by_id(user_id: str):
+async def get_user_by_id(user_id: str, fields: Optional[str] = None, view: Optional[str] = None):
     """Get user details by user ID."""
-    return client.get_user(user_id=user_id)
+    return client.get_user(user_id=user_id, **projection_params(fields, view))
 
 @app.post("/user/{user_id}/instruction-recording/enable", response_model=BaseResponse, tags=["User Management"])
 async def enable_instruction_recording(user_id: str):
@@ -147,30 +340,129 @@ async def delete_chat(request: ChatUpdateRequest):
     return client.delete_chat(request.chat_id)
 
 @app.get("/chat/list", response_model=DataResponse, tags=["Chat Management"])
-async def list_chats():
+async def list_chats(
+    http_request: Request, response: Response, updated_since: Optional[datetime] = None, sync_token: Optional[str] = None,
+    fields: Optional[str] = None, view: Optional[str] = None
+):
     """List all chats."""
-    return client.list_chats()
+    return conditional_get(
+        http_request, response, CHATS_VERSION, client.list_chats, **sync_params(updated_since, sync_token), **projection_params(fields, view)
+    )
 
 @app.get("/chat/id/{chat_id}", response_model=DataResponse, tags=["Chat Management"])
-async def get_chat(chat_id: str):
+async def get_chat(chat_id: str, http_request: Request, response: Response, fields: Optional[str] = None, view: Optional[str] = None):
     """Get chat details by chat ID."""
-    return client.get_chat(chat_id)
+    return conditional_get(http_request, response, CHATS_VERSION, client.get_chat, chat_id, **projection_params(fields, view))
 
 @app.get("/chat/user/{user_id}", response_model=DataResponse, tags=["Chat Management"])
-async def list_user_chats(user_id: str):
+async def list_user_chats(
+    user_id: str, http_request: Request, response: Response, updated_since: Optional[datetime] = None, sync_token: Optional[str] = None,
+    fields: Optional[str] = None, view: Optional[str] = None
+):
     """List all chats for a user by user ID."""
-    return client.list_user_chats(user_id)
+    return conditional_get(
+        http_request, response, CHATS_VERSION, client.list_user_chats, user_id, **sync_params(updated_since, sync_token),
+        **projection_params(fields, view)
+    )
+
+@app.get("/chat/id/{chat_id}/messages", response_model=DataResponse, tags=["Chat Management"])
+async def list_chat_messages(
+    chat_id: str, http_request: Request, response: Response, updated_since: Optional[datetime] = None, sync_token: Optional[str] = None,
+    fields: Optional[str] = None, view: Optional[str] = None
+):
+    """List the messages of a chat, or those changed since updated_since / sync_token."""
+    return conditional_get(
+        http_request, response, CHATS_VERSION, client.list_chat_messages, chat_id, **sync_params(updated_since, sync_token),
+        **projection_params(fields, view)
+    )
+
+def relay_events(subscriber: EventSubscriber, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, stop: threading.Event) -> None:
+    """Hand a subscriber's events to an event loop's queue until stopped; None marks the end"""
+    try:
+        for _, event in subscriber.events(stop=stop):
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+    except Exception as e:
+        logging.error(f"Chat event relay failed: {e}")
+    finally:
+        loop.call_soon_threadsafe(queue.put_nowait, None)
+        try:
+            subscriber.close()
+        except Exception:
+            pass
+
+@app.websocket("/chat/{chat_id}/updates")
+async def chat_updates(websocket: WebSocket, chat_id: str, user_id: str):
+    """Push message changes of a chat to one of its participants."""
+    chat = await run_in_threadpool(client.get_chat, chat_id, fields=['chat_id', 'users'])
+    participants = [user['user_id'] for user in (chat.get('data', {}).get('chat') or {}).get('users', [])]
+    if chat.get('status') != 'success' or user_id not in participants:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    subscriber = await run_in_threadpool(EventSubscriber, [f"{CHAT_ROUTING_PREFIX}.{chat_id}.#"])
+    events: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    threading.Thread(
+        target=relay_events, args=(subscriber, asyncio.get_running_loop(), events, stop), name='api-chat-relay', daemon=True
+    ).start()
+    # Changes committed from here on are delivered, so the client can load the chat once it sees this
+    await websocket.send_json({"type": "subscribed", "chat_id": chat_id})
+
+    async def send_events():
+        while True:
+            event = await events.get()
+            if event is None:
+                await websocket.close(code=1011)
+                return
+            await websocket.send_json(event)
+
+    async def receive_until_closed():
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+
+    tasks = {asyncio.ensure_future(send_events()), asyncio.ensure_future(receive_until_closed())}
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stop.set()
+        for task in tasks:
+            task.cancel()
 
 # LLM Provider Management Endpoints
 @app.post("/llm_provider/add", response_model=DataResponse, tags=["LLM Provider Management"])
 async def add_llm_provider(request: LLMProviderAddRequest):
-    """Add a new LLM provider with a name and API endpoint."""
-    return client.add_llm_provider(request.name, request.api_endpoint, request.api_key)
+    """Add a new LLM provider with a name and one or more API endpoints."""
+    if not request.api_endpoint and not request.endpoints:
+        raise HTTPException(status_code=422, detail="Either api_endpoint or endpoints must be provided")
+    return client.add_llm_provider(
+        request.name,
+        request.api_endpoint,
+        request.api_key,
+        endpoints=[endpoint.dict() for endpoint in request.endpoints] if request.endpoints else None,
+        kind=request.kind,
+        requests_per_minute=request.requests_per_minute,
+        tokens_per_minute=request.tokens_per_minute,
+        max_concurrency=request.max_concurrency,
+        batch_window_ms=request.batch_window_ms,
+        batch_max_size=request.batch_max_size
+    )
 
 @app.put("/llm_provider/update", response_model=DataResponse, tags=["LLM Provider Management"])
 async def update_llm_provider(request: LLMProviderUpdateRequest):
     """Update an existing LLM provider's name and API endpoint."""
-    return client.update_llm_provider(request.provider_id, request.name, request.api_endpoint)
+    return client.update_llm_provider(
+        request.provider_id,
+        request.name,
+        request.api_endpoint,
+        endpoints=[endpoint.dict() for endpoint in request.endpoints] if request.endpoints is not None else None,
+        kind=request.kind,
+        requests_per_minute=request.requests_per_minute,
+        tokens_per_minute=request.tokens_per_minute,
+        max_concurrency=request.max_concurrency,
+        batch_window_ms=request.batch_window_ms,
+        batch_max_size=request.batch_max_size
+    )
 
 @app.delete("/llm_provider/delete", response_model=BaseResponse, tags=["LLM Provider Management"])
 async def delete_llm_provider(request: LLMProviderUpdateRequest):
@@ -178,20 +470,31 @@ async def delete_llm_provider(request: LLMProviderUpdateRequest):
     return client.delete_llm_provider(request.provider_id)
 
 @app.get("/llm_provider/list", response_model=DataResponse, tags=["LLM Provider Management"])
-async def list_llm_providers():
+async def list_llm_providers(http_request: Request, response: Response, updated_since: Optional[datetime] = None, sync_token: Optional[str] = None):
     """List all LLM providers."""
-    return client.list_llm_providers()
+    return conditional_get(http_request, response, LLM_CONFIG_VERSION, client.list_llm_providers, **sync_params(updated_since, sync_token))
 
 # LLM Management Endpoints
 @app.post("/llm/add", response_model=DataResponse, tags=["LLM Management"])
 async def add_llm(request: LLMAddRequest):
     """Add a new LLM with a provider name and LLM name."""
-    return client.add_llm(request.provider_id, request.llm_name)
+    return client.add_llm(
+        request.provider_id,
+        request.llm_name,
+        fallback_llm_ids=request.fallback_llm_ids,
+        warmup=request.warmup,
+        generation_params=generation_params_dict(request.generation_params)
+    )
 
 @app.put("/llm/update", response_model=DataResponse, tags=["LLM Management"])
 async def update_llm(request: LLMUpdateRequest):
-    """Update an existing LLM's name."""
-    return client.update_llm(request.llm_id, request.llm_name)
+    """Update an existing LLM's name, fallback LLMs and generation settings."""
+    return client.update_llm(
+        request.llm_id,
+        request.llm_name,
+        fallback_llm_ids=request.fallback_llm_ids,
+        generation_params=generation_params_dict(request.generation_params)
+    )
 
 @app.delete("/llm/delete", response_model=BaseResponse, tags=["LLM Management"])
 async def delete_llm(request: LLMUpdateRequest):
@@ -199,22 +502,71 @@ async def delete_llm(request: LLMUpdateRequest):
     return client.delete_llm(request.llm_id)
 
 @app.get("/llm/list", response_model=DataResponse, tags=["LLM Management"])
-async def list_llms():
+async def list_llms(http_request: Request, response: Response, updated_since: Optional[datetime] = None, sync_token: Optional[str] = None):
     """List all LLMs."""
-    return client.list_llms()
+    return conditional_get(http_request, response, LLM_CONFIG_VERSION, client.list_llms, **sync_params(updated_since, sync_token))
 
 @app.get("/llm/llm_provider/{provider_id}", response_model=DataResponse, tags=["LLM Management"])
-async def list_llms_by_provider(provider_id: str):
+async def list_llms_by_provider(provider_id: str, http_request: Request, response: Response, updated_since: Optional[datetime] = None, sync_token: Optional[str] = None):
     """List all LLMs for a provider by provider ID."""
-    return client.list_llms_by_provider(provider_id)
+    return conditional_get(http_request, response, LLM_CONFIG_VERSION, client.list_llms_by_provider, provider_id, **sync_params(updated_since, sync_token))
 
 # LLM Response Management Endpoints
 @app.post("/llm/response_generate", response_model=DataResponse, tags=["LLM Response Management"])
-async def generate_llm_response(request: LLMResponseGenerateRequest):
-    """Generate a response from an LLM based on user input."""
-    return client.generate_llm_response(request.user_id, request.chat_id, request.provider_id, request.llm_id, request.user_input)
+async def generate_llm_response(request: LLMResponseGenerateRequest, http_request: Request):
+    """Generate a response from an LLM based on user input; cancelled if the client disconnects."""
+    return await call_until_disconnected(
+        http_request, client.generate_llm_response,
+        request.user_id, request.chat_id, request.provider_id, request.llm_id, request.user_input,
+        generation_params=generation_params_dict(request.generation_params), run_async=request.run_async
+    )
+
+@app.post("/llm/response_generate_multi", response_model=DataResponse, tags=["LLM Response Management"])
+async def generate_multi_llm_response(request: LLMResponseGenerateMultiRequest, http_request: Request):
+    """Generate responses from several LLMs concurrently for the same user input."""
+    return await call_until_disconnected(
+        http_request, client.generate_multi_llm_response,
+        request.user_id, request.chat_id, request.llm_ids, request.user_input, deadline=request.deadline,
+        generation_params=generation_params_dict(request.generation_params), run_async=request.run_async,
+        keep_partial=request.keep_partial
+    )
 
 @app.post("/llm/response_regenerate", response_model=DataResponse, tags=["LLM Response Management"])
-async def regenerate_llm_response(request: LLMResponseRegenerateRequest):
-    """Regenerate a response from an LLM based on a previous message."""
-    return client.regenerate_llm_response(request.message_id)
\ No newline at end of file
+async def regenerate_llm_response(request: LLMResponseRegenerateRequest, http_request: Request):
+    """Regenerate a response from an LLM based on a previous message, optionally as n ranked candidates."""
+    return await call_until_disconnected(
+        http_request, client.regenerate_llm_response,
+        request.message_id, n=request.n, generation_params=generation_params_dict(request.generation_params),
+        run_async=request.run_async, keep_partial=request.keep_partial
+    )
+
+@app.get("/llm/job/{job_id}", response_model=DataResponse, tags=["LLM Response Management"])
+async def get_job_status(job_id: str):
+    """Get the status, progress and result of an asynchronous generation job."""
+    return client.get_job_status(job_id)
+
+@app.get("/llm/usage", response_model=DataResponse, tags=["LLM Response Management"])
+async def get_usage_stats(user_id: Optional[str] = None, llm_id: Optional[str] = None, since: Optional[date] = None, until: Optional[date] = None):
+    """Get daily token usage and latency per user and LLM, optionally filtered by user, LLM and day range."""
+    return client.get_usage_stats(user_id, llm_id, since.isoformat() if since else None, until.isoformat() if until else None)
+
+# Scheduler Endpoints
+@app.get("/scheduler/stats", response_model=DataResponse, tags=["Scheduler"])
+async def get_scheduler_stats():
+    """Get the per-user queues and wait times of the scheduler of one orchestrator process."""
+    return client.get_scheduler_stats()
+
+# Dead Letter Endpoints
+class DeadLetterReplayRequest(BaseModel):
+    # Replay every dead letter when omitted
+    correlation_ids: Optional[List[str]] = None
+
+@app.get("/instructions/dead_letters", response_model=DataResponse, tags=["Dead Letters"])
+async def list_dead_letters(limit: int = Query(100, ge=1, le=1000)):
+    """List the instructions that failed on every retry, oldest first."""
+    return await run_in_threadpool(client.list_dead_letters, limit)
+
+@app.post("/instructions/dead_letters/replay", response_model=DataResponse, tags=["Dead Letters"])
+async def replay_dead_letters(request: DeadLetterReplayRequest):
+    """Queue dead-lettered instructions again, all of them or those with the given correlation IDs."""
+    return await run_in_threadpool(client.replay_dead_letters, request.correlation_ids)
\ No newline at end of file
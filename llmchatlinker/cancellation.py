@@ -0,0 +1,86 @@
+# llmchatlinker/cancellation.py
+
+import os
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+# Seconds a cancellation is remembered for an instruction this process has not started (yet)
+CANCEL_REMEMBER_SECONDS = float(os.getenv('CANCEL_REMEMBER_SECONDS', 300))
+
+class InstructionCancelled(Exception):
+    """Raised when the caller of an instruction has gone away."""
+
+class CancellationToken:
+    """Set once the instruction it belongs to is cancelled; callbacks run on the cancelling thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """Run callback on cancellation, or right away if already cancelled"""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+class CancellationRegistry:
+    """Cancellation tokens of the instructions running in this process, keyed by correlation ID.
+
+    Cancellations are broadcast to every orchestrator process. One for an instruction that
+    is not running here is remembered for a while, so the instruction is skipped if it is
+    still waiting in the queue.
+    """
+
+    def __init__(self, remember: float = CANCEL_REMEMBER_SECONDS):
+        self.remember = remember
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._cancelled_at: Dict[str, float] = {}
+
+    def register(self, correlation_id: Optional[str]) -> CancellationToken:
+        """Token of a starting instruction; already cancelled if its cancellation arrived first"""
+        token = CancellationToken()
+        if correlation_id is None:
+            return token
+        with self._lock:
+            self._tokens[correlation_id] = token
+            cancelled = self._cancelled_at.pop(correlation_id, None) is not None
+        if cancelled:
+            token.cancel()
+        return token
+
+    def release(self, correlation_id: Optional[str]) -> None:
+        with self._lock:
+            self._tokens.pop(correlation_id, None)
+
+    def cancel(self, correlation_id: str) -> bool:
+        """Cancel an instruction; False if it is not running in this process"""
+        now = time.monotonic()
+        with self._lock:
+            token = self._tokens.get(correlation_id)
+            if token is None:
+                self._cancelled_at = {
+                    key: cancelled_at for key, cancelled_at in self._cancelled_at.items() if now - cancelled_at < self.remember
+                }
+                self._cancelled_at[correlation_id] = now
+        if token is None:
+            return False
+        token.cancel()
+        return True
@@ -2,7 +2,12 @@
 
 import json
 import logging
-from .message_queue import publish_message
+from contextlib import contextmanager
+from contextvars import ContextVar
+from .message_queue import publish_message, publish_cancel, list_dead_letters, replay_dead_letters, EventSubscriber
+
+# Idempotency key sent with the instructions of the current context
+_idempotency_key: ContextVar = ContextVar('idempotency_key', default=None)
 
 class LLMChatLinkerClient:
     def __init__(self):
@@ -12,27 +17,60 @@ class LLMChatLinkerClient:
         self.logger = logging.getLogger(__name__)
         logging.basicConfig(level=logging.INFO)
 
-    def _process_instruction(self, instruction_type: str, data: dict) -> dict:
+    def _process_instruction(self, instruction_type: str, data: dict, correlation_id: str = None) -> dict:
         """
         Process an instruction by sending it to the message queue.
 
         Args:
             instruction_type (str): The type of instruction.
             data (dict): The data for the instruction.
+            correlation_id (str, optional): ID under which the instruction can be cancelled.
 
         Returns:
             dict: The response from the message queue.
         """
         try:
             instruction = {"type": instruction_type, "data": data}
-            response = publish_message(json.dumps(instruction))
+            if _idempotency_key.get():
+                instruction["idempotency_key"] = _idempotency_key.get()
+            response = publish_message(json.dumps(instruction), correlation_id)
             return json.loads(response.decode('utf-8'))
         except Exception as e:
             self.logger.error(f"Failed to process instruction: {e}")
             raise
 
+    @contextmanager
+    def idempotency_key(self, key: str):
+        """
+        Send the instructions made in this context with an idempotency key. An instruction repeated
+        with the same key returns the result of its first successful execution instead of running again.
+
+        Args:
+            key (str): Unique key of the request, e.g. a UUID chosen by the caller.
+        """
+        token = _idempotency_key.set(key)
+        try:
+            yield
+        finally:
+            _idempotency_key.reset(token)
+
+    @staticmethod
+    def _listing_data(**data) -> dict:
+        """
+        Build the data of a read instruction, leaving out unset options.
+
+        Args:
+            **data: The instruction's fields, such as updated_since, sync_token, fields and view.
+
+        Returns:
+            dict: The instruction data.
+        """
+        return {key: value for key, value in data.items() if value is not None}
+
     # User Management Methods
-    def create_user(self, username: str, display_name: str = None, profile: str = None) -> dict:
+    def create_user(
+        self, username: str, display_name: str = None, profile: str = None, daily_token_quota: int = None, priority_tier: str = None
+    ) -> dict:
         """
         Create a new user.
 
@@ -40,6 +78,8 @@ class LLMChatLinkerClient:
             username (str): The username of the user.
             display_name (str, optional): The display name of the user.
             profile (str, optional): The profile of the user.
+            daily_token_quota (int, optional): Prompt plus completion tokens the user may spend per day.
+            priority_tier (str, optional): Scheduling tier of the user's instructions, e.g. "low" or "high".
 
         Returns:
             dict: The response from the message queue.
@@ -47,9 +87,21 @@ class LLMChatLinkerClient:
         if display_name is None:
             display_name = username
         data = {"username": username, "display_name": display_name, "profile": profile}
+        if daily_token_quota is not None:
+            data["daily_token_quota"] = daily_token_quota
+        if priority_tier is not None:
+            data["priority_tier"] = priority_tier
         return self._process_instruction("USER_CREATE", data)
 
-    def update_user(self, user_id: str, username: str = None, display_name: str = None, profile: str = None) -> dict:
+    def update_user(
+        self,
+        user_id: str,
+        username: str = None,
+        display_name: str = None,
+        profile: str = None,
+        daily_token_quota: int = None,
+        priority_tier: str = None
+    ) -> dict:
         """
         Update an existing user.
 
@@ -58,11 +110,17 @@ class LLMChatLinkerClient:
             username (str, optional): The new username of the user.
             display_name (str, optional): The new display name of the user.
             profile (str, optional): The new profile of the user.
+            daily_token_quota (int, optional): The new daily token quota of the user; 0 removes the quota.
+            priority_tier (str, optional): The new scheduling tier of the user; "" returns the user to the default tier.
 
         Returns:
             dict: The response from the message queue.
         """
         data = {"user_id": user_id, "username": username, "display_name": display_name, "profile": profile}
+        if daily_token_quota is not None:
+            data["daily_token_quota"] = daily_token_quota
+        if priority_tier is not None:
+            data["priority_tier"] = priority_tier
         return self._process_instruction("USER_UPDATE", data)
 
     def delete_user(self, user_id: str) -> dict:
@@ -77,30 +135,40 @@ class LLMChatLinkerClient:
         """
         return self._process_instruction("USER_DELETE", {"user_id": user_id})
 
-    def list_users(self) -> dict:
+    def list_users(self, updated_since: str = None, sync_token: str = None, fields: list = None, view: str = None) -> dict:
         """
-        List all users.
+        List all users, or the users changed since an earlier listing.
+
+        Args:
+            updated_since (str, optional): Only return changes after this ISO 8601 timestamp, with deletions as tombstones.
+            sync_token (str, optional): Only return changes since the listing that returned this token.
+            fields (list, optional): Only return these fields of each user.
+            view (str, optional): "summary" for the user fields needed to render lists, or "full".
 
         Returns:
             dict: The response from the message queue.
         """
-        return self._process_instruction("USER_LIST", {})
+        return self._process_instruction(
+            "USER_LIST", self._listing_data(updated_since=updated_since, sync_token=sync_token, fields=fields, view=view)
+        )
 
-    def get_user(self, username: str = None, user_id: str = None) -> dict:
+    def get_user(self, username: str = None, user_id: str = None, fields: list = None, view: str = None) -> dict:
         """
         Get a user by username or user ID.
 
         Args:
             username (str, optional): The username of the user.
             user_id (str, optional): The ID of the user.
+            fields (list, optional): Only return these fields of the user.
+            view (str, optional): "summary" for the user fields needed to render lists, or "full".
 
         Returns:
             dict: The response from the message queue.
         """
         if username:
-            return self._process_instruction("USER_GET", {"username": username})
+            return self._process_instruction("USER_GET", self._listing_data(username=username, fields=fields, view=view))
         elif user_id:
-            return self._process_instruction("USER_GET", {"user_id": user_id})
+            return self._process_instruction("USER_GET", self._listing_data(user_id=user_id, fields=fields, view=view))
         else:
             raise ValueError("Either username or user_id must be provided")
 
@@ -193,41 +261,93 @@ class LLMChatLinkerClient:
         """
         return self._process_instruction("CHAT_DELETE", {"chat_id": chat_id})
 
-    def list_chats(self) -> dict:
+    def list_chats(self, updated_since: str = None, sync_token: str = None, fields: list = None, view: str = None) -> dict:
         """
-        List all chats.
+        List all chats, or the chats changed since an earlier listing.
+
+        Args:
+            updated_since (str, optional): Only return changes after this ISO 8601 timestamp, with deletions as tombstones.
+            sync_token (str, optional): Only return changes since the listing that returned this token.
+            fields (list, optional): Only return these fields of each chat.
+            view (str, optional): "summary" for the chat fields needed to render lists, or "full".
 
         Returns:
             dict: The response from the message queue.
         """
-        return self._process_instruction("CHAT_LIST", {})
+        return self._process_instruction(
+            "CHAT_LIST", self._listing_data(updated_since=updated_since, sync_token=sync_token, fields=fields, view=view)
+        )
 
-    def get_chat(self, chat_id: str) -> dict:
+    def get_chat(self, chat_id: str, fields: list = None, view: str = None) -> dict:
         """
         Get a chat by chat ID.
 
         Args:
             chat_id (str): The ID of the chat.
+            fields (list, optional): Only return these fields of the chat.
+            view (str, optional): "summary" for the chat fields needed to render lists, or "full".
 
         Returns:
             dict: The response from the message queue.
         """
-        return self._process_instruction("CHAT_LOAD", {"chat_id": chat_id})
+        return self._process_instruction("CHAT_LOAD", self._listing_data(chat_id=chat_id, fields=fields, view=view))
 
-    def list_user_chats(self, user_id: str) -> dict:
+    def list_user_chats(
+        self, user_id: str, updated_since: str = None, sync_token: str = None, fields: list = None, view: str = None
+    ) -> dict:
         """
-        List all chats for a user.
+        List all chats for a user, or those changed since an earlier listing.
 
         Args:
             user_id (str): The ID of the user.
+            updated_since (str, optional): Only return changes after this ISO 8601 timestamp, with deletions as tombstones.
+            sync_token (str, optional): Only return changes since the listing that returned this token.
+            fields (list, optional): Only return these fields of each chat.
+            view (str, optional): "summary" for the chat fields needed to render lists, or "full".
 
         Returns:
             dict: The response from the message queue.
         """
-        return self._process_instruction("CHAT_LIST_BY_USER", {"user_id": user_id})
+        return self._process_instruction(
+            "CHAT_LIST_BY_USER",
+            self._listing_data(user_id=user_id, updated_since=updated_since, sync_token=sync_token, fields=fields, view=view)
+        )
+
+    def list_chat_messages(
+        self, chat_id: str, updated_since: str = None, sync_token: str = None, fields: list = None, view: str = None
+    ) -> dict:
+        """
+        List the messages of a chat, or those changed since an earlier listing.
+
+        Args:
+            chat_id (str): The ID of the chat.
+            updated_since (str, optional): Only return changes after this ISO 8601 timestamp, with deletions as tombstones.
+            sync_token (str, optional): Only return changes since the listing that returned this token.
+            fields (list, optional): Only return these fields of each message.
+            view (str, optional): "summary" for the message fields needed to render lists, or "full".
+
+        Returns:
+            dict: The response from the message queue.
+        """
+        return self._process_instruction(
+            "CHAT_MESSAGE_LIST",
+            self._listing_data(chat_id=chat_id, updated_since=updated_since, sync_token=sync_token, fields=fields, view=view)
+        )
 
     # LLM Provider Management Methods
-    def add_llm_provider(self, name: str, api_endpoint: str, api_key: str = None) -> dict:
+    def add_llm_provider(
+        self,
+        name: str,
+        api_endpoint: str,
+        api_key: str = None,
+        requests_per_minute: int = None,
+        tokens_per_minute: int = None,
+        max_concurrency: int = None,
+        endpoints: list = None,
+        kind: str = None,
+        batch_window_ms: int = None,
+        batch_max_size: int = None
+    ) -> dict:
         """
         Add a new LLM provider.
 
@@ -235,14 +355,46 @@ class LLMChatLinkerClient:
             name (str): The name of the LLM provider.
             api_endpoint (str): The API endpoint of the LLM provider.
             api_key (str, optional): The API key of the LLM provider.
+            requests_per_minute (int, optional): Maximum requests per minute sent to the provider.
+            tokens_per_minute (int, optional): Maximum (estimated) prompt tokens per minute sent to the provider.
+            max_concurrency (int, optional): Maximum number of concurrent requests to the provider.
+            endpoints (list, optional): Replica endpoints as {"url": ..., "weight": ...} dicts;
+                requests are balanced across them.
+            kind (str, optional): The provider API shape: "openai" (default, also used for the MLModelScope API agent) or "ollama".
+            batch_window_ms (int, optional): Milliseconds to collect concurrent requests to one model into a batch request.
+            batch_max_size (int, optional): Most requests in one batch.
 
         Returns:
             dict: The response from the message queue.
         """
-        data = {"name": name, "api_endpoint": api_endpoint, "api_key": api_key}
+        data = {
+            "name": name,
+            "api_endpoint": api_endpoint,
+            "api_key": api_key,
+            "requests_per_minute": requests_per_minute,
+            "tokens_per_minute": tokens_per_minute,
+            "max_concurrency": max_concurrency,
+            "endpoints": endpoints,
+            "kind": kind,
+            "batch_window_ms": batch_window_ms,
+            "batch_max_size": batch_max_size
+        }
         return self._process_instruction("LLM_PROVIDER_ADD", data)
 
-    def update_llm_provider(self, provider_id: str, name: str = None, api_endpoint: str = None, api_key: str = None) -> dict:
+    def update_llm_provider(
+        self,
+        provider_id: str,
+        name: str = None,
+        api_endpoint: str = None,
+        api_key: str = None,
+        requests_per_minute: int = None,
+        tokens_per_minute: int = None,
+        max_concurrency: int = None,
+        endpoints: list = None,
+        kind: str = None,
+        batch_window_ms: int = None,
+        batch_max_size: int = None
+    ) -> dict:
         """
         Update an existing LLM provider.
 
@@ -250,11 +402,30 @@ class LLMChatLinkerClient:
             provider_id (str): The ID of the LLM provider.
             name (str, optional): The new name of the LLM provider.
             api_endpoint (str, optional): The new API endpoint of the LLM provider.
+            requests_per_minute (int, optional): The new requests-per-minute limit (0 removes it).
+            tokens_per_minute (int, optional): The new tokens-per-minute limit (0 removes it).
+            max_concurrency (int, optional): The new concurrency limit (0 removes it).
+            endpoints (list, optional): The new replica endpoints as {"url": ..., "weight": ...} dicts.
+            kind (str, optional): The new provider API shape.
+            batch_window_ms (int, optional): The new micro-batching window (0 turns batching off).
+            batch_max_size (int, optional): The new maximum batch size (0 restores the default).
 
         Returns:
             dict: The response from the message queue.
         """
-        data = {"provider_id": provider_id, "name": name, "api_endpoint": api_endpoint, "api_key": api_key}
+        data = {
+            "provider_id": provider_id,
+            "name": name,
+            "api_endpoint": api_endpoint,
+            "api_key": api_key,
+            "requests_per_minute": requests_per_minute,
+            "tokens_per_minute": tokens_per_minute,
+            "max_concurrency": max_concurrency,
+            "endpoints": endpoints,
+            "kind": kind,
+            "batch_window_ms": batch_window_ms,
+            "batch_max_size": batch_max_size
+        }
         return self._process_instruction("LLM_PROVIDER_UPDATE", data)
 
     def delete_llm_provider(self, provider_id: str) -> dict:
@@ -269,42 +440,68 @@ class LLMChatLinkerClient:
         """
         return self._process_instruction("LLM_PROVIDER_DELETE", {"provider_id": provider_id})
 
-    def list_llm_providers(self) -> dict:
+    def list_llm_providers(self, updated_since: str = None, sync_token: str = None) -> dict:
         """
-        List all LLM providers.
+        List all LLM providers, or the providers changed since an earlier listing.
+
+        Args:
+            updated_since (str, optional): Only return changes after this ISO 8601 timestamp, with deletions as tombstones.
+            sync_token (str, optional): Only return changes since the listing that returned this token.
 
         Returns:
             dict: The response from the message queue.
         """
-        return self._process_instruction("LLM_PROVIDER_LIST", {})
+        return self._process_instruction("LLM_PROVIDER_LIST", self._listing_data(updated_since=updated_since, sync_token=sync_token))
 
     # LLM Management Methods
-    def add_llm(self, provider_id: str, llm_name: str) -> dict:
+    def add_llm(
+        self,
+        provider_id: str,
+        llm_name: str,
+        fallback_llm_ids: list = None,
+        warmup: bool = None,
+        generation_params: dict = None
+    ) -> dict:
         """
         Add a new LLM.
 
         Args:
             provider_id (str): The ID of the LLM provider.
             llm_name (str): The name of the LLM.
+            fallback_llm_ids (list, optional): Ordered IDs of equivalent LLMs to fail over to.
+            warmup (bool, optional): Send a tiny background request so the model is loaded before its first use;
+                defaults to the orchestrator's LLM_WARMUP_ON_ADD setting.
+            generation_params (dict, optional): Default max_tokens, temperature, stop, connect_timeout and read_timeout.
 
         Returns:
             dict: The response from the message queue.
         """
-        data = {"provider_id": provider_id, "llm_name": llm_name}
+        data = {
+            "provider_id": provider_id,
+            "llm_name": llm_name,
+            "fallback_llm_ids": fallback_llm_ids,
+            "generation_params": generation_params
+        }
+        if warmup is not None:
+            data["warmup"] = warmup
         return self._process_instruction("LLM_ADD", data)
 
-    def update_llm(self, llm_id: str, llm_name: str) -> dict:
+    def update_llm(self, llm_id: str, llm_name: str = None, fallback_llm_ids: list = None, generation_params: dict = None) -> dict:
         """
         Update an existing LLM.
 
         Args:
             llm_id (str): The ID of the LLM.
-            llm_name (str): The new name of the LLM.
+            llm_name (str, optional): The new name of the LLM.
+            fallback_llm_ids (list, optional): The new ordered IDs of equivalent LLMs to fail over to.
+            generation_params (dict, optional): Settings replacing the stored ones; {} clears them.
 
         Returns:
             dict: The response from the message queue.
         """
-        data = {"llm_id": llm_id, "llm_name": llm_name}
+        data = {"llm_id": llm_id, "llm_name": llm_name, "fallback_llm_ids": fallback_llm_ids}
+        if generation_params is not None:
+            data["generation_params"] = generation_params
         return self._process_instruction("LLM_UPDATE", data)
 
     def delete_llm(self, llm_id: str) -> dict:
@@ -319,29 +516,47 @@ class LLMChatLinkerClient:
         """
         return self._process_instruction("LLM_DELETE", {"llm_id": llm_id})
 
-    def list_llms(self) -> dict:
+    def list_llms(self, updated_since: str = None, sync_token: str = None) -> dict:
         """
-        List all LLMs.
+        List all LLMs, or the LLMs changed since an earlier listing.
+
+        Args:
+            updated_since (str, optional): Only return changes after this ISO 8601 timestamp, with deletions as tombstones.
+            sync_token (str, optional): Only return changes since the listing that returned this token.
 
         Returns:
             dict: The response from the message queue.
         """
-        return self._process_instruction("LLM_LIST", {})
+        return self._process_instruction("LLM_LIST", self._listing_data(updated_since=updated_since, sync_token=sync_token))
 
-    def list_llms_by_provider(self, provider_id: str) -> dict:
+    def list_llms_by_provider(self, provider_id: str, updated_since: str = None, sync_token: str = None) -> dict:
         """
-        List all LLMs for a provider.
+        List all LLMs for a provider, or those changed since an earlier listing.
 
         Args:
             provider_id (str): The ID of the LLM provider.
+            updated_since (str, optional): Only return changes after this ISO 8601 timestamp, with deletions as tombstones.
+            sync_token (str, optional): Only return changes since the listing that returned this token.
 
         Returns:
             dict: The response from the message queue.
         """
-        return self._process_instruction("LLM_LIST_BY_PROVIDER", {"provider_id": provider_id})
+        return self._process_instruction(
+            "LLM_LIST_BY_PROVIDER", self._listing_data(updated_since=updated_since, sync_token=sync_token, provider_id=provider_id)
+        )
 
     # LLM Response Management Methods
-    def generate_llm_response(self, user_id: str, chat_id: str, provider_id: str, llm_id: str, user_input: str) -> dict:
+    def generate_llm_response(
+        self,
+        user_id: str,
+        chat_id: str,
+        provider_id: str,
+        llm_id: str,
+        user_input: str,
+        generation_params: dict = None,
+        run_async: bool = False,
+        correlation_id: str = None
+    ) -> dict:
         """
         Generate a response from an LLM based on user input.
 
@@ -351,21 +566,195 @@ class LLMChatLinkerClient:
             provider_id (str): The ID of the LLM provider.
             llm_id (str): The ID of the LLM.
             user_input (str): The user input.
+            generation_params (dict, optional): Settings overriding the LLM's own for this request.
+            run_async (bool, optional): Return a job immediately instead of waiting for the response.
+            correlation_id (str, optional): ID to pass to cancel_instruction to stop the generation.
 
         Returns:
             dict: The response from the message queue.
         """
         data = {"user_id": user_id, "chat_id": chat_id, "provider_id": provider_id, "llm_id": llm_id, "user_input": user_input}
-        return self._process_instruction("LLM_RESPONSE_GENERATE", data)
+        if generation_params:
+            data["generation_params"] = generation_params
+        if run_async:
+            data["async"] = True
+        return self._process_instruction("LLM_RESPONSE_GENERATE", data, correlation_id)
+
+    def generate_multi_llm_response(
+        self,
+        user_id: str,
+        chat_id: str,
+        llm_ids: list,
+        user_input: str,
+        deadline: float = None,
+        generation_params: dict = None,
+        run_async: bool = False,
+        keep_partial: bool = False,
+        correlation_id: str = None
+    ) -> dict:
+        """
+        Generate responses from several LLMs concurrently for the same user input.
+
+        Args:
+            user_id (str): The ID of the user.
+            chat_id (str): The ID of the chat.
+            llm_ids (list): The IDs of the LLMs to ask.
+            user_input (str): The user input.
+            deadline (float, optional): Seconds to wait for all LLMs; slower ones are reported as failures.
+            generation_params (dict, optional): Settings overriding each LLM's own for this request.
+            run_async (bool, optional): Return a job immediately instead of waiting for the responses.
+            keep_partial (bool, optional): If cancelled, still store the answers that arrived before.
+            correlation_id (str, optional): ID to pass to cancel_instruction to stop the generation.
 
-    def regenerate_llm_response(self, message_id: str) -> dict:
+        Returns:
+            dict: The response from the message queue.
+        """
+        data = {"user_id": user_id, "chat_id": chat_id, "llm_ids": llm_ids, "user_input": user_input, "deadline": deadline}
+        if generation_params:
+            data["generation_params"] = generation_params
+        if run_async:
+            data["async"] = True
+        if keep_partial:
+            data["keep_partial"] = True
+        return self._process_instruction("LLM_RESPONSE_GENERATE_MULTI", data, correlation_id)
+
+    def regenerate_llm_response(
+        self,
+        message_id: str,
+        n: int = 1,
+        generation_params: dict = None,
+        run_async: bool = False,
+        keep_partial: bool = False,
+        correlation_id: str = None
+    ) -> dict:
         """
         Regenerate a response from an LLM based on a previous message.
 
         Args:
             message_id (str): The ID of the original message.
+            n (int, optional): Number of alternative responses to generate concurrently and store as ranked siblings.
+            generation_params (dict, optional): Settings overriding the LLM's own for this request.
+            run_async (bool, optional): Return a job immediately instead of waiting for the response.
+            keep_partial (bool, optional): If cancelled, still store the candidates that arrived before.
+            correlation_id (str, optional): ID to pass to cancel_instruction to stop the regeneration.
+
+        Returns:
+            dict: The response from the message queue.
+        """
+        data = {"message_id": message_id}
+        if n != 1:
+            data["n"] = n
+        if generation_params:
+            data["generation_params"] = generation_params
+        if run_async:
+            data["async"] = True
+        if keep_partial:
+            data["keep_partial"] = True
+        return self._process_instruction("LLM_RESPONSE_REGENERATE", data, correlation_id)
+
+    def cancel_instruction(self, correlation_id: str) -> None:
+        """
+        Cancel an instruction sent with the given correlation ID, e.g. from another thread
+        once its caller has gone away. The waiting call returns a response with data.cancelled.
+
+        Args:
+            correlation_id (str): The correlation ID the instruction was sent with.
+        """
+        publish_cancel(correlation_id)
+
+    # Job Methods
+    def get_job_status(self, job_id: str) -> dict:
+        """
+        Get the status, progress and result of an asynchronous job.
+
+        Args:
+            job_id (str): The ID of the job.
 
         Returns:
             dict: The response from the message queue.
         """
-        return self._process_instruction("LLM_RESPONSE_REGENERATE", {"message_id": message_id})
\ No newline at end of file
+        return self._process_instruction("LLM_JOB_STATUS", {"job_id": job_id})
+
+    # Usage Methods
+    def get_usage_stats(self, user_id: str = None, llm_id: str = None, since: str = None, until: str = None) -> dict:
+        """
+        Get daily token usage and latency per user and LLM.
+
+        Args:
+            user_id (str, optional): Only include this user's usage.
+            llm_id (str, optional): Only include this LLM's usage.
+            since (str, optional): First day to include, as YYYY-MM-DD.
+            until (str, optional): Last day to include, as YYYY-MM-DD.
+
+        Returns:
+            dict: The response from the message queue.
+        """
+        data = {"user_id": user_id, "llm_id": llm_id, "since": since, "until": until}
+        return self._process_instruction("LLM_USAGE_STATS", {key: value for key, value in data.items() if value is not None})
+
+    def wait_for_job(self, job_id: str, timeout: float = None) -> dict:
+        """
+        Wait for an asynchronous job to finish, using pushed job events instead of polling.
+
+        Args:
+            job_id (str): The ID of the job.
+            timeout (float, optional): Seconds to wait before returning the job's current status.
+
+        Returns:
+            dict: The job status response once the job succeeded or failed, or when the timeout expires.
+        """
+        subscriber = EventSubscriber([f"job.{job_id}.succeeded", f"job.{job_id}.failed"])
+        try:
+            # Subscribe before checking, so a completion between the two is not missed
+            response = self.get_job_status(job_id)
+            job = response.get('data', {}).get('job')
+            if not job or job['status'] in ('succeeded', 'failed'):
+                return response
+            for _, event in subscriber.events(timeout=timeout):
+                return {"status": "success", "message": "Job finished", "data": {"job": event['job']}}
+            return self.get_job_status(job_id)
+        finally:
+            subscriber.close()
+
+    # Scheduler Methods
+    def get_scheduler_stats(self) -> dict:
+        """
+        Get the per-user queues and wait times of the scheduler of the orchestrator process that answers.
+
+        Returns:
+            dict: The response from the message queue.
+        """
+        return self._process_instruction("SCHEDULER_STATS", {})
+
+    # Dead Letter Methods
+    def list_dead_letters(self, limit: int = 100) -> dict:
+        """
+        List the instructions that failed on every retry, oldest first, with their last error.
+
+        Args:
+            limit (int): The maximum number of dead letters to return.
+
+        Returns:
+            dict: The dead letters, read from the message queue without removing them.
+        """
+        try:
+            dead_letters = list_dead_letters(limit=limit)
+        except Exception as e:
+            return {"status": "error", "message": f"Failed to list dead letters: {e}", "data": None}
+        return {"status": "success", "message": "Dead letters retrieved successfully", "data": {"dead_letters": dead_letters}}
+
+    def replay_dead_letters(self, correlation_ids: list = None) -> dict:
+        """
+        Queue dead-lettered instructions again with their retries reset. Their results are not returned.
+
+        Args:
+            correlation_ids (list, optional): The instructions to replay; all of them if omitted.
+
+        Returns:
+            dict: The number of instructions replayed.
+        """
+        try:
+            replayed = replay_dead_letters(correlation_ids)
+        except Exception as e:
+            return {"status": "error", "message": f"Failed to replay dead letters: {e}", "data": None}
+        return {"status": "success", "message": f"Replayed {replayed} dead letters", "data": {"replayed": replayed}}
\ No newline at end of file
@@ -1,33 +1,130 @@
 # llmchatlinker/main.py
 
 import os
+import sys
+import json
+import signal
+import socket
+import argparse
+import logging
 import threading
 import uvicorn
-from fastapi.middleware.cors import CORSMiddleware
-from .orchestrator import Orchestrator
-from .api import app
-
-# Configure CORS settings for the FastAPI application
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],       # Allow all origins
-    allow_credentials=True,    # Allow credentials
-    allow_methods=["*"],       # Allow all HTTP methods
-    allow_headers=["*"],       # Allow all HTTP headers
-)
+from .orchestrator import Orchestrator, ORCHESTRATOR_WORKERS
+from .supervisor import Supervisor
+from .message_queue import list_dead_letters, replay_dead_letters
+from .units.database_manage_unit import DatabaseManageUnit, DatabaseConfig
+
+# Address the API listens on
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", 8000))
+# Processes of each role started by `llmchatlinker supervisor`
+SUPERVISOR_API_PROCESSES = int(os.getenv("SUPERVISOR_API_PROCESSES", 2))
+SUPERVISOR_ORCHESTRATOR_PROCESSES = int(os.getenv("SUPERVISOR_ORCHESTRATOR_PROCESSES", 2))
+
+APP = "llmchatlinker.api:app"
 
 def start_orchestrator():
     """Initialize and start the orchestrator."""
     orchestrator = Orchestrator()
     orchestrator.start()
 
-if __name__ == "__main__":
-    # Start the orchestrator in a separate daemon thread
-    orchestrator_thread = threading.Thread(target=start_orchestrator, daemon=True)
-    orchestrator_thread.start()
-
+def serve(host: str = API_HOST, port: int = API_PORT, workers: int = 1, fd: int = None, with_orchestrator: bool = False):
+    """Run the API with uvicorn, optionally with an orchestrator in a daemon thread of the same process."""
+    if with_orchestrator:
+        threading.Thread(target=start_orchestrator, daemon=True).start()
     print("Starting FastAPI server")
-    
-    # Run the FastAPI app with Uvicorn
-    port = int(os.getenv("API_PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    if fd is not None:
+        uvicorn.run(APP, fd=fd)
+    else:
+        uvicorn.run(APP, host=host, port=port, workers=workers)
+
+def worker(threads: int = ORCHESTRATOR_WORKERS):
+    """Run an orchestrator; SIGTERM stops it like Ctrl-C, after its in-flight instructions finish."""
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    orchestrator = Orchestrator(workers=threads)
+    orchestrator.start()
+
+def supervise(api_processes: int, orchestrator_processes: int, host: str = API_HOST, port: int = API_PORT):
+    """Run API and orchestrator processes under a supervisor.
+
+    The database is reset here at most once, never by the orchestrator processes, which are restarted
+    whenever they exit. The API processes accept connections from one socket bound by the supervisor.
+    """
+    if DatabaseConfig.RESET_ON_START:
+        DatabaseManageUnit().reset_db()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(2048)
+    listener.set_inheritable(True)
+    command = [sys.executable, "-m", "llmchatlinker.main"]
+    supervisor = Supervisor(
+        {
+            "api": (command + ["serve", "--fd", str(listener.fileno())], api_processes),
+            "orchestrator": (command + ["worker"], orchestrator_processes)
+        },
+        env=dict(os.environ, DB_RESET_ON_START="false"),
+        pass_fds=[listener.fileno()]
+    )
+    print(f"Supervising {api_processes} API and {orchestrator_processes} orchestrator processes on {host}:{port}")
+    try:
+        supervisor.run()
+    finally:
+        listener.close()
+
+def dead_letters(action: str, limit: int = 100, correlation_ids: list = None):
+    """Print the dead-lettered instructions as JSON, or replay them."""
+    if action == "list":
+        print(json.dumps(list_dead_letters(limit=limit), indent=2, default=str))
+    else:
+        print(f"Replayed {replay_dead_letters(correlation_ids)} dead letters")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="llmchatlinker", description="Run the LLMChatLinker API and orchestrators")
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="Run the HTTP API")
+    serve_parser.add_argument("--host", default=API_HOST)
+    serve_parser.add_argument("--port", type=int, default=API_PORT)
+    serve_parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    serve_parser.add_argument("--with-orchestrator", action="store_true", help="Also run an orchestrator in this process")
+    # Listening socket inherited from the supervisor
+    serve_parser.add_argument("--fd", type=int, help=argparse.SUPPRESS)
+
+    worker_parser = subparsers.add_parser("worker", help="Run an orchestrator that executes queued instructions")
+    worker_parser.add_argument("--threads", type=int, default=ORCHESTRATOR_WORKERS, help="Instructions processed concurrently")
+
+    supervisor_parser = subparsers.add_parser("supervisor", help="Run and monitor API and orchestrator processes")
+    supervisor_parser.add_argument("--host", default=API_HOST)
+    supervisor_parser.add_argument("--port", type=int, default=API_PORT)
+    supervisor_parser.add_argument("--api-processes", type=int, default=SUPERVISOR_API_PROCESSES)
+    supervisor_parser.add_argument("--orchestrator-processes", type=int, default=SUPERVISOR_ORCHESTRATOR_PROCESSES)
+
+    dead_letters_parser = subparsers.add_parser("dead-letters", help="Inspect or replay instructions that failed on every retry")
+    dead_letters_actions = dead_letters_parser.add_subparsers(dest="action", required=True)
+    list_parser = dead_letters_actions.add_parser("list", help="Print the dead letters, oldest first, without removing them")
+    list_parser.add_argument("--limit", type=int, default=100)
+    replay_parser = dead_letters_actions.add_parser("replay", help="Queue dead letters again with their retries reset")
+    replay_parser.add_argument("correlation_ids", nargs="*", metavar="CORRELATION_ID")
+    replay_parser.add_argument("--all", action="store_true", help="Replay every dead letter")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "serve":
+        if args.with_orchestrator and args.workers > 1:
+            parser.error("--with-orchestrator runs in a single API process; use the supervisor for more")
+        serve(args.host, args.port, args.workers, args.fd, args.with_orchestrator)
+    elif args.command == "worker":
+        worker(args.threads)
+    elif args.command == "supervisor":
+        supervise(args.api_processes, args.orchestrator_processes, args.host, args.port)
+    elif args.command == "dead-letters":
+        if args.action == "replay" and args.all == bool(args.correlation_ids):
+            parser.error("dead-letters replay takes either correlation IDs or --all")
+        dead_letters(args.action, getattr(args, "limit", 100), args.correlation_ids if args.action == "replay" and not args.all else None)
+    else:
+        # Without a command, the API and an orchestrator share one process as before
+        serve(with_orchestrator=True)
+
+if __name__ == "__main__":
+    main()
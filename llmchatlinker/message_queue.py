@@ -1,9 +1,13 @@
 import os
 import pika
 import uuid
+import json
 import logging
 import time
-from pika.exceptions import StreamLostError
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pika.exceptions import AMQPError, StreamLostError
 
 logging.basicConfig(level=logging.INFO)
 
@@ -14,10 +18,39 @@ RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT', 5673))
 RABBITMQ_USER = os.getenv('RABBITMQ_USER', 'myuser')
 RABBITMQ_PASS = os.getenv('RABBITMQ_PASSWORD', 'mypassword')
 INSTRUCTION_QUEUE = 'instruction_queue'
+# Pseudo-queue RabbitMQ delivers replies through straight to the consuming channel, without storing them
+DIRECT_REPLY_TO = 'amq.rabbitmq.reply-to'
+EVENTS_EXCHANGE = 'llmchatlinker.events'
+# Event asking every orchestrator to stop the instruction with the event's correlation_id
+CANCEL_ROUTING_KEY = 'instruction.cancel'
+# Events about one chat, e.g. chat.<chat_id>.message.created
+CHAT_ROUTING_PREFIX = 'chat'
 MAX_RETRIES = 5
 RETRY_DELAY = 5
+# Times a failing instruction is redelivered before it is dead-lettered
+INSTRUCTION_MAX_RETRIES = int(os.getenv('INSTRUCTION_MAX_RETRIES', 3))
+# Seconds a failed instruction waits in the retry queue before it is delivered again
+INSTRUCTION_RETRY_DELAY = float(os.getenv('INSTRUCTION_RETRY_DELAY', 5))
+# Exchange routing instructions that used up their retries to <queue>.dead
+DEAD_LETTER_EXCHANGE = 'llmchatlinker.dead-letters'
+RETRY_COUNT_HEADER = 'x-retry-count'
+# Dead letters replayed per transaction
+REPLAY_BATCH_SIZE = int(os.getenv('REPLAY_BATCH_SIZE', 100))
+
+def connection_parameters():
+    """Connection parameters shared by every RabbitMQ connection."""
+    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
+    return pika.ConnectionParameters(
+        host=RABBITMQ_HOST,
+        port=RABBITMQ_PORT,
+        credentials=credentials,
+        heartbeat=600,
+        blocked_connection_timeout=300
+    )
 
 class MessageQueueClient:
+    """Sends instructions and waits for their replies; one call at a time, so keep one per thread"""
+
     def __init__(self, queue_name=INSTRUCTION_QUEUE):
         self.queue_name = queue_name
         self.connection = None
@@ -33,17 +66,11 @@ class MessageQueueClient:
 
     def _connect(self):
         """Connect to RabbitMQ"""
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-        self.connection = pika.BlockingConnection(pika.ConnectionParameters(
-            host=RABBITMQ_HOST,
-            port=RABBITMQ_PORT,
-            credentials=credentials,
-            heartbeat=600,
-            blocked_connection_timeout=300
-        ))
+        self.connection = pika.BlockingConnection(connection_parameters())
         self.channel = self.connection.channel()
         self.channel.queue_declare(queue=self.queue_name, durable=True)
-        self.callback_queue = self.channel.queue_declare(queue='', exclusive=True).method.queue
+        # Replies come back over direct reply-to, so there is no callback queue to declare
+        self.callback_queue = DIRECT_REPLY_TO
 
         self.channel.basic_consume(
             queue=self.callback_queue,
@@ -56,25 +83,31 @@ class MessageQueueClient:
         if self.corr_id == props.correlation_id:
             self.response = body
 
-    def call(self, instruction):
-        """Send an instruction and wait for a response."""
-        self._retry_with_backoff(self._publish_instruction, instruction)
+    def call(self, instruction, correlation_id=None):
+        """Send an instruction and wait for a response; correlation_id lets the caller cancel it."""
+        self._retry_with_backoff(self._publish_instruction, instruction, correlation_id)
         return self.response
 
-    def _publish_instruction(self, instruction):
+    def _publish_instruction(self, instruction, correlation_id=None):
         """Publish an instruction to the queue."""
+        if self.connection is not None and self.connection.is_open:
+            try:
+                # Answers heartbeats missed while idle and notices a connection the broker has dropped
+                self.connection.process_data_events(time_limit=0)
+            except AMQPError:
+                self.connection = None
         if self.connection is None or self.connection.is_closed:
             self._initialize_connection()
 
         self.response = None
-        self.corr_id = str(uuid.uuid4())
+        self.corr_id = correlation_id or str(uuid.uuid4())
         self.channel.basic_publish(
             exchange='',
             routing_key=self.queue_name,
             properties=pika.BasicProperties(
                 reply_to=self.callback_queue,
                 correlation_id=self.corr_id,
-                delivery_mode=2  # Make message persistent
+                delivery_mode=2  # Instructions wait in a durable queue, so keep them across broker restarts
             ),
             body=instruction
         )
@@ -88,11 +121,10 @@ class MessageQueueClient:
 
     @staticmethod
     def _retry_with_backoff(func, *args):
-        """Retries a function with exponential backoff."""
+        """Retries a function with exponential backoff; returns its result."""
         for attempt in range(MAX_RETRIES):
             try:
-                func(*args)
-                return
+                return func(*args)
             except Exception as e:
                 logging.error(f"Error (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
                 if attempt < MAX_RETRIES - 1:
@@ -100,39 +132,280 @@ class MessageQueueClient:
                 else:
                     raise
 
-def publish_message(message):
-    client = MessageQueueClient()
-    return client.call(message)
+_clients = threading.local()
+
+def publish_message(message, correlation_id=None):
+    """Send an instruction and wait for its reply over the calling thread's connection, opened on first use."""
+    client = getattr(_clients, 'client', None)
+    if client is None:
+        client = _clients.client = MessageQueueClient()
+    return client.call(message, correlation_id)
+
+def publish_cancel(correlation_id):
+    """Ask the orchestrators to stop the instruction sent with correlation_id."""
+    publisher = EventPublisher()
+    try:
+        publisher.publish(CANCEL_ROUTING_KEY, {"correlation_id": correlation_id})
+    finally:
+        publisher.close()
 
 def publish_response(channel, message, correlation_id, reply_to):
+    """Send a reply; it is transient, since it is only of use to a caller that is still connected."""
     try:
         channel.basic_publish(
             exchange='',
             routing_key=reply_to,
-            properties=pika.BasicProperties(
-                correlation_id=correlation_id,
-                delivery_mode=2
-            ),
+            properties=pika.BasicProperties(correlation_id=correlation_id),
             body=message
         )
     except Exception as e:
         logging.error(f"Error publishing response: {e}")
         raise
 
-def init_message_queue(queue_name):
-    client = MessageQueueClient(queue_name)
-    return client.channel, queue_name
+class EventPublisher:
+    """Publishes JSON events to the topic exchange; safe to share between threads.
 
-def consume_messages(channel, queue_name, callback):
-    def callback_wrapper(ch, method, properties, body):
+    Events are fire-and-forget notifications: a failed publish is logged and
+    dropped rather than failing the operation that produced the event.
+    """
+
+    def __init__(self, exchange=EVENTS_EXCHANGE):
+        self.exchange = exchange
+        self.connection = None
+        self.channel = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self.connection = pika.BlockingConnection(connection_parameters())
+        self.channel = self.connection.channel()
+        self.channel.exchange_declare(exchange=self.exchange, exchange_type='topic', durable=True)
+
+    def publish(self, routing_key, event):
+        body = json.dumps(event)
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self.connection is None or self.connection.is_closed:
+                        self._connect()
+                    self.channel.basic_publish(
+                        exchange=self.exchange,
+                        routing_key=routing_key,
+                        properties=pika.BasicProperties(content_type='application/json'),
+                        body=body
+                    )
+                    return
+                except Exception as e:
+                    # An idle connection may have been dropped by the broker; reconnect once
+                    self.connection = None
+                    if attempt:
+                        logging.error(f"Error publishing event {routing_key}: {e}")
+
+    def close(self):
+        with self._lock:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+            self.connection = None
+
+class EventSubscriber:
+    """Receives events from the topic exchange matching the given binding keys."""
+
+    def __init__(self, binding_keys, exchange=EVENTS_EXCHANGE):
+        self.connection = pika.BlockingConnection(connection_parameters())
+        self.channel = self.connection.channel()
+        self.channel.exchange_declare(exchange=exchange, exchange_type='topic', durable=True)
+        self.queue = self.channel.queue_declare(queue='', exclusive=True, auto_delete=True).method.queue
+        for binding_key in binding_keys:
+            self.channel.queue_bind(exchange=exchange, queue=self.queue, routing_key=binding_key)
+
+    def events(self, timeout=None, poll_interval=1, stop=None):
+        """Yield (routing_key, event) pairs until timeout seconds pass (forever if None) or the stop event is set"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for method, properties, body in self.channel.consume(self.queue, auto_ack=True, inactivity_timeout=poll_interval):
+            if method is not None:
+                yield method.routing_key, json.loads(body)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if stop is not None and stop.is_set():
+                break
+        self.channel.cancel()
+
+    def close(self):
+        if self.connection.is_open:
+            self.connection.close()
+
+def retry_queue_name(queue_name):
+    return f'{queue_name}.retry'
+
+def dead_letter_queue_name(queue_name):
+    return f'{queue_name}.dead'
+
+def declare_retry_queues(channel, queue_name):
+    """Declare the delay queue that returns failed messages to queue_name once they expire, and its dead-letter queue."""
+    channel.queue_declare(queue=retry_queue_name(queue_name), durable=True, arguments={
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': queue_name
+    })
+    channel.exchange_declare(exchange=DEAD_LETTER_EXCHANGE, exchange_type='direct', durable=True)
+    channel.queue_declare(queue=dead_letter_queue_name(queue_name), durable=True)
+    channel.queue_bind(exchange=DEAD_LETTER_EXCHANGE, queue=dead_letter_queue_name(queue_name), routing_key=queue_name)
+
+def _dead_letter_to_dict(properties, body):
+    headers = properties.headers or {}
+    try:
+        instruction = json.loads(body)
+    except ValueError:
+        instruction = body.decode('utf-8', errors='replace')
+    return {
+        "correlation_id": properties.correlation_id,
+        "instruction": instruction,
+        "retries": headers.get(RETRY_COUNT_HEADER, 0),
+        "error": headers.get('x-last-error'),
+        "dead_lettered_at": headers.get('x-dead-lettered-at')
+    }
+
+def list_dead_letters(queue_name=INSTRUCTION_QUEUE, limit=100):
+    """Dead-lettered messages of queue_name, oldest first; they stay in the dead-letter queue."""
+    connection = pika.BlockingConnection(connection_parameters())
+    try:
+        channel = connection.channel()
+        declare_retry_queues(channel, queue_name)
+        letters = []
+        while len(letters) < limit:
+            method, properties, body = channel.basic_get(dead_letter_queue_name(queue_name), auto_ack=False)
+            if method is None:
+                break
+            letters.append(_dead_letter_to_dict(properties, body))
+        return letters
+    finally:
+        # Closing returns the unacknowledged messages to the queue in their order
+        connection.close()
+
+def replay_dead_letters(correlation_ids=None, queue_name=INSTRUCTION_QUEUE):
+    """Send dead-lettered messages (all, or those with the given correlation IDs) back to queue_name; returns how many.
+
+    Replayed instructions start over with no retries used. Nobody waits for their results. Each batch of
+    REPLAY_BATCH_SIZE messages is republished and removed from the dead-letter queue in one transaction,
+    so a failed replay neither loses nor duplicates them.
+    """
+    connection = pika.BlockingConnection(connection_parameters())
+    try:
+        channel = connection.channel()
+        declare_retry_queues(channel, queue_name)
+        channel.tx_select()
+        dead_letter_queue = dead_letter_queue_name(queue_name)
+        # Only the messages present now; each is taken once, so skipped ones are not seen again
+        pending = channel.queue_declare(queue=dead_letter_queue, passive=True).method.message_count
+        replayed = 0
+        for _ in range(pending):
+            method, properties, body = channel.basic_get(dead_letter_queue, auto_ack=False)
+            if method is None:
+                break
+            if correlation_ids is not None and properties.correlation_id not in correlation_ids:
+                continue
+            channel.basic_publish(
+                exchange='',
+                routing_key=queue_name,
+                properties=pika.BasicProperties(correlation_id=properties.correlation_id, delivery_mode=2),
+                body=body
+            )
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            replayed += 1
+            if replayed % REPLAY_BATCH_SIZE == 0:
+                channel.tx_commit()
+        channel.tx_commit()
+        return replayed
+    finally:
+        connection.close()
+
+def _open_channel(queue_name):
+    connection = pika.BlockingConnection(connection_parameters())
+    channel = connection.channel()
+    if queue_name:
+        channel.queue_declare(queue=queue_name, durable=True)
+    return channel
+
+def init_message_queue(queue_name=None):
+    """A channel on a connection of its own, declaring queue_name if given; retried while RabbitMQ is unreachable."""
+    return MessageQueueClient._retry_with_backoff(_open_channel, queue_name), queue_name
+
+def consume_messages(
+    channel, queue_name, callback, workers=1, scheduler=None, scheduling_key=None, prefetch_count=None,
+    max_retries=INSTRUCTION_MAX_RETRIES, retry_delay=INSTRUCTION_RETRY_DELAY
+):
+    """Consume queue_name, running callback(body, properties) for each message.
+
+    With a scheduler, messages are handed to scheduler.submit(scheduling_key(body), ...) instead of a
+    thread pool, and prefetch_count (at least workers) bounds how many it can choose from.
+
+    A message whose callback raises goes back to queue_name after retry_delay seconds, through a
+    delay queue. After max_retries retries it is dead-lettered instead.
+    """
+    executor = None
+    if scheduler is None and workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='orchestrator-worker')
+    prefetch_count = max(prefetch_count or workers, workers)
+
+    def process(ch, method, properties, body):
+        """None on success, otherwise the error"""
         try:
             callback(body, properties)
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return None
         except Exception as e:
             logging.error(f"Error processing message: {e}")
+            return str(e) or type(e).__name__
+
+    def settle(ch, method, properties, body, error):
+        if error is None:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+        headers = dict(properties.headers or {})
+        retries = headers.get(RETRY_COUNT_HEADER, 0)
+        headers['x-last-error'] = error[:1000]
+        try:
+            if retries < max_retries:
+                headers[RETRY_COUNT_HEADER] = retries + 1
+                # Expires from the delay queue back into queue_name
+                exchange, routing_key, expiration = '', retry_queue_name(queue_name), str(int(retry_delay * 1000))
+            else:
+                headers['x-dead-lettered-at'] = time.time()
+                logging.error(f"Dead-lettering message {properties.correlation_id} after {retries} retries: {error}")
+                exchange, routing_key, expiration = DEAD_LETTER_EXCHANGE, queue_name, None
+            ch.basic_publish(
+                exchange=exchange,
+                routing_key=routing_key,
+                properties=pika.BasicProperties(
+                    correlation_id=properties.correlation_id,
+                    reply_to=properties.reply_to,
+                    delivery_mode=2,
+                    headers=headers,
+                    expiration=expiration
+                ),
+                body=body
+            )
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        except Exception as e:
+            logging.error(f"Failed to schedule a retry of message {properties.correlation_id}: {e}")
             ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
 
-    channel.basic_qos(prefetch_count=1)
+    def callback_wrapper(ch, method, properties, body):
+        if executor is None and scheduler is None:
+            settle(ch, method, properties, body, process(ch, method, properties, body))
+            return
+
+        # Channels are not thread-safe, so workers hand the ack back to the connection thread
+        def run():
+            if not ch.is_open:
+                # Delivered on a lost connection; the broker has requeued it
+                return
+            error = process(ch, method, properties, body)
+            ch.connection.add_callback_threadsafe(functools.partial(settle, ch, method, properties, body, error))
+        if scheduler is not None:
+            scheduler.submit(scheduling_key(body) if scheduling_key else '', run)
+        else:
+            executor.submit(run)
+
+    declare_retry_queues(channel, queue_name)
+    channel.basic_qos(prefetch_count=prefetch_count)
     channel.basic_consume(queue=queue_name, on_message_callback=callback_wrapper)
 
     while True:
@@ -143,9 +416,24 @@ def consume_messages(channel, queue_name, callback):
             logging.error("Connection lost. Attempting to reconnect...")
             time.sleep(RETRY_DELAY)
             channel, _ = init_message_queue(queue_name)
+            declare_retry_queues(channel, queue_name)
+            channel.basic_qos(prefetch_count=prefetch_count)
+            channel.basic_consume(queue=queue_name, on_message_callback=callback_wrapper)
         except KeyboardInterrupt:
             channel.stop_consuming()
             break
         except Exception as e:
             logging.error(f"Unexpected error: {e}")
-            time.sleep(RETRY_DELAY)
\ No newline at end of file
+            time.sleep(RETRY_DELAY)
+
+    if scheduler is not None:
+        # Queued messages are left unacked, so the broker hands them to another consumer
+        scheduler.shutdown(wait=True, cancel_queued=True)
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if scheduler is not None or executor is not None:
+        # Send the acks of the instructions that finished while stopping
+        try:
+            channel.connection.process_data_events(time_limit=0)
+        except Exception as e:
+            logging.error(f"Failed to settle finished messages: {e}")
\ No newline at end of file
@@ -1,32 +1,77 @@
 # llmchatlinker/orchestrator.py
 
+import os
 import json
-from .message_queue import publish_response, consume_messages, init_message_queue
+import time
+import hashlib
+import logging
+import threading
+from .message_queue import (
+    publish_response, consume_messages, init_message_queue, EventPublisher, EventSubscriber, CANCEL_ROUTING_KEY, CHAT_ROUTING_PREFIX,
+    RETRY_DELAY
+)
+from .cancellation import CancellationRegistry
+from .scheduler import FairScheduler, SCHEDULER_TIER_WEIGHTS, SCHEDULER_DEFAULT_TIER
+from .versions import VERSION_ROUTING_PREFIX
 from .units.control_unit import ControlUnit
 from .units.user_manage_unit import UserManageUnit
 from .units.chat_manage_unit import ChatManageUnit
 from .units.llm_manage_unit import LLMManageUnit
-from .units.database_manage_unit import DatabaseManageUnit
+from .units.database_manage_unit import DatabaseManageUnit, DatabaseConfig
+
+# Number of instructions processed concurrently by one orchestrator process
+ORCHESTRATOR_WORKERS = int(os.getenv('ORCHESTRATOR_WORKERS', 1))
+# Instructions one orchestrator process takes from the queue ahead of running them, for the scheduler to pick from fairly
+ORCHESTRATOR_PREFETCH = int(os.getenv('ORCHESTRATOR_PREFETCH', 32))
+# Seconds the result of an instruction sent with an Idempotency-Key is returned to repeats
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', 86400))
+# Seconds an execution holds its key before a waiting repeat presumes it dead and executes instead
+IDEMPOTENCY_LEASE = float(os.getenv('IDEMPOTENCY_LEASE', 900))
+# Seconds between checks whether the execution a repeat waits for has finished
+IDEMPOTENCY_POLL_INTERVAL = float(os.getenv('IDEMPOTENCY_POLL_INTERVAL', 0.5))
+# Seconds between deletions of expired idempotency records
+IDEMPOTENCY_PURGE_INTERVAL = 60
 
 class Orchestrator:
-    def __init__(self):
+    def __init__(self, workers: int = ORCHESTRATOR_WORKERS):
+        self.workers = max(1, workers)
+        self.result_lock = threading.Lock()
         self.instruction_channel, self.instruction_queue = init_message_queue(queue_name='instruction_queue')
-        self.result_channel, self.result_queue = init_message_queue(queue_name='result_queue')
+        # Replies are published to the callers' direct reply-to addresses, so no queue is declared for them
+        self.result_channel, _ = init_message_queue()
         self.database_manage_unit = DatabaseManageUnit()
+        self.event_publisher = EventPublisher()
+        self.cancellations = CancellationRegistry()
+        self._idempotency_purged_at = 0.0
+        # Shares the worker threads between users, so one user's backlog cannot starve the others
+        self.scheduler = FairScheduler(self.workers, weight_of=self._scheduling_weight, thread_name_prefix='orchestrator-worker')
+        # API processes answer conditional requests from the versions they are told about
+        self.database_manage_unit.on_version_change = self._publish_version
+        # Chat participants connected to the API receive message changes as they happen
+        self.database_manage_unit.on_message_change = self._publish_message_change
         self.control_unit = ControlUnit(
             UserManageUnit(self.database_manage_unit),
             ChatManageUnit(self.database_manage_unit),
-            LLMManageUnit(self.database_manage_unit),
-            self.database_manage_unit
+            LLMManageUnit(self.database_manage_unit, self.event_publisher),
+            self.database_manage_unit,
+            scheduler=self.scheduler
         )
-        self.database_manage_unit.reset_db()
+        if DatabaseConfig.RESET_ON_START:
+            self.database_manage_unit.reset_db()
 
     def fetch_instruction(self, body, properties):
         instruction = json.loads(body)
         correlation_id = properties.correlation_id
         reply_to = properties.reply_to
+        cancelled = self.cancellations.register(correlation_id)
 
         try:
+            if cancelled.cancelled:
+                # The caller went away while the instruction was queued
+                cancelled_response = {"status": "error", "message": "Instruction cancelled", "data": {"cancelled": True}}
+                self._publish_result(json.dumps(cancelled_response), correlation_id, reply_to)
+                return
+
             user_id = instruction['data'].get('user_id')
             if user_id:
                 user_data = self.database_manage_unit.get_user_by_public_id(user_id)
@@ -39,18 +84,111 @@ class Orchestrator:
                             instruction['type']
                         )
 
-            result = self.control_unit.decode_and_execute_instruction(instruction)
+            result = self._execute_once(instruction, cancelled)
             response_message = json.dumps(result)
-            publish_response(self.result_channel, response_message, correlation_id, reply_to)
+            self._publish_result(response_message, correlation_id, reply_to)
     
         except Exception as e:
             error_response = {"status": "error", "message": str(e), "data": {}}
-            publish_response(
-                self.result_channel, 
-                json.dumps(error_response), 
-                correlation_id, 
-                reply_to
-            )
+            self._publish_result(json.dumps(error_response), correlation_id, reply_to)
+        finally:
+            self.cancellations.release(correlation_id)
+
+    def _execute_once(self, instruction, cancelled):
+        """Execute an instruction, or return the result of its earlier execution under the same idempotency key.
+
+        Repeats that arrive while the first execution runs wait for its result. Only successful
+        results are kept, so a repeat of a failed instruction executes it again.
+        """
+        key = instruction.get('idempotency_key')
+        if not key:
+            return self.control_unit.decode_and_execute_instruction(instruction, cancelled)
+
+        self._purge_idempotency_records()
+        fingerprint = hashlib.sha256(
+            json.dumps({"type": instruction['type'], "data": instruction['data']}, sort_keys=True).encode()
+        ).hexdigest()
+        while True:
+            record = self.database_manage_unit.claim_idempotency_key(key, fingerprint, IDEMPOTENCY_LEASE)
+            if record is None:
+                break
+            if record['fingerprint'] != fingerprint:
+                return {"status": "error", "message": "Idempotency-Key was already used for a different request", "data": {}}
+            if record['status'] == 'completed':
+                return record['result']
+            if cancelled.cancelled:
+                return {"status": "error", "message": "Instruction cancelled", "data": {"cancelled": True}}
+            time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+        try:
+            result = self.control_unit.decode_and_execute_instruction(instruction, cancelled)
+        except Exception:
+            self.database_manage_unit.release_idempotency_key(key)
+            raise
+        if result.get('status') == 'success':
+            self.database_manage_unit.complete_idempotency_key(key, result, IDEMPOTENCY_TTL)
+        else:
+            self.database_manage_unit.release_idempotency_key(key)
+        return result
+
+    def _purge_idempotency_records(self):
+        now = time.monotonic()
+        if now - self._idempotency_purged_at < IDEMPOTENCY_PURGE_INTERVAL:
+            return
+        self._idempotency_purged_at = now
+        try:
+            self.database_manage_unit.purge_idempotency_records()
+        except Exception as e:
+            logging.error(f"Failed to purge idempotency records: {e}")
+
+    @staticmethod
+    def _scheduling_key(body):
+        """User an instruction is scheduled for; instructions that name no user share one queue"""
+        try:
+            return str(json.loads(body).get('data', {}).get('user_id') or '')
+        except (ValueError, AttributeError):
+            return ''
+
+    def _scheduling_weight(self, user_id):
+        tier = SCHEDULER_DEFAULT_TIER
+        if user_id:
+            user = self.database_manage_unit.get_user_by_public_id(user_id, fields=['priority_tier'])
+            if user and user['priority_tier']:
+                tier = user['priority_tier']
+        return SCHEDULER_TIER_WEIGHTS.get(tier, SCHEDULER_TIER_WEIGHTS.get(SCHEDULER_DEFAULT_TIER, 1))
+
+    def _publish_version(self, name, version):
+        self.event_publisher.publish(f"{VERSION_ROUTING_PREFIX}.{name}", {"name": name, "version": version})
+
+    def _publish_message_change(self, action, message):
+        self.event_publisher.publish(
+            f"{CHAT_ROUTING_PREFIX}.{message['chat_id']}.message.{action}",
+            {"type": "message", "action": action, "message": message}
+        )
+
+    def _publish_result(self, message, correlation_id, reply_to):
+        if not reply_to:
+            # Replayed dead letters have no caller waiting for their result
+            return
+        # The result channel is shared by all worker threads
+        with self.result_lock:
+            publish_response(self.result_channel, message, correlation_id, reply_to)
+
+    def _listen_for_cancellations(self):
+        """Cancel running instructions as their callers go away"""
+        while True:
+            try:
+                subscriber = EventSubscriber([CANCEL_ROUTING_KEY])
+                for _, event in subscriber.events():
+                    if self.cancellations.cancel(event.get('correlation_id')):
+                        logging.info(f"Cancelled instruction {event.get('correlation_id')}")
+            except Exception as e:
+                logging.error(f"Cancellation listener failed: {e}")
+                time.sleep(RETRY_DELAY)
 
     def start(self):
-        consume_messages(self.instruction_channel, self.instruction_queue, self.fetch_instruction)
\ No newline at end of file
+        threading.Thread(target=self._listen_for_cancellations, name='orchestrator-cancel', daemon=True).start()
+        consume_messages(
+            self.instruction_channel, self.instruction_queue, self.fetch_instruction, workers=self.workers,
+            scheduler=self.scheduler, scheduling_key=self._scheduling_key, prefetch_count=ORCHESTRATOR_PREFETCH
+        )
\ No newline at end of file
@@ -0,0 +1,132 @@
+# llmchatlinker/providers/adapters.py
+
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple, Union
+
+from .health import ProviderHTTPError
+from .generation import sampling_params
+
+class ProviderResponse(NamedTuple):
+    """Normalized answer of a provider call."""
+    content: str
+    usage: Dict[str, Optional[int]]
+    # Wall-clock milliseconds the caller waited, set once the call (with retries and failover) completes
+    latency_ms: Optional[int] = None
+
+class ProviderAdapter:
+    """Translates between LLMChatLinker's chat format and one provider API shape."""
+
+    kind: str = ''
+    # Whether the API accepts several conversations in one request, see build_batch_request
+    supports_batch: bool = False
+
+    def build_request(
+        self,
+        endpoint: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        api_key: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Return the URL, headers and JSON payload of a chat request
+
+        params holds the generation settings (max_tokens, temperature, stop); timeouts are ignored.
+        """
+        raise NotImplementedError
+
+    def parse_response(self, body: Dict[str, Any]) -> ProviderResponse:
+        """Extract the assistant content and token usage from a response body"""
+        raise NotImplementedError
+
+    def build_batch_request(
+        self,
+        endpoint: str,
+        model: str,
+        conversations: List[List[Dict[str, str]]],
+        api_key: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Return the URL, headers and JSON payload of a request answering several conversations"""
+        raise NotImplementedError(f"Provider kind '{self.kind}' does not support batching")
+
+    def parse_batch_response(self, body: Dict[str, Any]) -> List[Union[ProviderResponse, Exception]]:
+        """Extract one answer, or the error of that conversation, per batched conversation"""
+        raise NotImplementedError(f"Provider kind '{self.kind}' does not support batching")
+
+    @staticmethod
+    def _headers(api_key: Optional[str]) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        return headers
+
+class OpenAIChatAdapter(ProviderAdapter):
+    """OpenAI-style `/v1/chat/completions` API.
+
+    Batches go to `<endpoint>/batch` as `{"model", "requests": [{"messages"}, ...]}` and are
+    answered with `{"responses": [...]}`, one chat completion or `{"error": ...}` per request.
+    """
+
+    kind = 'openai'
+    supports_batch = True
+
+    def build_request(self, endpoint, model, messages, api_key=None, params=None):
+        return endpoint, self._headers(api_key), {"model": model, "messages": messages, **sampling_params(params)}
+
+    def parse_response(self, body):
+        usage = body.get('usage') or {}
+        return ProviderResponse(
+            content=body['choices'][0]['message']['content'],
+            usage={
+                'prompt_tokens': usage.get('prompt_tokens'),
+                'completion_tokens': usage.get('completion_tokens')
+            }
+        )
+
+    def build_batch_request(self, endpoint, model, conversations, api_key=None, params=None):
+        settings = sampling_params(params)
+        payload = {"model": model, "requests": [{"messages": messages, **settings} for messages in conversations]}
+        return f"{endpoint.rstrip('/')}/batch", self._headers(api_key), payload
+
+    def parse_batch_response(self, body):
+        results = []
+        for response in body['responses']:
+            if 'error' in response:
+                results.append(ProviderHTTPError(f"Batched request failed: {response['error']}", response.get('status', 500)))
+            else:
+                results.append(self.parse_response(response))
+        return results
+
+class OllamaChatAdapter(ProviderAdapter):
+    """Ollama-style `/api/chat` API (non-streaming); generation settings go in `options`."""
+
+    kind = 'ollama'
+    OPTION_NAMES = {'max_tokens': 'num_predict', 'temperature': 'temperature', 'stop': 'stop'}
+
+    def build_request(self, endpoint, model, messages, api_key=None, params=None):
+        payload = {"model": model, "messages": messages, "stream": False}
+        options = {self.OPTION_NAMES[key]: value for key, value in sampling_params(params).items()}
+        if options:
+            payload["options"] = options
+        return endpoint, self._headers(api_key), payload
+
+    def parse_response(self, body):
+        return ProviderResponse(
+            content=body['message']['content'],
+            usage={
+                'prompt_tokens': body.get('prompt_eval_count'),
+                'completion_tokens': body.get('eval_count')
+            }
+        )
+
+ADAPTERS: Dict[str, ProviderAdapter] = {
+    adapter.kind: adapter for adapter in (OpenAIChatAdapter(), OllamaChatAdapter())
+}
+
+DEFAULT_KIND = OpenAIChatAdapter.kind
+
+def get_adapter(kind: Optional[str]) -> ProviderAdapter:
+    """Return the adapter for a provider kind"""
+    adapter = ADAPTERS.get(kind or DEFAULT_KIND)
+    if adapter is None:
+        raise ValueError(f"Unknown provider kind '{kind}'. Supported kinds: {', '.join(sorted(ADAPTERS))}")
+    return adapter
@@ -0,0 +1,63 @@
+# llmchatlinker/providers/balancer.py
+
+import os
+import random
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from .health import HealthTracker, EndpointHealth, CircuitOpenError
+
+# 'least_outstanding' balances on in-flight requests, 'ewma' also weighs in observed latency
+LB_STRATEGY = os.getenv('LB_STRATEGY', 'least_outstanding').lower()
+
+class EndpointBalancer:
+    """Picks one of a provider's weighted endpoints, skipping endpoints whose circuit is open."""
+
+    def __init__(self, health: HealthTracker, strategy: str = LB_STRATEGY):
+        self.health = health
+        self.strategy = strategy
+        # Scoring and claiming happen together, so a burst of callers spreads over the replicas
+        self._lock = threading.Lock()
+
+    def choose(self, endpoints: List[Dict[str, Any]], exclude: Optional[List[str]] = None) -> Tuple[Dict[str, Any], EndpointHealth]:
+        """Claim the best available endpoint; endpoints in exclude are used only as a last resort
+
+        The chosen endpoint already counts the request as outstanding, so concurrent
+        callers see each other's choices; the caller must call health.end() when done.
+        """
+        candidates = [endpoint for endpoint in endpoints if endpoint['url'] not in (exclude or [])] or list(endpoints)
+        with self._lock:
+            return self._claim_best(candidates, endpoints)
+
+    def _claim_best(self, candidates: List[Dict[str, Any]], endpoints: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], EndpointHealth]:
+        while candidates:
+            scored = [
+                (self._score(endpoint, health), random.random(), endpoint, health)
+                for endpoint in candidates
+                for health in [self.health.for_endpoint(endpoint['url'])]
+                if health.available()
+            ]
+            if not scored:
+                break
+            _, _, endpoint, health = min(scored, key=lambda item: item[:2])
+            # Another thread may have claimed the half-open probe in the meantime
+            if health.claim():
+                return endpoint, health
+            candidates.remove(endpoint)
+        raise CircuitOpenError(f"No healthy endpoint among {', '.join(e['url'] for e in endpoints)}")
+
+    def _score(self, endpoint: Dict[str, Any], health: EndpointHealth) -> Tuple[float, float]:
+        load = (health.outstanding + 1) / endpoint.get('weight', 1)
+        latency = health.ewma or 0.0
+        if self.strategy == 'ewma':
+            return load * latency, load
+        return load, latency
+
+    def stats(self, endpoints: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Per-endpoint load and health statistics"""
+        stats = []
+        for endpoint in endpoints:
+            endpoint_stats = self.health.stats(endpoint['url']) or {'endpoint': endpoint['url'], 'state': 'closed'}
+            endpoint_stats['weight'] = endpoint.get('weight', 1)
+            stats.append(endpoint_stats)
+        return stats
@@ -0,0 +1,72 @@
+# llmchatlinker/providers/batcher.py
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List
+
+class _Batch:
+    """Requests collected for one key while its window is open."""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.futures: List[Future] = []
+        self.closed = threading.Event()
+
+class MicroBatcher:
+    """Collects concurrent calls that share a key into one batched call.
+
+    The first caller for a key opens a batch and waits up to the window for
+    others to join, or until the batch is full, then sends the whole batch on
+    its own thread. Every caller receives the result at its position in the
+    batch (or the batch's exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open: Dict[Hashable, _Batch] = {}
+
+    def submit(self, key: Hashable, item: Any, send: Callable[[List[Any]], List[Any]], window: float, max_size: int) -> Any:
+        """Add item to the open batch for key and return its result
+
+        send receives the batch's items and returns one result per item, in
+        order; a result that is an exception is raised to that item's caller.
+        """
+        future = Future()
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self._open[key] = batch
+            batch.items.append(item)
+            batch.futures.append(future)
+            if len(batch.items) >= max_size:
+                self._close(key, batch)
+
+        if leader:
+            batch.closed.wait(window)
+            with self._lock:
+                self._close(key, batch)
+            self._send(batch, send)
+        return future.result()
+
+    def _close(self, key: Hashable, batch: _Batch) -> None:
+        # Called with the lock held; later callers open a new batch
+        if self._open.get(key) is batch:
+            del self._open[key]
+        batch.closed.set()
+
+    def _send(self, batch: _Batch, send: Callable[[List[Any]], List[Any]]) -> None:
+        try:
+            results = send(batch.items)
+            if len(results) != len(batch.items):
+                raise ValueError(f"Batch of {len(batch.items)} requests returned {len(results)} results")
+        except BaseException as e:
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(batch.futures, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
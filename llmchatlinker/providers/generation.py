@@ -0,0 +1,68 @@
+# llmchatlinker/providers/generation.py
+
+import os
+from typing import Dict, Any, Optional, Tuple
+
+# Seconds allowed to open a connection to a provider endpoint, unless an LLM or request sets connect_timeout
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', 5))
+# Upper bounds of configured generation settings
+LLM_MAX_READ_TIMEOUT = float(os.getenv('LLM_MAX_READ_TIMEOUT', 600))
+LLM_MAX_STOP_SEQUENCES = int(os.getenv('LLM_MAX_STOP_SEQUENCES', 4))
+
+# Settings sent to the provider; the timeouts only bound our side of the call
+SAMPLING_PARAMS = ('max_tokens', 'temperature', 'stop')
+TIMEOUT_PARAMS = ('connect_timeout', 'read_timeout')
+GENERATION_PARAMS = SAMPLING_PARAMS + TIMEOUT_PARAMS
+
+def validate_generation_params(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Check generation settings and return them without unset (None) values
+
+    Raises ValueError naming the first invalid setting.
+    """
+    if params is None:
+        return {}
+    if not isinstance(params, dict):
+        raise ValueError("generation_params must be an object")
+    unknown = set(params) - set(GENERATION_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown generation params: {', '.join(sorted(unknown))}")
+
+    params = {key: value for key, value in params.items() if value is not None}
+    max_tokens = params.get('max_tokens')
+    if max_tokens is not None and (not _is_number(max_tokens, int) or max_tokens < 1):
+        raise ValueError("max_tokens must be a positive integer")
+    temperature = params.get('temperature')
+    if temperature is not None and (not _is_number(temperature) or not 0 <= temperature <= 2):
+        raise ValueError("temperature must be between 0 and 2")
+    stop = params.get('stop')
+    if stop is not None:
+        if isinstance(stop, str):
+            stop = params['stop'] = [stop]
+        if not isinstance(stop, list) or not all(isinstance(sequence, str) and sequence for sequence in stop):
+            raise ValueError("stop must be a string or a list of non-empty strings")
+        if len(stop) > LLM_MAX_STOP_SEQUENCES:
+            raise ValueError(f"stop accepts at most {LLM_MAX_STOP_SEQUENCES} sequences")
+    for key in TIMEOUT_PARAMS:
+        timeout = params.get(key)
+        if timeout is not None and (not _is_number(timeout) or not 0 < timeout <= LLM_MAX_READ_TIMEOUT):
+            raise ValueError(f"{key} must be between 0 and {LLM_MAX_READ_TIMEOUT:g} seconds")
+    return params
+
+def merge_generation_params(defaults: Optional[Dict[str, Any]], overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-request settings take precedence over the LLM's stored ones"""
+    merged = dict(defaults or {})
+    merged.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    return merged
+
+def sampling_params(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The settings an adapter sends to the provider"""
+    return {key: params[key] for key in SAMPLING_PARAMS if params and params.get(key) is not None}
+
+def request_timeouts(params: Optional[Dict[str, Any]]) -> Tuple[float, Optional[float]]:
+    """The connect timeout and the configured read timeout (None = adaptive only)"""
+    params = params or {}
+    return params.get('connect_timeout') or LLM_CONNECT_TIMEOUT, params.get('read_timeout')
+
+def _is_number(value: Any, kind: type = (int, float)) -> bool:
+    # bool is an int subclass, but true is not a token count
+    return isinstance(value, kind) and not isinstance(value, bool)
@@ -0,0 +1,216 @@
+# llmchatlinker/providers/health.py
+
+import os
+import time
+import random
+import logging
+import threading
+import datetime
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Consecutive failures that open an endpoint's circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+# Seconds an open circuit waits before letting a probe request through
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+# Request timeout used until enough latency samples have been observed
+LLM_TIMEOUT_DEFAULT = float(os.getenv('LLM_TIMEOUT_DEFAULT', 30))
+# Bounds and headroom of the adaptive timeout derived from observed p99 latency
+LLM_TIMEOUT_MIN = float(os.getenv('LLM_TIMEOUT_MIN', 5))
+LLM_TIMEOUT_MAX = float(os.getenv('LLM_TIMEOUT_MAX', 120))
+LLM_TIMEOUT_MULTIPLIER = float(os.getenv('LLM_TIMEOUT_MULTIPLIER', 3))
+# Number of recent latencies kept per endpoint and needed before adapting
+LATENCY_WINDOW = int(os.getenv('LATENCY_WINDOW', 200))
+LATENCY_MIN_SAMPLES = int(os.getenv('LATENCY_MIN_SAMPLES', 20))
+# Retries after the first attempt and the backoff applied between them
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', 0.5))
+LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', 10))
+# Fire a second, hedged request when the first is slower than the observed p95
+LLM_HEDGE_REQUESTS = os.getenv('LLM_HEDGE_REQUESTS', 'false').lower() == 'true'
+# Smoothing factor of the per-endpoint latency EWMA
+LATENCY_EWMA_ALPHA = float(os.getenv('LATENCY_EWMA_ALPHA', 0.3))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised when an endpoint's circuit breaker rejects a request."""
+    pass
+
+class ProviderHTTPError(Exception):
+    """Raised when a provider answers with an HTTP error status."""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in RETRYABLE_STATUS_CODES
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, or the provider's Retry-After when given"""
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+
+class EndpointHealth:
+    """Latency history and circuit breaker state for one endpoint."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.successes = 0
+        self.failures = 0
+        self.outstanding = 0
+        self.ewma: Optional[float] = None
+
+    def available(self) -> bool:
+        """Whether allow_request would currently let a request through, without claiming a probe"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= CIRCUIT_RESET_TIMEOUT
+            return not self._probe_in_flight
+
+    def end(self) -> None:
+        """Mark a request claimed with claim() as finished"""
+        with self._lock:
+            self.outstanding -= 1
+
+    def claim(self) -> bool:
+        """Atomically check allow_request and count the request as outstanding"""
+        with self._lock:
+            if not self._allow_request():
+                return False
+            self.outstanding += 1
+            return True
+
+    def allow_request(self) -> bool:
+        """Whether a request may be sent; an expired open circuit lets one probe through"""
+        with self._lock:
+            return self._allow_request()
+
+    def _allow_request(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= CIRCUIT_RESET_TIMEOUT:
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+                self.ewma = latency if self.ewma is None else LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self.ewma
+            self.successes += 1
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                logger.info(f"Circuit for {self.endpoint} closed")
+            self.state = CLOSED
+            self._probe_in_flight = False
+
+    def abandon(self) -> None:
+        """Give up a claimed request without judging the endpoint, freeing a half-open probe"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                if self.state != OPEN:
+                    logger.warning(f"Circuit for {self.endpoint} opened after {self.consecutive_failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Observed latency percentile, or None until enough samples exist"""
+        with self._lock:
+            if len(self._latencies) < LATENCY_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def timeout(self) -> float:
+        """Read timeout adapted to the endpoint's observed p99 latency"""
+        p99 = self.percentile(99)
+        if p99 is None:
+            return LLM_TIMEOUT_DEFAULT
+        return min(LLM_TIMEOUT_MAX, max(LLM_TIMEOUT_MIN, p99 * LLM_TIMEOUT_MULTIPLIER))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Delay after which a hedged request is sent, or None if hedging is off"""
+        if not LLM_HEDGE_REQUESTS:
+            return None
+        return self.percentile(95)
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95, p99 = self.percentile(50), self.percentile(95), self.percentile(99)
+        return {
+            'endpoint': self.endpoint,
+            'state': self.state,
+            'successes': self.successes,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'outstanding': self.outstanding,
+            'latency_ewma': round(self.ewma, 3) if self.ewma is not None else None,
+            'latency_p50': round(p50, 3) if p50 is not None else None,
+            'latency_p95': round(p95, 3) if p95 is not None else None,
+            'latency_p99': round(p99, 3) if p99 is not None else None,
+            'timeout': round(self.timeout(), 3)
+        }
+
+class HealthTracker:
+    """Keeps one EndpointHealth per endpoint URL."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, EndpointHealth] = {}
+
+    def for_endpoint(self, endpoint: str) -> EndpointHealth:
+        with self._lock:
+            health = self._endpoints.get(endpoint)
+            if health is None:
+                health = self._endpoints[endpoint] = EndpointHealth(endpoint)
+            return health
+
+    def stats(self, endpoint: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            health = self._endpoints.get(endpoint)
+        return health.stats() if health else None
@@ -0,0 +1,179 @@
+# llmchatlinker/providers/mock_server.py
+
+"""A local mock LLM provider for offline load testing.
+
+Run it with:
+
+    python -m llmchatlinker.providers.mock_server --port 15556 --latency 0.2 --token-rate 50 --error-rate 0.05
+
+and register it as a provider whose api_endpoint is http://localhost:15556/v1/chat/completions
+(kind "openai") or http://localhost:15556/api/chat (kind "ollama"). Batches of OpenAI-style
+requests are answered on http://localhost:15556/v1/chat/completions/batch in one latency period.
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "the quick brown fox jumps over the lazy dog while a language model "
+    "streams tokens to an orchestrator that persists every message"
+).split()
+
+class MockProviderConfig:
+    """Behavior of the mock provider."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        token_rate: float = 0.0,
+        completion_tokens: int = 32,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        retry_after: float = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    """Answers chat requests in the OpenAI shape, or the Ollama shape on `/api/chat` with stream=false."""
+
+    config = MockProviderConfig()
+    requests_served = 0
+    counter_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send(400, {"error": "invalid JSON"})
+
+        with self.counter_lock:
+            # Counted per server, since create_server gives every server its own handler class
+            type(self).requests_served += 1
+
+        config = self.config
+        time.sleep(max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)))
+        if random.random() < config.error_rate:
+            headers = {'Retry-After': str(config.retry_after)} if config.retry_after is not None else {}
+            return self._send(config.error_status, {"error": "injected failure"}, headers)
+
+        if self.path.rstrip('/').endswith('/batch'):
+            items = request.get('requests') or []
+            # A batch is generated in one pass, like a model server batching on the GPU
+            token_counts = [self._completion_tokens(item, config.completion_tokens) for item in items]
+            self._generation_delay(max(token_counts, default=0))
+            responses = [
+                self._openai_body(request.get('model'), *self._generate(item.get('messages') or [], tokens))
+                for item, tokens in zip(items, token_counts)
+            ]
+            return self._send(200, {"object": "batch", "responses": responses})
+
+        completion_tokens = self._completion_tokens(request, config.completion_tokens)
+        self._generation_delay(completion_tokens)
+        content, prompt_tokens, completion_tokens = self._generate(request.get('messages') or [], completion_tokens)
+        if self.path.rstrip('/').endswith('/api/chat') and request.get('stream') is False:
+            body = {
+                "model": request.get('model'),
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": completion_tokens
+            }
+        else:
+            body = self._openai_body(request.get('model'), content, prompt_tokens, completion_tokens)
+        self._send(200, body)
+
+    def _generation_delay(self, completion_tokens: int) -> None:
+        if self.config.token_rate > 0:
+            time.sleep(completion_tokens / self.config.token_rate)
+
+    @staticmethod
+    def _completion_tokens(request: Dict[str, Any], default: int) -> int:
+        """Answer length, capped by the request's max_tokens (OpenAI) or options.num_predict (Ollama)"""
+        limit = request.get('max_tokens') or (request.get('options') or {}).get('num_predict')
+        return min(default, limit) if limit else default
+
+    @staticmethod
+    def _generate(messages: List[Dict[str, Any]], completion_tokens: int) -> Tuple[str, int, int]:
+        prompt_tokens = sum(len((message.get('content') or '').split()) for message in messages)
+        content = ' '.join(random.choice(WORDS) for _ in range(completion_tokens))
+        return content, prompt_tokens, completion_tokens
+
+    @staticmethod
+    def _openai_body(model: str, content: str, prompt_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+        return {
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Dict[str, str] = None) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+def create_server(host: str = '127.0.0.1', port: int = 15556, config: MockProviderConfig = None) -> ThreadingHTTPServer:
+    """Create a mock provider server; call serve_forever() on it, e.g. from a thread in tests"""
+    handler = type('ConfiguredMockProviderHandler', (MockProviderHandler,), {'config': config or MockProviderConfig()})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock LLM provider for offline load testing")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=15556)
+    parser.add_argument('--latency', type=float, default=0.0, help="Base seconds before answering")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Uniform +/- seconds added to the latency")
+    parser.add_argument('--token-rate', type=float, default=0.0, help="Completion tokens generated per second (0 = instant)")
+    parser.add_argument('--completion-tokens', type=int, default=32, help="Tokens in every answer")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument('--error-status', type=int, default=503, help="HTTP status of injected errors")
+    parser.add_argument('--retry-after', type=float, default=None, help="Retry-After seconds sent with injected errors")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = MockProviderConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        token_rate=args.token_rate,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after
+    )
+    server = create_server(args.host, args.port, config)
+    logger.info(f"Mock LLM provider listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# llmchatlinker/providers/rate_limit.py
+
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 'local' keeps limiter state per process, 'database' shares it through Postgres
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'local').lower()
+# Maximum number of requests waiting on one provider's limiter
+RATE_LIMIT_MAX_QUEUE = int(os.getenv('RATE_LIMIT_MAX_QUEUE', 100))
+# Maximum seconds a request may wait for a limiter before it is rejected
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 30))
+# Initial and maximum poll interval used when waiting on the shared store
+RATE_LIMIT_POLL_INTERVAL = 0.05
+RATE_LIMIT_MAX_POLL_INTERVAL = 1.0
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot obtain provider capacity before its deadline."""
+    pass
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Rough prompt token estimate (about four characters per token)"""
+    return sum(len(message.get('content') or '') // 4 + 4 for message in messages)
+
+class LocalLimiterStore:
+    """Limiter state kept in this process only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._slots: Dict[str, int] = {}
+        self._released = threading.Condition(self._lock)
+
+    def take(self, key: str, capacity: float, refill_per_second: float, amount: float) -> float:
+        """Take tokens from a bucket; return 0 on success or the seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            tokens, refreshed_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - refreshed_at) * refill_per_second)
+            if tokens >= amount:
+                self._buckets[key] = (tokens - amount, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (amount - tokens) / refill_per_second
+
+    def adjust(self, key: str, capacity: float, refill_per_second: float, amount: float) -> None:
+        """Charge (or refund, if negative) tokens unconditionally; the bucket may go into debt"""
+        with self._lock:
+            now = time.monotonic()
+            tokens, refreshed_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - refreshed_at) * refill_per_second)
+            self._buckets[key] = (min(capacity, tokens - amount), now)
+
+    def acquire_slot(self, key: str, limit: int, deadline: float) -> Optional[str]:
+        """Wait until fewer than `limit` slots are held for key"""
+        with self._released:
+            while self._slots.get(key, 0) >= limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._released.wait(remaining)
+            self._slots[key] = self._slots.get(key, 0) + 1
+            return key
+
+    def release_slot(self, handle: str) -> None:
+        with self._released:
+            self._slots[handle] -= 1
+            self._released.notify_all()
+
+class DatabaseLimiterStore:
+    """Limiter state shared by every orchestrator process through the database."""
+
+    def __init__(self, database_manage_unit):
+        self.db = database_manage_unit
+
+    def take(self, key: str, capacity: float, refill_per_second: float, amount: float) -> float:
+        return self.db.take_rate_limit_tokens(key, capacity, refill_per_second, amount)
+
+    def adjust(self, key: str, capacity: float, refill_per_second: float, amount: float) -> None:
+        self.db.adjust_rate_limit_tokens(key, capacity, refill_per_second, amount)
+
+    def acquire_slot(self, key: str, limit: int, deadline: float) -> Optional[Any]:
+        interval = RATE_LIMIT_POLL_INTERVAL
+        while True:
+            handle = self.db.try_acquire_advisory_slot(key, limit)
+            if handle is not None:
+                return handle
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # Back off so waiters do not hammer the database
+            time.sleep(min(interval, remaining) * random.uniform(0.5, 1.0))
+            interval = min(interval * 2, RATE_LIMIT_MAX_POLL_INTERVAL)
+
+    def release_slot(self, handle: Any) -> None:
+        self.db.release_advisory_slot(handle)
+
+class ProviderLimiter:
+    """Requests-per-minute, tokens-per-minute and concurrency limits for one provider."""
+
+    def __init__(
+        self,
+        key: str,
+        store,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_queue: int = RATE_LIMIT_MAX_QUEUE
+    ):
+        self.key = key
+        self.store = store
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._acquired = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def limits(self) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        return self.requests_per_minute, self.tokens_per_minute, self.max_concurrency
+
+    @contextmanager
+    def acquire(self, tokens: int = 0, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        """Block until the request fits every configured limit, then hold a concurrency slot"""
+        lease = self.reserve(tokens, max_wait)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    def try_reserve(self, tokens: int = 0) -> Optional['LimiterLease']:
+        """Reserve capacity only if it is free right now, e.g. for an optional hedged request"""
+        try:
+            return self.reserve(tokens, max_wait=0, count_rejection=False)
+        except RateLimitExceeded:
+            return None
+
+    def reserve(self, tokens: int = 0, max_wait: float = RATE_LIMIT_MAX_WAIT, count_rejection: bool = True) -> 'LimiterLease':
+        """Like acquire, but returns a lease that the caller must release, possibly from another thread"""
+        started = time.monotonic()
+        deadline = started + max(0.0, max_wait)
+        with self._lock:
+            if self._queued >= self.max_queue:
+                if count_rejection:
+                    self._rejected += 1
+                raise RateLimitExceeded(f"Too many requests queued for provider {self.key}")
+            self._queued += 1
+
+        slot = None
+        took_request = False
+        charged = 0
+        try:
+            # Take the concurrency slot first, so a request that times out waiting for it burns no rate tokens
+            if self.max_concurrency:
+                slot = self.store.acquire_slot(f"{self.key}:concurrency", self.max_concurrency, deadline)
+                if slot is None:
+                    raise RateLimitExceeded(f"No free concurrency slot for provider {self.key}")
+            if self.requests_per_minute:
+                self._wait_for_bucket('rpm', self.requests_per_minute, 1, deadline)
+                took_request = True
+            if self.tokens_per_minute and tokens:
+                charged = min(tokens, self.tokens_per_minute)
+                self._wait_for_bucket('tpm', self.tokens_per_minute, charged, deadline)
+        except RateLimitExceeded:
+            if took_request:
+                self.store.adjust(f"{self.key}:rpm", self.requests_per_minute, self.requests_per_minute / 60.0, -1)
+            if slot is not None:
+                self.store.release_slot(slot)
+            if count_rejection:
+                with self._lock:
+                    self._rejected += 1
+            raise
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._acquired += 1
+            self._in_flight += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        if waited > 1:
+            logger.info(f"Waited {waited:.2f}s for provider {self.key} rate limits")
+        return LimiterLease(self, slot, charged)
+
+    def _release(self, slot: Any) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        if slot is not None:
+            self.store.release_slot(slot)
+
+    def _reconcile_tokens(self, charged: int, actual: int) -> None:
+        """Correct the tokens-per-minute bucket from the estimate to the provider's reported usage"""
+        if self.tokens_per_minute and actual != charged:
+            self.store.adjust(f"{self.key}:tpm", self.tokens_per_minute, self.tokens_per_minute / 60.0, actual - charged)
+
+    def _wait_for_bucket(self, name: str, per_minute: int, amount: float, deadline: float) -> None:
+        while True:
+            wait = self.store.take(f"{self.key}:{name}", per_minute, per_minute / 60.0, amount)
+            if wait <= 0:
+                return
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise RateLimitExceeded(f"Provider {self.key} {name} limit would be exceeded before the deadline")
+            time.sleep(min(wait, max(remaining, 0)))
+
+    def stats(self) -> Dict[str, Any]:
+        """Limiter metrics, including the time requests spent waiting"""
+        with self._lock:
+            return {
+                'queued': self._queued,
+                'in_flight': self._in_flight,
+                'acquired': self._acquired,
+                'rejected': self._rejected,
+                'total_wait_seconds': round(self._total_wait, 3),
+                'avg_wait_seconds': round(self._total_wait / self._acquired, 3) if self._acquired else 0.0,
+                'max_wait_seconds': round(self._max_wait, 3)
+            }
+
+class LimiterLease:
+    """Capacity held for one provider request until release() is called."""
+
+    def __init__(self, limiter: ProviderLimiter, slot: Any, charged_tokens: int):
+        self.limiter = limiter
+        self.slot = slot
+        self.charged_tokens = charged_tokens
+        self._released = False
+        self._lock = threading.Lock()
+
+    def record_usage(self, usage: Optional[Dict[str, Optional[int]]]) -> None:
+        """Charge the actual prompt and completion tokens instead of the prompt estimate"""
+        if not usage or usage.get('prompt_tokens') is None:
+            return
+        actual = (usage.get('prompt_tokens') or 0) + (usage.get('completion_tokens') or 0)
+        self.limiter._reconcile_tokens(self.charged_tokens, actual)
+        self.charged_tokens = actual
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.limiter._release(self.slot)
+
+class RateLimiterRegistry:
+    """Keeps one limiter per provider and rebuilds it when the provider's limits change."""
+
+    def __init__(self, store=None):
+        self.store = store or LocalLimiterStore()
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, ProviderLimiter] = {}
+
+    def limiter_for(self, provider: Dict[str, Any]) -> ProviderLimiter:
+        key = provider['provider_id']
+        limits = (
+            provider.get('requests_per_minute'),
+            provider.get('tokens_per_minute'),
+            provider.get('max_concurrency')
+        )
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None or limiter.limits != limits:
+                limiter = ProviderLimiter(key, self.store, *limits)
+                self._limiters[key] = limiter
+            return limiter
+
+    def stats(self, provider_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            limiter = self._limiters.get(provider_id)
+        return limiter.stats() if limiter else None
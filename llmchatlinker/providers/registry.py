@@ -0,0 +1,106 @@
+# llmchatlinker/providers/registry.py
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for provider and LLM changes made by other orchestrator processes
+LLM_REGISTRY_POLL_INTERVAL = float(os.getenv('LLM_REGISTRY_POLL_INTERVAL', 5))
+
+class ConfigRegistry:
+    """In-memory copy of the active providers and LLMs.
+
+    Lookups are served from memory. Changes made through this process are applied
+    directly; changes made by other processes bump a version counter in the database,
+    which is polled at most every poll_interval seconds and triggers a full reload.
+    The returned dictionaries are shared and must not be modified.
+    """
+
+    def __init__(self, db, version_name: str, poll_interval: float = LLM_REGISTRY_POLL_INTERVAL):
+        self.db = db
+        self.version_name = version_name
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._providers: Dict[str, Dict[str, Any]] = {}
+        self._llms: Dict[str, Dict[str, Any]] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+
+    def provider(self, public_id: str) -> Optional[Dict[str, Any]]:
+        """Get an active provider by public ID"""
+        self._refresh_if_stale()
+        with self._lock:
+            provider = self._providers.get(public_id)
+        if provider is None:
+            # It may have been added by another process since the last poll
+            provider = self.db.get_provider_by_public_id(public_id)
+            if provider is not None:
+                self.put_provider(provider)
+        return provider
+
+    def llm(self, public_id: str) -> Optional[Dict[str, Any]]:
+        """Get an active LLM by public ID"""
+        self._refresh_if_stale()
+        with self._lock:
+            llm = self._llms.get(public_id)
+        if llm is None:
+            llm = self.db.get_llm_by_public_id(public_id)
+            if llm is not None:
+                self.put_llm(llm)
+        return llm
+
+    def llms(self) -> List[Dict[str, Any]]:
+        """Get every active LLM"""
+        self._refresh_if_stale()
+        with self._lock:
+            return list(self._llms.values())
+
+    def put_provider(self, provider: Dict[str, Any]) -> None:
+        with self._lock:
+            self._providers[provider['provider_id']] = provider
+
+    def remove_provider(self, public_id: str) -> None:
+        with self._lock:
+            self._providers.pop(public_id, None)
+
+    def put_llm(self, llm: Dict[str, Any]) -> None:
+        with self._lock:
+            self._llms[llm['llm_id']] = llm
+
+    def remove_llm(self, public_id: str) -> None:
+        with self._lock:
+            self._llms.pop(public_id, None)
+
+    def reload(self) -> None:
+        """Replace the registry's contents with the active providers and LLMs in the database"""
+        # The version is read first, so a change made during the load is picked up by the next poll
+        version = self.db.get_entity_version(self.version_name)
+        providers = {provider['provider_id']: provider for provider in self.db.get_all_providers()}
+        llms = {llm['llm_id']: llm for llm in self.db.get_all_llms()}
+        with self._lock:
+            self._providers = providers
+            self._llms = llms
+            self._version = version
+            self._checked_at = time.monotonic()
+        logger.info(f"Loaded {len(providers)} providers and {len(llms)} LLMs (version {version})")
+
+    def _refresh_if_stale(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            loaded = self._version is not None
+            if loaded and now - self._checked_at < self.poll_interval:
+                return
+            # Other threads keep using the current copy while this one polls
+            self._checked_at = now
+        if not loaded:
+            self.reload()
+            return
+        try:
+            if self.db.get_entity_version(self.version_name) != self._version:
+                self.reload()
+        except Exception as e:
+            logger.warning(f"Could not check for provider and LLM changes: {e}")
@@ -0,0 +1,65 @@
+# llmchatlinker/providers/singleflight.py
+
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+def fingerprint(payload: Dict[str, Any]) -> str:
+    """Build a stable fingerprint for a JSON-serializable payload"""
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still in flight wait on the same future and receive its result (or its
+    exception). The key is forgotten as soon as the call completes, so this is
+    deduplication of in-flight work only, not a result cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run func once per in-flight key from any thread and return its result"""
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, func, *args, **kwargs)
+        else:
+            logger.info(f"Coalescing duplicate in-flight call {key[:12]}")
+        return future.result()
+
+    def in_flight(self) -> int:
+        """Number of distinct keys currently executing"""
+        with self._lock:
+            return len(self._calls)
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _run(self, key: str, future: Future, func: Callable[..., Any], *args, **kwargs) -> None:
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._forget(key)
+            future.set_exception(e)
+        else:
+            self._forget(key)
+            future.set_result(result)
+
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
@@ -0,0 +1,54 @@
+# llmchatlinker/providers/warmup.py
+
+import os
+import time
+import threading
+from typing import Dict, Optional, Set
+
+# Seconds a model server keeps a model loaded after a request (Ollama's default keep_alive is 5 minutes)
+LLM_WARM_TTL = float(os.getenv('LLM_WARM_TTL', 300))
+
+class WarmthTracker:
+    """Tracks whether each LLM was recently served and is therefore still loaded.
+
+    An LLM is 'warm' if a request to it succeeded within the TTL, 'warming' while
+    a warmup request is in flight and 'cold' otherwise. The state is what this
+    process has observed; other processes' traffic is not seen.
+    """
+
+    def __init__(self, ttl: float = LLM_WARM_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._last_success: Dict[str, float] = {}
+        self._warming: Set[str] = set()
+
+    def record_success(self, llm_id: str) -> None:
+        with self._lock:
+            self._last_success[llm_id] = time.monotonic()
+
+    def start_warming(self, llm_id: str) -> bool:
+        """Mark an LLM as warming; False if a warmup for it is already in flight"""
+        with self._lock:
+            if llm_id in self._warming:
+                return False
+            self._warming.add(llm_id)
+            return True
+
+    def finish_warming(self, llm_id: str) -> None:
+        with self._lock:
+            self._warming.discard(llm_id)
+
+    def idle_for(self, llm_id: str) -> Optional[float]:
+        """Seconds since the last successful request, None if there was none"""
+        with self._lock:
+            last_success = self._last_success.get(llm_id)
+        return time.monotonic() - last_success if last_success is not None else None
+
+    def state(self, llm_id: str) -> str:
+        with self._lock:
+            if llm_id in self._warming:
+                return 'warming'
+            last_success = self._last_success.get(llm_id)
+        if last_success is not None and time.monotonic() - last_success < self.ttl:
+            return 'warm'
+        return 'cold'
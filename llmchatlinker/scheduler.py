@@ -0,0 +1,150 @@
+# llmchatlinker/scheduler.py
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+def parse_tier_weights(value: str) -> Dict[str, int]:
+    """Parse 'tier=weight,...' into a dictionary of positive weights"""
+    weights = {}
+    for item in value.split(','):
+        if item.strip():
+            tier, _, weight = item.partition('=')
+            weights[tier.strip()] = max(1, int(weight))
+    return weights
+
+# Instructions a user of each priority tier gets started per scheduling round
+SCHEDULER_TIER_WEIGHTS = parse_tier_weights(os.getenv('SCHEDULER_TIER_WEIGHTS', 'low=1,normal=4,high=16'))
+# Tier of users without one, and of instructions that name no user
+SCHEDULER_DEFAULT_TIER = os.getenv('SCHEDULER_DEFAULT_TIER', 'normal')
+# Seconds the weight of a user is remembered before it is looked up again
+SCHEDULER_WEIGHT_TTL = float(os.getenv('SCHEDULER_WEIGHT_TTL', 30))
+
+class FairScheduler:
+    """Runs submitted work on a fixed set of threads, shared fairly between keys by deficit round robin
+
+    Each key (a user) with queued work gets `weight` items started per round, in the order
+    they were submitted. A key with hundreds of queued items therefore delays another key's
+    item by at most one round rather than by its whole backlog.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        weight_of: Callable[[str], int] = lambda key: 1,
+        weight_ttl: float = SCHEDULER_WEIGHT_TTL,
+        thread_name_prefix: str = 'scheduler-worker'
+    ):
+        self.weight_of = weight_of
+        self.weight_ttl = weight_ttl
+        self._condition = threading.Condition()
+        self._queues: Dict[str, Deque[Tuple[float, Callable[[], None]]]] = {}
+        # Keys with queued work, in round-robin order; the first one is being served
+        self._active: Deque[str] = deque()
+        self._deficits: Dict[str, float] = {}
+        self._weights: Dict[str, Tuple[int, float]] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f'{thread_name_prefix}-{index}', daemon=True)
+            for index in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key: str, fn: Callable[[], None]) -> None:
+        """Queue fn behind the earlier work of key."""
+        weight = self._weight(key)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque()
+                self._active.append(key)
+                self._deficits[key] = 0.0
+            queue.append((time.monotonic(), fn))
+            self._stats.setdefault(key, {'started': 0, 'total_wait': 0.0, 'max_wait': 0.0})['weight'] = weight
+            self._condition.notify()
+
+    def _weight(self, key: str) -> int:
+        now = time.monotonic()
+        cached = self._weights.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        try:
+            weight = max(1, int(self.weight_of(key)))
+        except Exception as e:
+            logger.warning(f"Failed to look up the scheduling weight of {key!r}: {e}")
+            weight = cached[0] if cached else 1
+        self._weights[key] = (weight, now + self.weight_ttl)
+        return weight
+
+    def _next(self) -> Tuple[str, float, Callable[[], None]]:
+        """Take the next item of the key being served; called with the condition held and work queued."""
+        key = self._active[0]
+        queue = self._queues[key]
+        if self._deficits[key] < 1:
+            self._deficits[key] += self._stats[key]['weight']
+        enqueued_at, fn = queue.popleft()
+        self._deficits[key] -= 1
+        if not queue:
+            # A key without queued work banks no credit for later
+            self._active.popleft()
+            del self._queues[key]
+            del self._deficits[key]
+        elif self._deficits[key] < 1:
+            self._active.rotate(-1)
+        return key, enqueued_at, fn
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._active and not self._shutdown:
+                    self._condition.wait()
+                if not self._active:
+                    return
+                key, enqueued_at, fn = self._next()
+                waited = time.monotonic() - enqueued_at
+                stats = self._stats[key]
+                stats['started'] += 1
+                stats['total_wait'] += waited
+                stats['max_wait'] = max(stats['max_wait'], waited)
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"Scheduled work of {key!r} failed: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Queued and started items and the seconds they waited, per key."""
+        now = time.monotonic()
+        with self._condition:
+            return {
+                key: {
+                    'weight': stats['weight'],
+                    'queued': len(self._queues.get(key, ())),
+                    'started': stats['started'],
+                    'average_wait': stats['total_wait'] / stats['started'] if stats['started'] else 0.0,
+                    'max_wait': stats['max_wait'],
+                    'oldest_wait': now - self._queues[key][0][0] if key in self._queues else 0.0
+                }
+                for key, stats in self._stats.items()
+            }
+
+    def shutdown(self, wait: bool = True, cancel_queued: bool = False) -> None:
+        """Stop accepting work; the threads finish the queued work unless it is cancelled."""
+        with self._condition:
+            self._shutdown = True
+            if cancel_queued:
+                self._queues.clear()
+                self._active.clear()
+                self._deficits.clear()
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,138 @@
+# llmchatlinker/supervisor.py
+
+import os
+import time
+import signal
+import logging
+import subprocess
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds a stopping process gets to finish its in-flight work before it is killed
+SUPERVISOR_GRACEFUL_TIMEOUT = float(os.getenv('SUPERVISOR_GRACEFUL_TIMEOUT', 30))
+# Seconds before a process that exited is started again, so a crashing process does not spin
+SUPERVISOR_RESTART_DELAY = float(os.getenv('SUPERVISOR_RESTART_DELAY', 1))
+
+class ManagedProcess:
+    """One slot of a role; its process is replaced whenever it exits or the supervisor reloads"""
+
+    def __init__(self, role: str, index: int, command: List[str]):
+        self.role = role
+        self.index = index
+        self.command = command
+        self.process: Optional[subprocess.Popen] = None
+        self.exited_at: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.role}-{self.index}"
+
+class Supervisor:
+    """Keeps a number of processes of each role running, restarting them as they exit
+
+    SIGHUP replaces the processes one at a time, starting each replacement before the old process is
+    stopped. SIGTERM and SIGINT stop them all, giving each the graceful timeout to finish.
+    """
+
+    def __init__(
+        self,
+        roles: Dict[str, Tuple[List[str], int]],
+        env: Optional[Dict[str, str]] = None,
+        pass_fds: Sequence[int] = (),
+        graceful_timeout: float = SUPERVISOR_GRACEFUL_TIMEOUT,
+        restart_delay: float = SUPERVISOR_RESTART_DELAY,
+        poll_interval: float = 0.5
+    ):
+        self.slots = [
+            ManagedProcess(role, index, command)
+            for role, (command, count) in roles.items()
+            for index in range(count)
+        ]
+        self.env = env
+        self.pass_fds = tuple(pass_fds)
+        self.graceful_timeout = graceful_timeout
+        self.restart_delay = restart_delay
+        self.poll_interval = poll_interval
+        self._reload_requested = False
+        self._stop_requested = False
+
+    def _spawn(self, slot: ManagedProcess) -> subprocess.Popen:
+        process = subprocess.Popen(slot.command, env=self.env, pass_fds=self.pass_fds)
+        logger.info(f"Started {slot.name} (pid {process.pid})")
+        return process
+
+    def _terminate(self, slot: ManagedProcess, process: subprocess.Popen) -> None:
+        """Ask a process to stop and kill it if it is still running after the graceful timeout."""
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(self.graceful_timeout)
+            except subprocess.TimeoutExpired:
+                logger.warning(f"{slot.name} (pid {process.pid}) did not stop in {self.graceful_timeout}s; killing it")
+                process.kill()
+                process.wait()
+        logger.info(f"Stopped {slot.name} (pid {process.pid})")
+
+    def start(self) -> None:
+        for slot in self.slots:
+            slot.process = self._spawn(slot)
+
+    def check(self) -> None:
+        """Restart the processes that exited at least restart_delay seconds ago."""
+        now = time.monotonic()
+        for slot in self.slots:
+            if slot.process is None or slot.process.poll() is None:
+                continue
+            if slot.exited_at is None:
+                slot.exited_at = now
+                logger.warning(f"{slot.name} (pid {slot.process.pid}) exited with code {slot.process.returncode}")
+            if now - slot.exited_at >= self.restart_delay:
+                slot.exited_at = None
+                slot.process = self._spawn(slot)
+
+    def reload(self) -> None:
+        """Replace every process, one at a time, so each role keeps serving throughout."""
+        logger.info("Reloading processes")
+        for slot in self.slots:
+            old = slot.process
+            slot.exited_at = None
+            slot.process = self._spawn(slot)
+            if old is not None:
+                self._terminate(slot, old)
+
+    def stop(self) -> None:
+        """Stop all processes; they share the graceful timeout rather than waiting for each other."""
+        running = [(slot, slot.process) for slot in self.slots if slot.process is not None and slot.process.poll() is None]
+        for _, process in running:
+            process.terminate()
+        deadline = time.monotonic() + self.graceful_timeout
+        for slot, process in running:
+            try:
+                process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"{slot.name} (pid {process.pid}) did not stop in {self.graceful_timeout}s; killing it")
+                process.kill()
+                process.wait()
+
+    def request_reload(self, *args) -> None:
+        self._reload_requested = True
+
+    def request_stop(self, *args) -> None:
+        self._stop_requested = True
+
+    def run(self) -> None:
+        """Start the processes and supervise them until SIGTERM or SIGINT."""
+        signal.signal(signal.SIGHUP, self.request_reload)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        self.start()
+        try:
+            while not self._stop_requested:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self.reload()
+                self.check()
+                time.sleep(self.poll_interval)
+        finally:
+            self.stop()
@@ -0,0 +1,40 @@
+# llmchatlinker/sync.py
+
+import os
+import base64
+import datetime
+from typing import Any, Dict, Optional
+
+# Seconds of changes sent again by the next sync, covering transactions that commit after
+# later-stamped rows and clock differences between orchestrator processes
+SYNC_OVERLAP_SECONDS = float(os.getenv('SYNC_OVERLAP_SECONDS', 5))
+
+def next_sync_token() -> str:
+    """Token to continue from on the next sync; taken before reading, so nothing falls between syncs"""
+    return encode_sync_token(datetime.datetime.now() - datetime.timedelta(seconds=SYNC_OVERLAP_SECONDS))
+
+def encode_sync_token(position: datetime.datetime) -> str:
+    return base64.urlsafe_b64encode(position.isoformat().encode()).decode()
+
+def decode_sync_token(token: str) -> datetime.datetime:
+    try:
+        return datetime.datetime.fromisoformat(base64.urlsafe_b64decode(token.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid sync_token")
+
+def read_sync_position(data: Optional[Dict[str, Any]]) -> Optional[datetime.datetime]:
+    """Time a listing returns changes after, from sync_token or updated_since; None for a full listing
+
+    Raises ValueError for a malformed position.
+    """
+    data = data or {}
+    if data.get('sync_token'):
+        return decode_sync_token(data['sync_token'])
+    if not data.get('updated_since'):
+        return None
+    try:
+        since = datetime.datetime.fromisoformat(data['updated_since'])
+    except (TypeError, ValueError):
+        raise ValueError("updated_since must be an ISO 8601 timestamp")
+    # Rows are stamped in the orchestrator's local time
+    return since.astimezone().replace(tzinfo=None) if since.tzinfo else since
@@ -3,6 +3,8 @@
 import logging
 from typing import Dict, Any, List, Optional
 from .database_manage_unit import DatabaseManageUnit, NotFoundError, ValidationError
+from ..versions import CHATS_VERSION
+from ..sync import read_sync_position, next_sync_token
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +19,8 @@ class ChatManageUnit:
             'CHAT_DELETE': self.delete_chat,
             'CHAT_LOAD': self.get_chat,
             'CHAT_LIST': self.list_chats,
-            'CHAT_LIST_BY_USER': self.list_chats_by_user
+            'CHAT_LIST_BY_USER': self.list_chats_by_user,
+            'CHAT_MESSAGE_LIST': self.list_messages
         }
 
     def handle_instruction(self, instruction_type: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -81,10 +84,22 @@ class ChatManageUnit:
             return self._error_response(f"Failed to delete chat: {str(e)}")
     
     def list_chats(self, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """List all chats"""
+        """List all chats, or those changed since updated_since / sync_token, with the version of the list"""
         try:
-            chat_data = self.db.get_all_chats()
-            return self._success_response("Chats retrieved successfully", {"chats": chat_data})
+            since = read_sync_position(data)
+            fields = self.db.select_fields('chats', (data or {}).get('fields'), (data or {}).get('view'))
+            # Read first, so a concurrent change can only make the version and token older than the list
+            version = self.db.get_entity_version(CHATS_VERSION)
+            sync_token = next_sync_token()
+            if since is None:
+                result = {"chats": self.db.get_all_chats(fields)}
+            else:
+                changes = self.db.get_changes('chats', since, fields=fields)
+                result = {"chats": changes['changed'], "deleted": changes['deleted']}
+            result.update(sync_token=sync_token, version=version)
+            return self._success_response("Chats retrieved successfully", result)
+        except ValueError as e:
+            return self._error_response(str(e))
         except Exception as e:
             return self._error_response(f"Failed to list chats: {str(e)}")
 
@@ -94,20 +109,55 @@ class ChatManageUnit:
             return self._error_response("User ID is required")
 
         try:
-            chat_data = self.db.get_chats_by_user(data['user_id'])
-            return self._success_response(f"Chats retrieved for user {data['user_id']}", {"chats": chat_data})
+            since = read_sync_position(data)
+            fields = self.db.select_fields('chats', data.get('fields'), data.get('view'))
+            version = self.db.get_entity_version(CHATS_VERSION)
+            sync_token = next_sync_token()
+            if since is None:
+                result = {"chats": self.db.get_chats_by_user(data['user_id'], fields)}
+            else:
+                changes = self.db.get_changes('chats', since, user_public_id=data['user_id'], fields=fields)
+                result = {"chats": changes['changed'], "deleted": changes['deleted']}
+            result.update(sync_token=sync_token, version=version)
+            return self._success_response(f"Chats retrieved for user {data['user_id']}", result)
+        except ValueError as e:
+            return self._error_response(str(e))
         except Exception as e:
             return self._error_response(f"Failed to list user chats: {str(e)}")
 
+    def list_messages(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """List a chat's messages, or those changed since updated_since / sync_token"""
+        if not self._validate_data(data, ['chat_id']):
+            return self._error_response("Chat ID is required")
+
+        try:
+            since = read_sync_position(data)
+            fields = self.db.select_fields('messages', data.get('fields'), data.get('view'))
+            version = self.db.get_entity_version(CHATS_VERSION)
+            sync_token = next_sync_token()
+            if since is None:
+                result = {"messages": self.db.get_messages_by_chat(data['chat_id'], fields)}
+            else:
+                changes = self.db.get_changes('messages', since, chat_public_id=data['chat_id'], fields=fields)
+                result = {"messages": changes['changed'], "deleted": changes['deleted']}
+            result.update(sync_token=sync_token, version=version)
+            return self._success_response(f"Messages retrieved for chat {data['chat_id']}", result)
+        except ValueError as e:
+            return self._error_response(str(e))
+        except Exception as e:
+            return self._error_response(f"Failed to list chat messages: {str(e)}")
+
     def get_chat(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Get chat details"""
+        """Get chat details, optionally limited to fields or a view"""
         if not self._validate_data(data, ['chat_id']):
             return self._error_response("Chat ID is required")
 
         try:
             public_id = data['chat_id']
-            chat_data = self.db.get_chat_by_public_id(public_id)
-            return self._success_response("Chat loaded successfully", {"chat": chat_data})
+            fields = self.db.select_fields('chats', data.get('fields'), data.get('view'))
+            version = self.db.get_entity_version(CHATS_VERSION)
+            chat_data = self.db.get_chat_by_public_id(public_id, fields)
+            return self._success_response("Chat loaded successfully", {"chat": chat_data, "version": version})
         except NotFoundError as e:
             return self._error_response(str(e))
         except Exception as e:
@@ -6,6 +6,8 @@ from .database_manage_unit import DatabaseManageUnit, NotFoundError, ValidationE
 from .user_manage_unit import UserManageUnit
 from .chat_manage_unit import ChatManageUnit
 from .llm_manage_unit import LLMManageUnit
+from ..cancellation import CancellationToken
+from ..scheduler import FairScheduler
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -18,22 +20,29 @@ class ControlUnit:
         user_manage_unit: UserManageUnit,
         chat_manage_unit: ChatManageUnit,
         llm_manage_unit: LLMManageUnit,
-        database_manage_unit: DatabaseManageUnit
+        database_manage_unit: DatabaseManageUnit,
+        scheduler: Optional[FairScheduler] = None
     ):
-        """Initialize with all management units"""
+        """Initialize with all management units and the scheduler running the instructions, if any"""
+        self.scheduler = scheduler
         self.handlers: Dict[str, Callable] = {
             'USER_': user_manage_unit.handle_instruction,
             'CHAT_': chat_manage_unit.handle_instruction,
             'LLM_': llm_manage_unit.handle_instruction,
             # 'INSTRUCTION_': database_manage_unit.handle_instruction
         }
+        if scheduler is not None:
+            self.handlers['SCHEDULER_'] = self._handle_scheduler_instruction
+        # Only LLM generations run long enough to be worth cancelling
+        self.cancellable_prefixes = ('LLM_',)
 
-    def decode_and_execute_instruction(self, instruction: Dict[str, Any]) -> Dict[str, Any]:
+    def decode_and_execute_instruction(self, instruction: Dict[str, Any], cancelled: Optional[CancellationToken] = None) -> Dict[str, Any]:
         """
         Decode and execute the given instruction by routing to appropriate handler
         
         Args:
             instruction: Dictionary containing instruction type and data
+            cancelled: Token set when the caller cancels the instruction
             
         Returns:
             Dict containing execution status and result
@@ -52,6 +61,8 @@ class ControlUnit:
                 return self._error_response(f"No handler found for instruction type: {instruction_type}")
 
             # Execute instruction
+            if cancelled is not None and instruction_type.startswith(self.cancellable_prefixes):
+                return handler(instruction_type, data, cancelled)
             return handler(instruction_type, data)
 
         except (NotFoundError, ValidationError) as e:
@@ -76,6 +87,12 @@ class ControlUnit:
                 return handler
         return None
 
+    def _handle_scheduler_instruction(self, instruction_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Report the per-user queues and wait times of the scheduler of this orchestrator process"""
+        if instruction_type != 'SCHEDULER_STATS':
+            return self._error_response("Invalid instruction type")
+        return self._success_response("Scheduler statistics retrieved successfully", {"users": self.scheduler.stats()})
+
     @staticmethod
     def _validate_instruction(instruction: Dict[str, Any]) -> bool:
         """
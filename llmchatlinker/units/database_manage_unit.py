@@ -1,17 +1,23 @@
 from __future__ import annotations
 import os
+import time
+import zlib
 import datetime
 import logging
 import uuid
-from typing import Optional, List, Dict, Any, TypeVar
+from typing import Optional, List, Dict, Any, TypeVar, Tuple, Callable, Sequence, Union
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine, UniqueConstraint, text, Column, Integer, String, ForeignKey, Text, DateTime, Table, Boolean
-from sqlalchemy.orm import sessionmaker, scoped_session, relationship
+from sqlalchemy import create_engine, UniqueConstraint, Index, text, Column, Integer, String, ForeignKey, Text, DateTime, Table, Boolean, Float, JSON, Date, or_, and_, func
+from sqlalchemy import inspect
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship, load_only, selectinload, noload
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from slugify import slugify
 
+from .write_behind import WriteBehindQueue
+from ..versions import USERS_VERSION, CHATS_VERSION, LLM_CONFIG_VERSION
+
 ModelType = TypeVar('ModelType')
 
 # Configure logging
@@ -46,6 +52,14 @@ class DatabaseConfig:
     POOL_TIMEOUT: int = int(os.getenv('DB_POOL_TIMEOUT', 60))
     POOL_RECYCLE: int = int(os.getenv('DB_POOL_RECYCLE', 1800))
     ECHO: bool = os.getenv('DB_ECHO', 'false').lower() == 'true'
+    # Drop and recreate every table when an orchestrator starts; the supervisor resets once and turns this off
+    RESET_ON_START: bool = os.getenv('DB_RESET_ON_START', 'true').lower() == 'true'
+    # Separate pool for connections that hold provider concurrency advisory locks
+    LOCK_POOL_SIZE: int = int(os.getenv('DB_LOCK_POOL_SIZE', 32))
+    # Journal file that keeps write-behind messages across restarts; unset keeps them in memory only
+    WRITE_BEHIND_JOURNAL: Optional[str] = os.getenv('DB_WRITE_BEHIND_JOURNAL') or None
+    # Characters of the last message kept on its chat for chat lists
+    CHAT_PREVIEW_LENGTH: int = int(os.getenv('DB_CHAT_PREVIEW_LENGTH', 100))
 
     @classmethod
     def validate(cls) -> None:
@@ -63,7 +77,8 @@ class BaseModel(Base):
     public_id = Column(String(36), unique=True, nullable=False, index=True, default=lambda: str(uuid.uuid4()))
     slug = Column(String(100), unique=True, nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.datetime.now, nullable=False)
-    updated_at = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now, nullable=False)
+    # Indexed for change feeds, which read updated_at ranges
+    updated_at = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now, nullable=False, index=True)
     is_active = Column(Boolean, default=True, nullable=False)
 
     def __init__(self, **kwargs):
@@ -102,6 +117,10 @@ class User(BaseModel):
     display_name = Column(String(50), nullable=False)
     profile = Column(Text)
     record_instructions = Column(Boolean, default=False)
+    # Prompt plus completion tokens the user may spend per day; no limit when unset
+    daily_token_quota = Column(Integer)
+    # Scheduling tier of the user's instructions; the default tier when unset
+    priority_tier = Column(String(20))
     chats = relationship(
         'Chat',
         secondary=user_chats,
@@ -117,8 +136,18 @@ class Provider(BaseModel):
     __tablename__ = 'providers'
     
     name = Column(String(100), unique=True, nullable=False, index=True)
+    # Provider API shape, see llmchatlinker.providers.adapters
+    kind = Column(String(30), nullable=False, default='openai')
     api_endpoint = Column(String(255), nullable=False)
     api_key = Column(String(255))
+    # Optional list of {"url": ..., "weight": ...} replicas served behind this provider
+    endpoints = Column(JSON, default=list)
+    requests_per_minute = Column(Integer)
+    tokens_per_minute = Column(Integer)
+    max_concurrency = Column(Integer)
+    # Concurrent calls to one model are collected for up to batch_window_ms into one batch request
+    batch_window_ms = Column(Integer)
+    batch_max_size = Column(Integer)
     llms = relationship('LLM', back_populates='provider', cascade='all, delete-orphan')
     
     def generate_slug(self, **kwargs) -> str:
@@ -129,6 +158,10 @@ class LLM(BaseModel):
     
     name = Column(String(100), nullable=False, index=True)
     provider_id = Column(Integer, ForeignKey('providers.id'), nullable=False)
+    # Ordered public IDs of equivalent LLMs (usually on other providers) to fail over to
+    fallback_llm_ids = Column(JSON, default=list)
+    # Default max_tokens, temperature, stop and connect/read timeouts; requests may override each one
+    generation_params = Column(JSON, default=dict)
     provider = relationship('Provider', back_populates='llms')
 
     # Add unique constraint across name + provider_id
@@ -144,6 +177,10 @@ class Chat(BaseModel):
     __tablename__ = 'chats'
     
     title = Column(String(100), nullable=False, index=True)
+    # Summary for chat lists, kept up to date by the transactions that create, edit and delete messages
+    message_count = Column(Integer, nullable=False, default=0)
+    last_message_preview = Column(String(255))
+    last_activity_at = Column(DateTime, default=datetime.datetime.now, nullable=False, index=True)
     users = relationship(
         'User',
         secondary=user_chats,
@@ -163,15 +200,31 @@ class Message(BaseModel):
     chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     llm_id = Column(Integer, ForeignKey('llms.id'))
+    # The user message an assistant message answers; alternative answers share a parent
+    parent_id = Column(Integer, ForeignKey('messages.id'), index=True)
     content = Column(Text, nullable=False)
     role = Column(String(20), nullable=False)
+    # Position of a regenerated answer among the candidates produced by the same request
+    rank = Column(Integer)
+    # Provider-reported usage and wall-clock latency of an assistant message
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    latency_ms = Column(Integer)
     
     user = relationship('User')
     chat = relationship('Chat', back_populates='messages')
     llm = relationship('LLM')
+    parent = relationship('Message', remote_side='Message.id')
+
+    # History is always read as a created_at range within one chat, and changes as an updated_at range
+    __table_args__ = (
+        Index('ix_messages_chat_created', 'chat_id', 'created_at'),
+        Index('ix_messages_chat_updated', 'chat_id', 'updated_at'),
+    )
     
     def generate_slug(self, **kwargs) -> str:
-        return self.slugify(f"msg-{datetime.datetime.now().timestamp()}")
+        # Sibling answers are created in bursts, so the timestamp alone is not unique
+        return self.slugify(f"msg-{datetime.datetime.now().timestamp()}-{uuid.uuid4().hex[:8]}")
 
 class InstructionRecord(BaseModel):
     __tablename__ = 'instruction_records'
@@ -186,9 +239,131 @@ class InstructionRecord(BaseModel):
     def generate_slug(self, **kwargs) -> str:
         return self.slugify(f"instr-{datetime.datetime.now().timestamp()}")
 
+class Job(BaseModel):
+    __tablename__ = 'jobs'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    instruction = Column(String(100), nullable=False)
+    # queued -> running -> succeeded | failed
+    status = Column(String(20), nullable=False, default='queued', index=True)
+    progress = Column(Float, nullable=False, default=0.0)
+    request = Column(JSON)
+    result = Column(JSON)
+    error = Column(Text)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    
+    user = relationship('User')
+    
+    def generate_slug(self, **kwargs) -> str:
+        return self.slugify(f"job-{datetime.datetime.now().timestamp()}-{uuid.uuid4().hex[:8]}")
+
+class UsageStat(Base):
+    """Daily usage counters per user and LLM, maintained as assistant messages are stored."""
+    __tablename__ = 'usage_stats'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    llm_id = Column(Integer, ForeignKey('llms.id'), nullable=False, index=True)
+    day = Column(Date, nullable=False, index=True)
+    requests = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False, default=0)
+
+    user = relationship('User')
+    llm = relationship('LLM')
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'llm_id', 'day', name='uix_usage_user_llm_day'),
+    )
+
+class EntityVersion(Base):
+    """Change counters, bumped in the same transaction as every change they cover."""
+    __tablename__ = 'entity_versions'
+
+    name = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class RateLimitBucket(Base):
+    """Token bucket state shared by all orchestrator processes."""
+    __tablename__ = 'rate_limit_buckets'
+
+    key = Column(String(255), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    refreshed_at = Column(Float, nullable=False)
+
+class IdempotencyRecord(Base):
+    """Claim on an Idempotency-Key and, once its instruction succeeded, the result returned to repeats."""
+    __tablename__ = 'idempotency_records'
+
+    key = Column(String(255), primary_key=True)
+    # Hash of the instruction type and data, so a key reused for another request is refused
+    fingerprint = Column(String(64), nullable=False)
+    status = Column(String(20), nullable=False, default='pending')
+    result = Column(JSON)
+    # A pending claim expires when its execution is presumed dead, a completed one when the result is forgotten
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+# Model attributes each dictionary key is built from, for the entities whose reads accept fields / view
+ENTITY_FIELDS = {
+    'users': {
+        'user_id': ('public_id',),
+        'username': ('username',),
+        'display_name': ('display_name',),
+        'profile': ('profile',),
+        'record_instructions': ('record_instructions',),
+        'daily_token_quota': ('daily_token_quota',),
+        'priority_tier': ('priority_tier',),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',)
+    },
+    'chats': {
+        'chat_id': ('public_id',),
+        'title': ('title',),
+        'users': ('users',),
+        'messages': ('messages',),
+        'message_count': ('message_count',),
+        'last_message_preview': ('last_message_preview',),
+        'last_activity_at': ('last_activity_at',),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',)
+    },
+    'messages': {
+        'message_id': ('public_id',),
+        'chat_id': ('chat_id', 'chat'),
+        'user_id': ('user_id', 'user'),
+        'llm_id': ('llm_id', 'llm'),
+        'parent_message_id': ('parent_id', 'parent'),
+        'content': ('content',),
+        'role': ('role',),
+        'rank': ('rank',),
+        'prompt_tokens': ('prompt_tokens',),
+        'completion_tokens': ('completion_tokens',),
+        'latency_ms': ('latency_ms',),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',)
+    }
+}
+# Fields of view=summary; view=full returns every field
+SUMMARY_FIELDS = {
+    'users': ('user_id', 'username', 'display_name'),
+    'chats': ('chat_id', 'title', 'message_count', 'last_message_preview', 'last_activity_at', 'created_at', 'updated_at'),
+    'messages': ('message_id', 'chat_id', 'user_id', 'llm_id', 'parent_message_id', 'role', 'rank', 'created_at')
+}
+
 class DatabaseManageUnit:
     """Core database management class implementing the Repository pattern."""
     
+    # Model, dictionary converter and ID key of the entities with change feeds, see get_changes
+    SYNC_ENTITIES = {
+        'users': (User, '_user_to_dict', 'user_id'),
+        'chats': (Chat, '_chat_to_dict', 'chat_id'),
+        'providers': (Provider, '_provider_to_dict', 'provider_id'),
+        'llms': (LLM, '_llm_to_dict', 'llm_id'),
+        'messages': (Message, '_message_to_dict', 'message_id')
+    }
+    
     def __init__(self) -> None:
         """Initialize database connection and session factory."""
         DatabaseConfig.validate()
@@ -202,19 +377,39 @@ class DatabaseManageUnit:
             echo=DatabaseConfig.ECHO
         )
         self.Session = scoped_session(sessionmaker(bind=self.engine))
+        self._lock_engine = None
+        # Messages written after the reply; reads of messages and usage wait for them first
+        self.write_behind = WriteBehindQueue(
+            self._write_message_record,
+            journal_path=DatabaseConfig.WRITE_BEHIND_JOURNAL,
+            fatal_errors=(NotFoundError, ValidationError)
+        )
+        # Called with the name and new value of every version counter bumped by a committed transaction
+        self.on_version_change: Optional[Callable[[str, int], None]] = None
+        # Called with 'created', 'updated' or 'deleted' and the message of every committed message change
+        self.on_message_change: Optional[Callable[[str, Dict[str, Any]], None]] = None
 
     @contextmanager
     def session_scope(self):
         """Provide a transactional scope around a series of operations."""
         session = self.Session()
+        changed_versions = changed_messages = None
         try:
             yield session
             session.commit()
+            changed_versions = session.info.pop('changed_versions', None)
+            changed_messages = session.info.pop('changed_messages', None)
         except Exception:
+            session.info.pop('changed_versions', None)
+            session.info.pop('changed_messages', None)
             session.rollback()
             raise
         finally:
             self.Session.remove()
+        if changed_versions:
+            self._announce_versions(changed_versions)
+        if changed_messages:
+            self._announce_messages(changed_messages)
 
     def init_db(self):
         """Initialize database schema."""
@@ -222,6 +417,11 @@ class DatabaseManageUnit:
             with self.engine.connect() as connection:
                 # Drop tables in correct order to handle dependencies
                 for table in [
+                    "entity_versions",
+                    "idempotency_records",
+                    "usage_stats",
+                    "rate_limit_buckets",
+                    "jobs",
                     "user_chats",
                     "instruction_records",
                     "messages",
@@ -247,15 +447,34 @@ class DatabaseManageUnit:
             entity.is_active = False
             session.add(entity)
 
-    def create_user(self, username: str, display_name: str, profile: str) -> Dict[str, Any]:
+    def create_user(
+        self,
+        username: str,
+        display_name: str,
+        profile: str,
+        daily_token_quota: Optional[int] = None,
+        priority_tier: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Create a user and return as dictionary."""
         with self.session_scope() as session:
-            new_user = User(username=username, display_name=display_name, profile=profile, is_active=True)
+            new_user = User(
+                username=username, display_name=display_name, profile=profile, daily_token_quota=daily_token_quota or None,
+                priority_tier=priority_tier or None, is_active=True
+            )
             session.add(new_user)
             session.flush()  # Ensures new_user.public_id is available
+            self._bump_version(session, USERS_VERSION)
             return self._user_to_dict(new_user)
     
-    def update_user(self, public_id: str, username: Optional[str] = None, display_name: Optional[str] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+    def update_user(
+        self,
+        public_id: str,
+        username: Optional[str] = None,
+        display_name: Optional[str] = None,
+        profile: Optional[str] = None,
+        daily_token_quota: Optional[int] = None,
+        priority_tier: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Update a user and return as dictionary."""
         with self.session_scope() as session:
             user = session.query(User).filter_by(public_id=public_id, is_active=True).first()
@@ -268,7 +487,14 @@ class DatabaseManageUnit:
                 user.display_name = display_name
             if profile is not None:
                 user.profile = profile
+            if daily_token_quota is not None:
+                # 0 removes the quota
+                user.daily_token_quota = daily_token_quota or None
+            if priority_tier is not None:
+                # '' returns the user to the default tier
+                user.priority_tier = priority_tier or None
             session.add(user)
+            self._bump_versions(session, USERS_VERSION, CHATS_VERSION)
             return self._user_to_dict(user)
     
     def delete_user(self, public_id: str) -> None:
@@ -278,25 +504,28 @@ class DatabaseManageUnit:
             if not user:
                 raise NotFoundError("User not found")
             
+            self._bump_versions(session, USERS_VERSION, CHATS_VERSION)
             self.soft_delete(user)
     
-    def get_user_by_public_id(self, public_id: str) -> Optional[Dict[str, Any]]:
-        """Get user by public_id as dictionary."""
+    def get_user_by_public_id(self, public_id: str, fields: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """Get user by public_id as dictionary, limited to fields if given."""
         with self.session_scope() as session:
-            user = session.query(User).filter_by(public_id=public_id, is_active=True).first()
-            return self._user_to_dict(user) if user else None
+            user = session.query(User).options(*self._projection(User, 'users', fields))\
+                .filter_by(public_id=public_id, is_active=True).first()
+            return self._user_to_dict(user, fields) if user else None
     
-    def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
-        """Get user by username as dictionary."""
+    def get_user_by_username(self, username: str, fields: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """Get user by username as dictionary, limited to fields if given."""
         with self.session_scope() as session:
-            user = session.query(User).filter_by(username=username.lower(), is_active=True).first()
-            return self._user_to_dict(user) if user else None
+            user = session.query(User).options(*self._projection(User, 'users', fields))\
+                .filter_by(username=username.lower(), is_active=True).first()
+            return self._user_to_dict(user, fields) if user else None
     
-    def get_all_users(self) -> List[Dict[str, Any]]:
-        """Get all active users as dictionaries."""
+    def get_all_users(self, fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Get all active users as dictionaries, limited to fields if given."""
         with self.session_scope() as session:
-            users = session.query(User).filter_by(is_active=True).all()
-            return [self._user_to_dict(user) for user in users]
+            users = session.query(User).options(*self._projection(User, 'users', fields)).filter_by(is_active=True).all()
+            return [self._user_to_dict(user, fields) for user in users]
 
     def create_chat(self, title: str, user_public_ids: List[str]) -> Dict[str, Any]:
         """Create a chat with users and return as dictionary."""
@@ -308,6 +537,7 @@ class DatabaseManageUnit:
                     chat.users.append(user)
             session.add(chat)
             session.flush()
+            self._bump_version(session, CHATS_VERSION)
             return self._chat_to_dict(chat)
     
     def update_chat(self, public_id: str, title: str) -> Dict[str, Any]:
@@ -319,6 +549,7 @@ class DatabaseManageUnit:
             
             chat.title = title
             session.add(chat)
+            self._bump_version(session, CHATS_VERSION)
             return self._chat_to_dict(chat)
     
     def delete_chat(self, public_id: str) -> None:
@@ -328,29 +559,31 @@ class DatabaseManageUnit:
             if not chat:
                 raise NotFoundError("Chat not found")
             
+            self._bump_version(session, CHATS_VERSION)
             self.soft_delete(chat)
     
-    def get_chat_by_public_id(self, public_id: str) -> Optional[Dict[str, Any]]:
-        """Get chat by public_id as dictionary."""
+    def get_chat_by_public_id(self, public_id: str, fields: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """Get chat by public_id as dictionary, limited to fields if given."""
         with self.session_scope() as session:
-            chat = session.query(Chat).filter_by(public_id=public_id, is_active=True).first()
-            return self._chat_to_dict(chat) if chat else None
+            chat = session.query(Chat).options(*self._projection(Chat, 'chats', fields))\
+                .filter_by(public_id=public_id, is_active=True).first()
+            return self._chat_to_dict(chat, fields) if chat else None
     
-    def get_chats_by_user(self, user_public_id: str) -> Optional[Dict[str, Any]]:
-        """Get all chats for a user as dictionaries."""
+    def get_chats_by_user(self, user_public_id: str, fields: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """Get the active chats of a user as dictionaries, most recently active first, limited to fields if given."""
         with self.session_scope() as session:
-            user = session.query(User).filter_by(public_id=user_public_id, is_active=True).first()
-            if not user:
-                return []
-            
-            chats = (session.query(Chat).join(Chat.users).filter(User.id == user.id).all())
-            return [self._chat_to_dict(chat) for chat in chats]
+            chats = session.query(Chat).options(*self._projection(Chat, 'chats', fields))\
+                .join(user_chats, user_chats.c.chat_id == Chat.id)\
+                .join(User, User.id == user_chats.c.user_id)\
+                .filter(User.public_id == user_public_id, User.is_active == True, Chat.is_active == True)\
+                .order_by(Chat.last_activity_at.desc(), Chat.id.desc()).all()
+            return [self._chat_to_dict(chat, fields) for chat in chats]
     
-    def get_all_chats(self) -> List[Dict[str, Any]]:
-        """Get all active chats as dictionaries."""
+    def get_all_chats(self, fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Get all active chats as dictionaries, limited to fields if given."""
         with self.session_scope() as session:
-            chats = session.query(Chat).filter_by(is_active=True).all()
-            return [self._chat_to_dict(chat) for chat in chats]
+            chats = session.query(Chat).options(*self._projection(Chat, 'chats', fields)).filter_by(is_active=True).all()
+            return [self._chat_to_dict(chat, fields) for chat in chats]
 
     def add_users_to_chat(self, chat_public_id: str, user_public_ids: List[str]) -> None:
         """Add users to a chat."""
@@ -363,21 +596,61 @@ class DatabaseManageUnit:
                 user = session.query(User).filter_by(public_id=public_id, is_active=True).first()
                 if user:
                     chat.users.append(user)
+            # Membership lives in user_chats, so the chat is touched for change feeds
+            chat.updated_at = datetime.datetime.now()
             session.add(chat)
+            self._bump_version(session, CHATS_VERSION)
     
-    def add_provider(self, name: str, api_endpoint: str, api_key: Optional[str] = None) -> Dict[str, Any]:
+    def add_provider(
+        self,
+        name: str,
+        api_endpoint: str,
+        api_key: Optional[str] = None,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        endpoints: Optional[List[Dict[str, Any]]] = None,
+        kind: Optional[str] = None,
+        batch_window_ms: Optional[int] = None,
+        batch_max_size: Optional[int] = None
+    ) -> Dict[str, Any]:
         """Add a provider and return as dictionary."""
         with self.session_scope() as session:
             existing = session.query(Provider).filter_by(name=name, is_active=True).first()
             if existing:
                 raise ValidationError(f"Provider '{name}' already exists")
             
-            provider = Provider(name=name, api_endpoint=api_endpoint, api_key=api_key)
+            provider = Provider(
+                name=name,
+                kind=kind or 'openai',
+                api_endpoint=api_endpoint,
+                api_key=api_key,
+                endpoints=self._normalize_endpoints(endpoints),
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+                max_concurrency=max_concurrency,
+                batch_window_ms=batch_window_ms or None,
+                batch_max_size=batch_max_size or None
+            )
             session.add(provider)
             session.flush()
+            self._bump_version(session, LLM_CONFIG_VERSION)
             return self._provider_to_dict(provider)
     
-    def update_provider(self, public_id: str, name: Optional[str] = None, api_endpoint: Optional[str] = None, api_key: Optional[str] = None) -> Dict[str, Any]:
+    def update_provider(
+        self,
+        public_id: str,
+        name: Optional[str] = None,
+        api_endpoint: Optional[str] = None,
+        api_key: Optional[str] = None,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        endpoints: Optional[List[Dict[str, Any]]] = None,
+        kind: Optional[str] = None,
+        batch_window_ms: Optional[int] = None,
+        batch_max_size: Optional[int] = None
+    ) -> Dict[str, Any]:
         """Update a provider and return as dictionary."""
         with self.session_scope() as session:
             provider = session.query(Provider).filter_by(public_id=public_id, is_active=True).first()
@@ -388,11 +661,42 @@ class DatabaseManageUnit:
                 provider.name = name
             if api_endpoint is not None:
                 provider.api_endpoint = api_endpoint
+            if kind is not None:
+                provider.kind = kind
             if api_key is not None:
                 provider.api_key = api_key
+            if endpoints is not None:
+                provider.endpoints = self._normalize_endpoints(endpoints)
+            # A value of 0 removes the limit
+            if requests_per_minute is not None:
+                provider.requests_per_minute = requests_per_minute or None
+            if tokens_per_minute is not None:
+                provider.tokens_per_minute = tokens_per_minute or None
+            if max_concurrency is not None:
+                provider.max_concurrency = max_concurrency or None
+            # A batch window of 0 turns batching off
+            if batch_window_ms is not None:
+                provider.batch_window_ms = batch_window_ms or None
+            if batch_max_size is not None:
+                provider.batch_max_size = batch_max_size or None
             session.add(provider)
+            self._bump_version(session, LLM_CONFIG_VERSION)
             return self._provider_to_dict(provider)
     
+    @staticmethod
+    def _normalize_endpoints(endpoints: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Validate provider endpoints and fill in default weights."""
+        normalized = []
+        for endpoint in endpoints or []:
+            url = endpoint.get('url')
+            weight = endpoint.get('weight', 1)
+            if not url:
+                raise ValidationError("Every endpoint needs a url")
+            if not isinstance(weight, (int, float)) or weight <= 0:
+                raise ValidationError(f"Endpoint weight must be positive: {url}")
+            normalized.append({'url': url, 'weight': weight})
+        return normalized
+    
     def delete_provider(self, public_id: str) -> None:
         """Delete a provider."""
         with self.session_scope() as session:
@@ -401,6 +705,7 @@ class DatabaseManageUnit:
                 raise NotFoundError("Provider not found")
             
             self.soft_delete(provider)
+            self._bump_version(session, LLM_CONFIG_VERSION)
     
     def get_provider_by_public_id(self, public_id: str) -> Optional[Dict[str, Any]]:
         """Get provider by public_id as dictionary."""
@@ -420,7 +725,13 @@ class DatabaseManageUnit:
             providers = session.query(Provider).filter_by(is_active=True).all()
             return [self._provider_to_dict(provider) for provider in providers]
     
-    def add_llm(self, name: str, provider_public_id: str) -> Dict[str, Any]:
+    def add_llm(
+        self,
+        name: str,
+        provider_public_id: str,
+        fallback_llm_ids: Optional[List[str]] = None,
+        generation_params: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """Add an LLM and return as dictionary."""
         with self.session_scope() as session:
             provider = session.query(Provider).filter_by(public_id=provider_public_id, is_active=True).first()
@@ -431,22 +742,54 @@ class DatabaseManageUnit:
             if existing:
                 raise ValidationError(f"LLM '{name}' already exists for provider '{provider.name}'")
             
-            llm = LLM(name=name, provider_id=provider.id, provider=provider)
+            if fallback_llm_ids:
+                self._validate_fallback_llms(session, fallback_llm_ids)
+            
+            llm = LLM(
+                name=name,
+                provider_id=provider.id,
+                provider=provider,
+                fallback_llm_ids=fallback_llm_ids or [],
+                generation_params=generation_params or {}
+            )
             session.add(llm)
             session.flush()
+            self._bump_version(session, LLM_CONFIG_VERSION)
             return self._llm_to_dict(llm)
     
-    def update_llm(self, public_id: str, name: str) -> Dict[str, Any]:
-        """Update an LLM and return as dictionary."""
+    def update_llm(
+        self,
+        public_id: str,
+        name: Optional[str] = None,
+        fallback_llm_ids: Optional[List[str]] = None,
+        generation_params: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Update an LLM and return as dictionary; generation_params replaces the stored settings."""
         with self.session_scope() as session:
             llm = session.query(LLM).filter_by(public_id=public_id, is_active=True).first()
             if not llm:
                 raise NotFoundError("LLM not found")
             
-            llm.name = name
+            if name is not None:
+                llm.name = name
+            if fallback_llm_ids is not None:
+                if public_id in fallback_llm_ids:
+                    raise ValidationError("An LLM cannot fall back to itself")
+                self._validate_fallback_llms(session, fallback_llm_ids)
+                llm.fallback_llm_ids = fallback_llm_ids
+            if generation_params is not None:
+                llm.generation_params = generation_params
             session.add(llm)
+            self._bump_version(session, LLM_CONFIG_VERSION)
             return self._llm_to_dict(llm)
     
+    def _validate_fallback_llms(self, session, fallback_llm_ids: List[str]) -> None:
+        """Ensure every fallback LLM exists."""
+        found = session.query(LLM.public_id).filter(LLM.public_id.in_(fallback_llm_ids), LLM.is_active == True).all()
+        missing = set(fallback_llm_ids) - {row.public_id for row in found}
+        if missing:
+            raise ValidationError(f"Fallback LLMs not found: {', '.join(sorted(missing))}")
+    
     def delete_llm(self, public_id: str) -> None:
         """Delete an LLM."""
         with self.session_scope() as session:
@@ -455,6 +798,7 @@ class DatabaseManageUnit:
                 raise NotFoundError("LLM not found")
             
             self.soft_delete(llm)
+            self._bump_version(session, LLM_CONFIG_VERSION)
     
     def get_llm_by_public_id(self, public_id: str) -> Optional[Dict[str, Any]]:
         """Get LLM by public_id as dictionary."""
@@ -484,9 +828,30 @@ class DatabaseManageUnit:
             llms = session.query(LLM).filter_by(provider_id=provider.id, is_active=True).all()
             return [self._llm_to_dict(llm) for llm in llms]
     
-    def create_message(self, chat_public_id: str, user_public_id: str, content: str, role: str, llm_public_id: str) -> Dict[str, Any]:
-        """Create a message and return as dictionary."""
+    def create_message(
+        self,
+        chat_public_id: str,
+        user_public_id: str,
+        content: str,
+        role: str,
+        llm_public_id: str,
+        parent_message_public_id: Optional[str] = None,
+        rank: Optional[int] = None,
+        usage: Optional[Dict[str, Optional[int]]] = None,
+        latency_ms: Optional[int] = None,
+        public_id: Optional[str] = None,
+        created_at: Optional[datetime.datetime] = None
+    ) -> Dict[str, Any]:
+        """Create a message, counting an assistant message's usage, and return as dictionary.
+        
+        A message whose given public_id already exists is returned as is, so retried writes are idempotent.
+        """
         with self.session_scope() as session:
+            if public_id:
+                existing = session.query(Message).filter_by(public_id=public_id).first()
+                if existing:
+                    return self._message_to_dict(existing)
+            
             chat = session.query(Chat).filter_by(public_id=chat_public_id, is_active=True).first()
             if not chat:
                 raise NotFoundError("Chat not found")
@@ -501,19 +866,89 @@ class DatabaseManageUnit:
                 if not llm:
                     raise NotFoundError("LLM not found")
             
+            parent = None
+            if parent_message_public_id:
+                parent = session.query(Message).filter_by(public_id=parent_message_public_id, chat_id=chat.id).first()
+                if not parent:
+                    raise NotFoundError("Parent message not found")
+            
             message = Message(
                 chat_id=chat.id,
                 user_id=user.id,
                 content=content,
                 role=role,
-                llm_id=llm.id if llm else None
+                llm_id=llm.id if llm else None,
+                parent_id=parent.id if parent else None,
+                rank=rank,
+                prompt_tokens=(usage or {}).get('prompt_tokens'),
+                completion_tokens=(usage or {}).get('completion_tokens'),
+                latency_ms=latency_ms
             )
+            if public_id:
+                message.public_id = public_id
+            if created_at:
+                message.created_at = created_at
             session.add(message)
             session.flush()
-            return self._message_to_dict(message)
+            self._count_chat_message(session, message)
+            self._bump_version(session, CHATS_VERSION)
+            if role == 'assistant' and llm:
+                # Counted in the same transaction, so the aggregates never drift from the messages
+                self._count_usage(session, user.id, llm.id, message)
+            return self._record_message_change(session, 'created', message)
+    
+    def create_message_behind(
+        self,
+        chat_public_id: str,
+        user_public_id: str,
+        content: str,
+        role: str,
+        llm_public_id: Optional[str],
+        parent_message_public_id: Optional[str] = None,
+        usage: Optional[Dict[str, Optional[int]]] = None,
+        latency_ms: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Queue a message for the write-behind path and return it as it will be stored.
+        
+        Its ID and creation time are fixed now, so it keeps its place in the chat however late it is written.
+        """
+        now = datetime.datetime.now()
+        record = {
+            'public_id': str(uuid.uuid4()),
+            'created_at': now.isoformat(),
+            'chat_public_id': chat_public_id,
+            'user_public_id': user_public_id,
+            'content': content,
+            'role': role,
+            'llm_public_id': llm_public_id,
+            'parent_message_public_id': parent_message_public_id,
+            'usage': usage,
+            'latency_ms': latency_ms
+        }
+        self.write_behind.submit(record['public_id'], record)
+        return {
+            'message_id': record['public_id'],
+            'chat_id': chat_public_id,
+            'user_id': user_public_id,
+            'llm_id': llm_public_id,
+            'parent_message_id': parent_message_public_id,
+            'content': content,
+            'role': role,
+            'rank': None,
+            'prompt_tokens': (usage or {}).get('prompt_tokens'),
+            'completion_tokens': (usage or {}).get('completion_tokens'),
+            'latency_ms': latency_ms,
+            'created_at': record['created_at'],
+            'updated_at': record['created_at']
+        }
+    
+    def _write_message_record(self, record: Dict[str, Any]) -> None:
+        """Apply a message queued by create_message_behind."""
+        self.create_message(**dict(record, created_at=datetime.datetime.fromisoformat(record['created_at'])))
     
     def update_message(self, public_id: str, content: str) -> Dict[str, Any]:
         """Update a message and return as dictionary."""
+        self.write_behind.flush()
         with self.session_scope() as session:
             message = session.query(Message).filter_by(public_id=public_id, is_active=True).first()
             if not message:
@@ -521,35 +956,290 @@ class DatabaseManageUnit:
             
             message.content = content
             session.add(message)
-            return self._message_to_dict(message)
+            session.flush()
+            self._refresh_chat_preview(session, message.chat_id)
+            self._bump_version(session, CHATS_VERSION)
+            return self._record_message_change(session, 'updated', message)
     
     def delete_message(self, public_id: str) -> None:
         """Delete a message."""
+        self.write_behind.flush()
         with self.session_scope() as session:
             message = session.query(Message).filter_by(public_id=public_id, is_active=True).first()
             if not message:
                 raise NotFoundError("Message not found")
             
+            session.query(Chat).filter_by(id=message.chat_id)\
+                .update({Chat.message_count: Chat.message_count - 1}, synchronize_session=False)
+            self._refresh_chat_preview(session, message.chat_id, deleted_message_id=message.id)
+            self._bump_version(session, CHATS_VERSION)
+            self._record_message_change(session, 'deleted', message)
             self.soft_delete(message)
     
-    def get_message_by_public_id(self, public_id: str) -> Optional[Dict[str, Any]]:
-        """Get message by public_id as dictionary."""
+    def get_message_by_public_id(self, public_id: str, fields: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """Get message by public_id as dictionary, limited to fields if given."""
+        self.write_behind.flush()
         with self.session_scope() as session:
-            message = session.query(Message).filter_by(public_id=public_id, is_active=True).first()
-            return self._message_to_dict(message) if message else None
+            message = session.query(Message).options(*self._projection(Message, 'messages', fields))\
+                .filter_by(public_id=public_id, is_active=True).first()
+            return self._message_to_dict(message, fields) if message else None
     
-    def get_messages_by_chat(self, chat_public_id: str) -> List[Dict[str, Any]]:
-        """Get all messages for a chat as dictionaries."""
+    def get_messages_by_chat(self, chat_public_id: str, fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Get all messages for a chat as dictionaries, limited to fields if given."""
+        self.write_behind.flush()
         with self.session_scope() as session:
             chat = session.query(Chat).filter_by(public_id=chat_public_id, is_active=True).first()
             if not chat:
                 return []
             
             messages = session.query(Message)\
+                .options(*self._projection(Message, 'messages', fields))\
                 .filter_by(chat_id=chat.id, is_active=True)\
                 .order_by(Message.created_at.asc())\
                 .all()
-            return [self._message_to_dict(message) for message in messages]
+            return [self._message_to_dict(message, fields) for message in messages]
+    
+    def _count_usage(self, session, user_id: int, llm_id: int, message: Message) -> None:
+        """Add an assistant message to its user's daily usage counters for the LLM."""
+        self._increment(session, UsageStat, dict(user_id=user_id, llm_id=llm_id, day=message.created_at.date()), {
+            'requests': 1,
+            'prompt_tokens': message.prompt_tokens or 0,
+            'completion_tokens': message.completion_tokens or 0,
+            'latency_ms': message.latency_ms or 0
+        })
+    
+    @staticmethod
+    def _preview(content: str) -> str:
+        return content[:DatabaseConfig.CHAT_PREVIEW_LENGTH]
+    
+    def _count_chat_message(self, session, message: Message) -> None:
+        """Add a new message to its chat's summary; a message written late never replaces a newer preview."""
+        session.query(Chat).filter_by(id=message.chat_id)\
+            .update({Chat.message_count: Chat.message_count + 1}, synchronize_session=False)
+        session.query(Chat).filter(Chat.id == message.chat_id, Chat.last_activity_at <= message.created_at).update({
+            Chat.last_message_preview: self._preview(message.content),
+            Chat.last_activity_at: message.created_at
+        }, synchronize_session=False)
+    
+    def _refresh_chat_preview(self, session, chat_id: int, deleted_message_id: Optional[int] = None) -> None:
+        """Take a chat's preview and last activity from its latest remaining message, or its creation if none is left."""
+        query = session.query(Message.content, Message.created_at).filter(Message.chat_id == chat_id, Message.is_active == True)
+        if deleted_message_id:
+            # Still active until the deleting transaction commits
+            query = query.filter(Message.id != deleted_message_id)
+        latest = query.order_by(Message.created_at.desc(), Message.id.desc()).first()
+        if latest:
+            values = {Chat.last_message_preview: self._preview(latest.content), Chat.last_activity_at: latest.created_at}
+        else:
+            values = {Chat.last_message_preview: None, Chat.last_activity_at: Chat.created_at}
+        session.query(Chat).filter_by(id=chat_id).update(values, synchronize_session=False)
+    
+    @staticmethod
+    def _increment(session, model, key: Dict[str, Any], amounts: Dict[str, int]) -> None:
+        """Add amounts to the counter columns of the row with key, creating the row if needed."""
+        increments = {getattr(model, column): getattr(model, column) + amount for column, amount in amounts.items()}
+        if session.query(model).filter_by(**key).update(increments, synchronize_session=False):
+            return
+        try:
+            with session.begin_nested():
+                session.add(model(**key, **amounts))
+        except IntegrityError:
+            # Another transaction created the row first
+            session.query(model).filter_by(**key).update(increments, synchronize_session=False)
+    
+    def _bump_version(self, session, name: str) -> None:
+        """Record a change to what the named version counter covers."""
+        self._increment(session, EntityVersion, {'name': name}, {'version': 1})
+        version = session.query(EntityVersion.version).filter_by(name=name).scalar()
+        session.info.setdefault('changed_versions', {})[name] = version
+    
+    def _bump_versions(self, session, *names: str) -> None:
+        for name in names:
+            self._bump_version(session, name)
+    
+    def get_changes(
+        self,
+        entity: str,
+        since: datetime.datetime,
+        user_public_id: Optional[str] = None,
+        provider_public_id: Optional[str] = None,
+        chat_public_id: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Get the users, chats, providers, llms or messages changed after since, oldest change first.
+        
+        Active rows are returned as dictionaries under 'changed' and soft-deleted rows as tombstones under 'deleted'.
+        Chats can be limited to a user's, LLMs to a provider's, and messages must be limited to a chat's.
+        Users, chats and messages can be limited to fields, see select_fields.
+        """
+        if entity not in self.SYNC_ENTITIES:
+            raise ValidationError(f"Unknown entity: {entity}")
+        model, to_dict, id_key = self.SYNC_ENTITIES[entity]
+        if entity == 'messages':
+            if not chat_public_id:
+                raise ValidationError("chat_id is required for message changes")
+            self.write_behind.flush()
+        
+        with self.session_scope() as session:
+            query = session.query(model).filter(model.updated_at > since)
+            if fields is not None:
+                # Tombstones need the ID and deletion state whatever the fields
+                query = query.options(*self._projection(model, entity, tuple(fields) + (id_key, 'updated_at'), ('is_active',)))
+            if entity == 'chats' and user_public_id:
+                query = query.join(Chat.users).filter(User.public_id == user_public_id)
+            elif entity == 'llms' and provider_public_id:
+                query = query.join(LLM.provider).filter(Provider.public_id == provider_public_id)
+            elif entity == 'messages':
+                query = query.join(Message.chat).filter(Chat.public_id == chat_public_id)
+            
+            convert = getattr(self, to_dict)
+            changes = {'changed': [], 'deleted': []}
+            for row in query.order_by(model.updated_at.asc()).all():
+                if row.is_active:
+                    changes['changed'].append(convert(row, fields) if fields is not None else convert(row))
+                else:
+                    changes['deleted'].append({id_key: row.public_id, 'deleted_at': row.updated_at.isoformat()})
+            return changes
+    
+    def select_fields(
+        self, entity: str, fields: Optional[Union[str, Sequence[str]]] = None, view: Optional[str] = None
+    ) -> Optional[Tuple[str, ...]]:
+        """Resolve a fields list (or comma-separated string) or a summary / full view to the keys to return.
+        
+        None means every key. Fields take precedence over the view.
+        """
+        if fields:
+            if isinstance(fields, str):
+                fields = [field.strip() for field in fields.split(',') if field.strip()]
+            unknown = [field for field in fields if field not in ENTITY_FIELDS[entity]]
+            if unknown:
+                raise ValidationError(f"Unknown {entity} fields: {', '.join(unknown)}")
+            return tuple(dict.fromkeys(fields))
+        if view in (None, 'full'):
+            return None
+        if view == 'summary':
+            return SUMMARY_FIELDS[entity]
+        raise ValidationError("view must be summary or full")
+    
+    @staticmethod
+    def _projection(model, entity: str, fields: Optional[Sequence[str]], extra_columns: Sequence[str] = ()) -> list:
+        """Loader options that load only the columns and relationships the fields are built from."""
+        if fields is None:
+            return []
+        attributes = set(extra_columns)
+        for field in fields:
+            attributes.update(ENTITY_FIELDS[entity].get(field, ()))
+        mapper = inspect(model)
+        options = [load_only(*[getattr(model, key) for key in mapper.column_attrs.keys() if key in attributes])]
+        for relation in mapper.relationships:
+            attribute = getattr(model, relation.key)
+            options.append(selectinload(attribute) if relation.key in attributes else noload(attribute))
+        return options
+    
+    def _record_message_change(self, session, action: str, message: Message) -> Dict[str, Any]:
+        """Remember a message change for on_message_change once committed; returns the message as dictionary."""
+        message_data = self._message_to_dict(message)
+        session.info.setdefault('changed_messages', []).append((action, message_data))
+        return message_data
+    
+    def _announce_messages(self, changed_messages: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Pass committed message changes to on_message_change; a failing listener never fails the change."""
+        if self.on_message_change is None:
+            return
+        for action, message_data in changed_messages:
+            try:
+                self.on_message_change(action, message_data)
+            except Exception as e:
+                logger.warning(f"Failed to announce {action} message {message_data['message_id']}: {e}")
+    
+    def _announce_versions(self, changed_versions: Dict[str, int]) -> None:
+        """Pass committed version changes to on_version_change; a failing listener never fails the change."""
+        if self.on_version_change is None:
+            return
+        for name, version in changed_versions.items():
+            try:
+                self.on_version_change(name, version)
+            except Exception as e:
+                logger.warning(f"Failed to announce version {version} of {name}: {e}")
+    
+    def get_entity_version(self, name: str) -> int:
+        """Get the current value of a version counter; 0 if nothing has changed yet."""
+        with self.session_scope() as session:
+            version = session.query(EntityVersion.version).filter_by(name=name).scalar()
+            return version or 0
+    
+    def get_usage_stats(
+        self,
+        user_public_id: Optional[str] = None,
+        llm_public_id: Optional[str] = None,
+        since: Optional[datetime.date] = None,
+        until: Optional[datetime.date] = None
+    ) -> List[Dict[str, Any]]:
+        """Get daily usage counters, optionally filtered by user, LLM and an inclusive day range."""
+        self.write_behind.flush()
+        with self.session_scope() as session:
+            query = session.query(UsageStat, User.public_id, LLM.public_id, LLM.name)\
+                .join(User, UsageStat.user_id == User.id)\
+                .join(LLM, UsageStat.llm_id == LLM.id)
+            if user_public_id:
+                query = query.filter(User.public_id == user_public_id)
+            if llm_public_id:
+                query = query.filter(LLM.public_id == llm_public_id)
+            if since:
+                query = query.filter(UsageStat.day >= since)
+            if until:
+                query = query.filter(UsageStat.day <= until)
+            rows = query.order_by(UsageStat.day.asc(), User.public_id, LLM.name).all()
+            return [
+                {
+                    'user_id': user_id,
+                    'llm_id': llm_id,
+                    'llm_name': llm_name,
+                    'day': stat.day.isoformat(),
+                    'requests': stat.requests,
+                    'prompt_tokens': stat.prompt_tokens,
+                    'completion_tokens': stat.completion_tokens,
+                    'avg_latency_ms': round(stat.latency_ms / stat.requests) if stat.requests else None
+                }
+                for stat, user_id, llm_id, llm_name in rows
+            ]
+    
+    def get_token_quota(self, user_public_id: str) -> Tuple[Optional[int], int]:
+        """Get a user's daily token quota and the tokens the user has used today."""
+        self.write_behind.flush()
+        with self.session_scope() as session:
+            user = session.query(User).filter_by(public_id=user_public_id, is_active=True).first()
+            if not user:
+                raise NotFoundError("User not found")
+            if not user.daily_token_quota:
+                return None, 0
+            
+            used = session.query(func.coalesce(func.sum(UsageStat.prompt_tokens + UsageStat.completion_tokens), 0))\
+                .filter(UsageStat.user_id == user.id, UsageStat.day == datetime.date.today())\
+                .scalar()
+            return user.daily_token_quota, int(used)
+    
+    def get_message_history_before(self, public_id: str) -> List[Dict[str, str]]:
+        """Get the role and content of the chat messages created before a message, oldest first."""
+        self.write_behind.flush()
+        with self.session_scope() as session:
+            message = session.query(Message).filter_by(public_id=public_id, is_active=True).first()
+            if not message:
+                raise NotFoundError("Message not found")
+            
+            # Ties on created_at are broken by id, so the range matches insertion order
+            rows = session.query(Message.role, Message.content)\
+                .filter(
+                    Message.chat_id == message.chat_id,
+                    Message.is_active.is_(True),
+                    or_(
+                        Message.created_at < message.created_at,
+                        and_(Message.created_at == message.created_at, Message.id < message.id)
+                    )
+                )\
+                .order_by(Message.created_at.asc(), Message.id.asc())\
+                .all()
+            return [{"role": role, "content": content} for role, content in rows]
     
     def enable_instruction_recording(self, user_public_id: str) -> Dict[str, Any]:
         """Enable instruction recording for a user."""
@@ -560,6 +1250,7 @@ class DatabaseManageUnit:
             
             user.record_instructions = True
             session.add(user)
+            self._bump_versions(session, USERS_VERSION, CHATS_VERSION)
             return self._user_to_dict(user)
     
     def disable_instruction_recording(self, user_public_id: str) -> Dict[str, Any]:
@@ -571,6 +1262,7 @@ class DatabaseManageUnit:
             
             user.record_instructions = False
             session.add(user)
+            self._bump_versions(session, USERS_VERSION, CHATS_VERSION)
             return self._user_to_dict(user)
     
     def get_user_instructions(self, user_public_id: str) -> List[Dict[str, Any]]:
@@ -614,49 +1306,264 @@ class DatabaseManageUnit:
             records = session.query(InstructionRecord).all()
             return [self._instruction_record_to_dict(record) for record in records]
     
-    def _user_to_dict(self, user: User) -> Dict[str, Any]:
-        """Convert user to dictionary."""
-        return {
-            'user_id': user.public_id,
-            'username': user.username,
-            'display_name': user.display_name,
-            'profile': user.profile,
-            'record_instructions': user.record_instructions,
-            'created_at': user.created_at.isoformat(),
-            'updated_at': user.updated_at.isoformat()
+    def create_job(self, instruction: str, request: Dict[str, Any], user_public_id: Optional[str] = None) -> Dict[str, Any]:
+        """Create a queued job and return as dictionary."""
+        with self.session_scope() as session:
+            user = None
+            if user_public_id:
+                user = session.query(User).filter_by(public_id=user_public_id, is_active=True).first()
+                if not user:
+                    raise NotFoundError("User not found")
+            
+            job = Job(instruction=instruction, request=request, user_id=user.id if user else None, status='queued', progress=0.0)
+            session.add(job)
+            session.flush()
+            return self._job_to_dict(job)
+    
+    def update_job(
+        self,
+        public_id: str,
+        status: Optional[str] = None,
+        progress: Optional[float] = None,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Update a job's state and return as dictionary."""
+        with self.session_scope() as session:
+            job = session.query(Job).filter_by(public_id=public_id).first()
+            if not job:
+                raise NotFoundError("Job not found")
+            
+            now = datetime.datetime.now()
+            if status is not None:
+                job.status = status
+                if status == 'running' and job.started_at is None:
+                    job.started_at = now
+                if status in ('succeeded', 'failed'):
+                    job.finished_at = now
+            if progress is not None:
+                job.progress = progress
+            if result is not None:
+                job.result = result
+            if error is not None:
+                job.error = error
+            session.add(job)
+            session.flush()
+            return self._job_to_dict(job)
+    
+    def expire_stale_jobs(self, timeout_seconds: float) -> int:
+        """Fail queued or running jobs not updated for timeout_seconds; return how many."""
+        with self.session_scope() as session:
+            now = datetime.datetime.now()
+            cutoff = now - datetime.timedelta(seconds=timeout_seconds)
+            return session.query(Job)\
+                .filter(Job.status.in_(['queued', 'running']), Job.updated_at < cutoff)\
+                .update({
+                    Job.status: 'failed',
+                    Job.error: 'Job expired: no progress was reported before the job timeout',
+                    Job.finished_at: now,
+                    Job.updated_at: now
+                }, synchronize_session=False)
+    
+    def get_job_by_public_id(self, public_id: str) -> Optional[Dict[str, Any]]:
+        """Get job by public_id as dictionary."""
+        with self.session_scope() as session:
+            job = session.query(Job).filter_by(public_id=public_id, is_active=True).first()
+            return self._job_to_dict(job) if job else None
+    
+    def take_rate_limit_tokens(self, key: str, capacity: float, refill_per_second: float, amount: float) -> float:
+        """Take tokens from a shared bucket; return 0 on success or the seconds to wait."""
+        try:
+            with self.session_scope() as session:
+                now = time.time()
+                bucket = session.query(RateLimitBucket).filter_by(key=key).with_for_update().first()
+                if not bucket:
+                    bucket = RateLimitBucket(key=key, tokens=capacity, refreshed_at=now)
+                    session.add(bucket)
+
+                tokens = min(capacity, bucket.tokens + (now - bucket.refreshed_at) * refill_per_second)
+                bucket.refreshed_at = now
+                if tokens >= amount:
+                    bucket.tokens = tokens - amount
+                    return 0.0
+                bucket.tokens = tokens
+                return (amount - tokens) / refill_per_second
+        except IntegrityError:
+            # Another process created the bucket concurrently; it exists now
+            return self.take_rate_limit_tokens(key, capacity, refill_per_second, amount)
+
+    def adjust_rate_limit_tokens(self, key: str, capacity: float, refill_per_second: float, amount: float) -> None:
+        """Charge (or refund, if negative) tokens of a shared bucket unconditionally."""
+        try:
+            with self.session_scope() as session:
+                now = time.time()
+                bucket = session.query(RateLimitBucket).filter_by(key=key).with_for_update().first()
+                if not bucket:
+                    bucket = RateLimitBucket(key=key, tokens=capacity, refreshed_at=now)
+                    session.add(bucket)
+
+                tokens = min(capacity, bucket.tokens + (now - bucket.refreshed_at) * refill_per_second)
+                bucket.tokens = min(capacity, tokens - amount)
+                bucket.refreshed_at = now
+        except IntegrityError:
+            self.adjust_rate_limit_tokens(key, capacity, refill_per_second, amount)
+
+    def claim_idempotency_key(self, key: str, fingerprint: str, lease: float) -> Optional[Dict[str, Any]]:
+        """Claim key for executing a request for lease seconds.
+        
+        Returns None once claimed, or the unexpired record of an earlier claim as dictionary.
+        """
+        with self.session_scope() as session:
+            now = datetime.datetime.now()
+            session.query(IdempotencyRecord).filter(IdempotencyRecord.key == key, IdempotencyRecord.expires_at < now)\
+                .delete(synchronize_session=False)
+            try:
+                with session.begin_nested():
+                    session.add(IdempotencyRecord(
+                        key=key, fingerprint=fingerprint, status='pending', expires_at=now + datetime.timedelta(seconds=lease)
+                    ))
+                return None
+            except IntegrityError:
+                # Claimed by an earlier or concurrent request
+                record = session.query(IdempotencyRecord).filter_by(key=key).first()
+                return self._idempotency_record_to_dict(record) if record else None
+    
+    def complete_idempotency_key(self, key: str, result: Dict[str, Any], ttl: float) -> None:
+        """Store the result of a claimed key, returned to repeats for ttl seconds."""
+        with self.session_scope() as session:
+            session.query(IdempotencyRecord).filter_by(key=key).update({
+                IdempotencyRecord.status: 'completed',
+                IdempotencyRecord.result: result,
+                IdempotencyRecord.expires_at: datetime.datetime.now() + datetime.timedelta(seconds=ttl)
+            }, synchronize_session=False)
+    
+    def release_idempotency_key(self, key: str) -> None:
+        """Give up a pending claim, so the next repeat executes the request again."""
+        with self.session_scope() as session:
+            session.query(IdempotencyRecord).filter_by(key=key, status='pending').delete(synchronize_session=False)
+    
+    def purge_idempotency_records(self) -> int:
+        """Delete expired idempotency records; returns how many."""
+        with self.session_scope() as session:
+            return session.query(IdempotencyRecord).filter(IdempotencyRecord.expires_at < datetime.datetime.now())\
+                .delete(synchronize_session=False)
+    
+    def _get_lock_engine(self):
+        """Small autocommit pool used only for advisory lock connections."""
+        if self._lock_engine is None:
+            self._lock_engine = create_engine(
+                DatabaseConfig.DATABASE_URI,
+                pool_size=DatabaseConfig.LOCK_POOL_SIZE,
+                max_overflow=0,
+                pool_timeout=1,
+                pool_recycle=DatabaseConfig.POOL_RECYCLE,
+                isolation_level='AUTOCOMMIT',
+                echo=DatabaseConfig.ECHO
+            )
+        return self._lock_engine
+
+    def try_acquire_advisory_slot(self, key: str, slots: int) -> Optional[Tuple[Any, int, int]]:
+        """Try to hold one of `slots` Postgres advisory locks for key.
+
+        The returned handle keeps its connection checked out of the dedicated lock pool
+        until it is released, and the lock disappears with the connection if the process dies.
+        """
+        lock_key = zlib.crc32(key.encode('utf-8')) & 0x7fffffff
+        try:
+            connection = self._get_lock_engine().connect()
+        except SQLAlchemyError as e:
+            # An exhausted lock pool means this process already holds as many slots as it may
+            logger.warning(f"No advisory lock connection available: {str(e)}")
+            return None
+        try:
+            # One round trip per attempt; the scan stops at the first free slot
+            slot = connection.execute(
+                text(
+                    "SELECT slot FROM generate_series(0, :slots - 1) AS slot "
+                    "WHERE pg_try_advisory_lock(:key, slot) LIMIT 1"
+                ),
+                {"key": lock_key, "slots": slots}
+            ).scalar()
+        except Exception:
+            connection.close()
+            raise
+        if slot is None:
+            connection.close()
+            return None
+        return connection, lock_key, slot
+
+    def release_advisory_slot(self, handle: Tuple[Any, int, int]) -> None:
+        """Release a slot returned by try_acquire_advisory_slot."""
+        connection, lock_key, slot = handle
+        try:
+            connection.execute(text("SELECT pg_advisory_unlock(:key, :slot)"), {"key": lock_key, "slot": slot})
+        finally:
+            connection.close()
+
+    def _user_to_dict(self, user: User, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Convert user to dictionary, limited to fields if given."""
+        # Only the requested values are read, so attributes left unloaded by a projection stay unloaded
+        values = {
+            'user_id': lambda: user.public_id,
+            'username': lambda: user.username,
+            'display_name': lambda: user.display_name,
+            'profile': lambda: user.profile,
+            'record_instructions': lambda: user.record_instructions,
+            'daily_token_quota': lambda: user.daily_token_quota,
+            'priority_tier': lambda: user.priority_tier,
+            'created_at': lambda: user.created_at.isoformat(),
+            'updated_at': lambda: user.updated_at.isoformat()
         }
+        return {field: values[field]() for field in (fields or values)}
     
-    def _chat_to_dict(self, chat: Chat) -> Dict[str, Any]:
-        """Convert chat to dictionary."""
-        return {
-            'chat_id': chat.public_id,
-            'title': chat.title,
-            'users': [self._user_to_dict(user) for user in chat.users],
-            'messages': [self._message_to_dict(message) for message in chat.messages],
-            'created_at': chat.created_at.isoformat(),
-            'updated_at': chat.updated_at.isoformat()
+    def _chat_to_dict(self, chat: Chat, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Convert chat to dictionary, limited to fields if given."""
+        values = {
+            'chat_id': lambda: chat.public_id,
+            'title': lambda: chat.title,
+            'users': lambda: [self._user_to_dict(user) for user in chat.users],
+            'messages': lambda: [self._message_to_dict(message) for message in chat.messages],
+            'message_count': lambda: chat.message_count,
+            'last_message_preview': lambda: chat.last_message_preview,
+            'last_activity_at': lambda: chat.last_activity_at.isoformat(),
+            'created_at': lambda: chat.created_at.isoformat(),
+            'updated_at': lambda: chat.updated_at.isoformat()
         }
+        return {field: values[field]() for field in (fields or values)}
     
-    def _message_to_dict(self, message: Message) -> Dict[str, Any]:
-        """Convert message to dictionary."""
-        return {
-            'message_id': message.public_id,
-            'chat_id': message.chat.public_id,
-            'user_id': message.user.public_id if message.user else None,
-            'llm_id': message.llm.public_id if message.llm else None,
-            'content': message.content,
-            'role': message.role,
-            'created_at': message.created_at.isoformat(),
-            'updated_at': message.updated_at.isoformat()
+    def _message_to_dict(self, message: Message, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Convert message to dictionary, limited to fields if given."""
+        values = {
+            'message_id': lambda: message.public_id,
+            'chat_id': lambda: message.chat.public_id,
+            'user_id': lambda: message.user.public_id if message.user else None,
+            'llm_id': lambda: message.llm.public_id if message.llm else None,
+            'parent_message_id': lambda: message.parent.public_id if message.parent else None,
+            'content': lambda: message.content,
+            'role': lambda: message.role,
+            'rank': lambda: message.rank,
+            'prompt_tokens': lambda: message.prompt_tokens,
+            'completion_tokens': lambda: message.completion_tokens,
+            'latency_ms': lambda: message.latency_ms,
+            'created_at': lambda: message.created_at.isoformat(),
+            'updated_at': lambda: message.updated_at.isoformat()
         }
+        return {field: values[field]() for field in (fields or values)}
     
     def _provider_to_dict(self, provider: Provider) -> Dict[str, Any]:
         """Convert provider to dictionary."""
         return {
             'provider_id': provider.public_id,
             'name': provider.name,
+            'kind': provider.kind,
             'api_endpoint': provider.api_endpoint,
+            'endpoints': provider.endpoints or [{'url': provider.api_endpoint, 'weight': 1}],
             'api_key': provider.api_key,
+            'requests_per_minute': provider.requests_per_minute,
+            'tokens_per_minute': provider.tokens_per_minute,
+            'max_concurrency': provider.max_concurrency,
+            'batch_window_ms': provider.batch_window_ms,
+            'batch_max_size': provider.batch_max_size,
             'created_at': provider.created_at.isoformat(),
             'updated_at': provider.updated_at.isoformat()
         }
@@ -667,10 +1574,22 @@ class DatabaseManageUnit:
             'llm_id': llm.public_id,
             'name': llm.name,
             'provider_id': llm.provider.public_id,
+            'fallback_llm_ids': llm.fallback_llm_ids or [],
+            'generation_params': llm.generation_params or {},
             'created_at': llm.created_at.isoformat(),
             'updated_at': llm.updated_at.isoformat()
         }
     
+    def _idempotency_record_to_dict(self, record: IdempotencyRecord) -> Dict[str, Any]:
+        """Convert idempotency record to dictionary."""
+        return {
+            'key': record.key,
+            'fingerprint': record.fingerprint,
+            'status': record.status,
+            'result': record.result,
+            'expires_at': record.expires_at.isoformat()
+        }
+    
     def _instruction_record_to_dict(self, record: InstructionRecord) -> Dict[str, Any]:
         """Convert instruction record to dictionary."""
         return {
@@ -680,4 +1599,20 @@ class DatabaseManageUnit:
             'instruction': record.instruction,
             'created_at': record.created_at.isoformat(),
             'updated_at': record.updated_at.isoformat()
+        }
+    
+    def _job_to_dict(self, job: Job) -> Dict[str, Any]:
+        """Convert job to dictionary."""
+        return {
+            'job_id': job.public_id,
+            'user_id': job.user.public_id if job.user else None,
+            'instruction': job.instruction,
+            'status': job.status,
+            'progress': job.progress,
+            'result': job.result,
+            'error': job.error,
+            'created_at': job.created_at.isoformat(),
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'updated_at': job.updated_at.isoformat()
         }
\ No newline at end of file
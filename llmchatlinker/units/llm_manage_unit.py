@@ -1,19 +1,108 @@
 # llmchatlinker/units/llm_manage_unit.py
 
+import os
+import time
+import functools
+import threading
 import logging
-from typing import Dict, Any, Optional, List
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, List, Tuple, Callable, Union
 import requests
 import json
-from datetime import datetime
-from .database_manage_unit import DatabaseManageUnit, NotFoundError, ValidationError
+from datetime import date
+from .database_manage_unit import DatabaseManageUnit, NotFoundError, ValidationError, LLM_CONFIG_VERSION
+from ..cancellation import CancellationToken, InstructionCancelled
+from ..message_queue import CHAT_ROUTING_PREFIX
+from ..sync import read_sync_position, next_sync_token
+from ..providers.singleflight import SingleFlight, fingerprint
+from ..providers.batcher import MicroBatcher
+from ..providers.registry import ConfigRegistry
+from ..providers.warmup import WarmthTracker
+from ..providers.generation import (
+    LLM_CONNECT_TIMEOUT, validate_generation_params, merge_generation_params, request_timeouts
+)
+from ..providers.rate_limit import (
+    RATE_LIMIT_MAX_WAIT, RateLimiterRegistry, LocalLimiterStore, DatabaseLimiterStore, RATE_LIMIT_STORE, RateLimitExceeded, estimate_tokens,
+    ProviderLimiter, LimiterLease
+)
+from ..providers.adapters import ProviderAdapter, ProviderResponse, get_adapter
+from ..providers.balancer import EndpointBalancer
+from ..providers.health import (
+    HealthTracker, CircuitOpenError, ProviderHTTPError, LLM_MAX_RETRIES, backoff_delay, parse_retry_after,
+    LLM_RETRY_MAX_DELAY, LLM_TIMEOUT_DEFAULT
+)
 
 logger = logging.getLogger(__name__)
 
+# Share one upstream call between concurrent identical requests
+LLM_COALESCE_REQUESTS = os.getenv('LLM_COALESCE_REQUESTS', 'true').lower() == 'true'
+
+# Threads available to hedged requests per orchestrator process
+LLM_HEDGE_WORKERS = int(os.getenv('LLM_HEDGE_WORKERS', 32))
+
+# Shared deadline (seconds) of a multi-model generation and its worker pool size
+LLM_MULTI_DEADLINE = float(os.getenv('LLM_MULTI_DEADLINE', 60))
+LLM_FANOUT_WORKERS = int(os.getenv('LLM_FANOUT_WORKERS', 16))
+# Upper bound of a client-supplied multi-model deadline
+LLM_MULTI_MAX_DEADLINE = float(os.getenv('LLM_MULTI_MAX_DEADLINE', 300))
+
+# Most alternative answers one LLM_RESPONSE_REGENERATE request may ask for
+LLM_REGENERATE_MAX_CANDIDATES = int(os.getenv('LLM_REGENERATE_MAX_CANDIDATES', 8))
+
+# Largest micro-batch sent to a provider with a batch window, unless the provider sets batch_max_size
+LLM_BATCH_MAX_SIZE = int(os.getenv('LLM_BATCH_MAX_SIZE', 16))
+
+# Send a tiny request to every newly added LLM so its first user does not wait for the model to load
+LLM_WARMUP_ON_ADD = os.getenv('LLM_WARMUP_ON_ADD', 'false').lower() == 'true'
+# Seconds between keep-warm rounds that ping LLMs idle for at least that long (0 = off)
+LLM_KEEP_WARM_INTERVAL = float(os.getenv('LLM_KEEP_WARM_INTERVAL', 0))
+WARMUP_MESSAGES = [{"role": "user", "content": "Hi"}]
+# A single token is enough to make the model server load the model
+WARMUP_PARAMS = {"max_tokens": 1}
+
+# Background workers running asynchronous generation jobs
+LLM_JOB_WORKERS = int(os.getenv('LLM_JOB_WORKERS', 4))
+
+# Seconds after which a queued or running job that made no progress is marked failed
+LLM_JOB_TIMEOUT = float(os.getenv('LLM_JOB_TIMEOUT', 900))
+# Job progress once the provider has answered and only persistence is left
+PROGRESS_ANSWERED = 0.9
+
+# Threads that store user messages while the provider call is in flight
+LLM_PERSIST_WORKERS = int(os.getenv('LLM_PERSIST_WORKERS', 8))
+
+# Instructions that may run as a background job when sent with "async": true, and that stop early when cancelled
+ASYNC_INSTRUCTIONS = ('LLM_RESPONSE_GENERATE', 'LLM_RESPONSE_GENERATE_MULTI', 'LLM_RESPONSE_REGENERATE')
+
+# Errors after which a request is retried on a fallback LLM
+FAILOVER_ERRORS = (CircuitOpenError, RateLimitExceeded, ProviderHTTPError, requests.RequestException)
+
 class LLMManageUnit:
     """Handles LLM-related operations and instructions"""
 
-    def __init__(self, database_manage_unit: DatabaseManageUnit):
+    def __init__(self, database_manage_unit: DatabaseManageUnit, event_publisher=None):
         self.db = database_manage_unit
+        self.events = event_publisher
+        # Providers and LLMs are looked up on every generation, so they are served from memory
+        self.registry = ConfigRegistry(database_manage_unit, LLM_CONFIG_VERSION)
+        self.inflight = SingleFlight()
+        self.batcher = MicroBatcher()
+        self.limiters = RateLimiterRegistry(
+            DatabaseLimiterStore(database_manage_unit) if RATE_LIMIT_STORE == 'database' else LocalLimiterStore()
+        )
+        self.health = HealthTracker()
+        self.balancer = EndpointBalancer(self.health)
+        self.hedge_executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_WORKERS, thread_name_prefix='llm-hedge')
+        self.hedge_workers = threading.BoundedSemaphore(LLM_HEDGE_WORKERS)
+        self.fanout_executor = ThreadPoolExecutor(max_workers=LLM_FANOUT_WORKERS, thread_name_prefix='llm-fanout')
+        self.job_executor = ThreadPoolExecutor(max_workers=LLM_JOB_WORKERS, thread_name_prefix='llm-job')
+        self.persist_executor = ThreadPoolExecutor(max_workers=LLM_PERSIST_WORKERS, thread_name_prefix='llm-persist')
+        if database_manage_unit is not None:
+            database_manage_unit.write_behind.on_failure = self._publish_persist_failure
+        self.warmth = WarmthTracker()
+        self._stop_keep_warm = threading.Event()
+        if LLM_KEEP_WARM_INTERVAL > 0 and database_manage_unit is not None:
+            threading.Thread(target=self._keep_warm, args=(LLM_KEEP_WARM_INTERVAL,), name='llm-keep-warm', daemon=True).start()
         self.handlers = {
             'LLM_PROVIDER_ADD': self.add_llm_provider,
             'LLM_PROVIDER_UPDATE': self.update_llm_provider,
@@ -25,16 +114,29 @@ class LLMManageUnit:
             'LLM_LIST': self.list_llms,
             'LLM_LIST_BY_PROVIDER': self.list_llms_by_provider,
             'LLM_RESPONSE_GENERATE': self.generate_llm_response,
-            'LLM_RESPONSE_REGENERATE': self.regenerate_llm_response
+            'LLM_RESPONSE_GENERATE_MULTI': self.generate_multi_llm_response,
+            'LLM_RESPONSE_REGENERATE': self.regenerate_llm_response,
+            'LLM_JOB_STATUS': self.get_job_status,
+            'LLM_USAGE_STATS': self.get_usage_stats
         }
 
-    def handle_instruction(self, instruction_type: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Route instruction to appropriate handler"""
+    def handle_instruction(
+        self,
+        instruction_type: str,
+        data: Optional[Dict[str, Any]] = None,
+        cancelled: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """Route instruction to appropriate handler; generations stop early once cancelled is set"""
         handler = self.handlers.get(instruction_type)
         if not handler:
             return self._error_response("Invalid instruction type")
 
         try:
+            if instruction_type in ASYNC_INSTRUCTIONS:
+                # A background job outlives the request that submitted it, so only synchronous runs are cancelled
+                if data and data.get('async'):
+                    return self.submit_job(instruction_type, handler, data)
+                return handler(data or {}, cancelled=cancelled)
             return handler(data or {})
         except (NotFoundError, ValidationError) as e:
             return self._error_response(str(e))
@@ -43,15 +145,24 @@ class LLMManageUnit:
     
     def add_llm_provider(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Add a new LLM provider"""
-        if not self._validate_data(data, ['name', 'api_endpoint']):
-            return self._error_response("Missing required fields: name and api_endpoint")
+        if not self._validate_data(data, ['name']) or not (data.get('api_endpoint') or data.get('endpoints')):
+            return self._error_response("Missing required fields: name and api_endpoint or endpoints")
 
         try:
+            self._validate_batching(data.get('kind'), data.get('batch_window_ms'))
             provider_data = self.db.add_provider(
                 name=data['name'], 
-                api_endpoint=data['api_endpoint'],
-                api_key=data.get('api_key')
+                kind=data.get('kind'),
+                api_endpoint=data.get('api_endpoint') or data['endpoints'][0]['url'],
+                api_key=data.get('api_key'),
+                endpoints=data.get('endpoints'),
+                requests_per_minute=data.get('requests_per_minute'),
+                tokens_per_minute=data.get('tokens_per_minute'),
+                max_concurrency=data.get('max_concurrency'),
+                batch_window_ms=data.get('batch_window_ms'),
+                batch_max_size=data.get('batch_max_size')
             )
+            self.registry.put_provider(provider_data)
             return self._success_response("Provider added successfully", {"provider": provider_data})
         except Exception as e:
             return self._error_response(f"Failed to add provider: {str(e)}")
@@ -62,8 +173,15 @@ class LLMManageUnit:
             return self._error_response("Provider ID is required")
         
         try:
+            if data.get('kind') is not None or data.get('batch_window_ms'):
+                kind = data.get('kind')
+                if kind is None:
+                    current = self.registry.provider(data['provider_id'])
+                    kind = current and current['kind']
+                self._validate_batching(kind, data.get('batch_window_ms'))
             provider_id = data.pop('provider_id')
             provider_data = self.db.update_provider(provider_id, **data)
+            self.registry.put_provider(provider_data)
             return self._success_response("Provider updated successfully", {"provider": provider_data})
         except Exception as e:
             return self._error_response(f"Failed to update provider: {str(e)}")
@@ -75,17 +193,41 @@ class LLMManageUnit:
 
         try:
             self.db.delete_provider(data['provider_id'])
+            self.registry.remove_provider(data['provider_id'])
             return self._success_response("Provider deleted successfully")
         except NotFoundError:
             return self._error_response(f"Provider with ID {data['provider_id']} not found")
         except Exception as e:
             return self._error_response(f"Failed to delete provider: {str(e)}")
     
+    @staticmethod
+    def _validate_batching(kind: Optional[str], batch_window_ms: Optional[int]) -> None:
+        """Check that the provider kind exists and can batch if a batch window is set"""
+        adapter = get_adapter(kind)
+        if batch_window_ms and not adapter.supports_batch:
+            raise ValidationError(f"Provider kind '{adapter.kind}' does not support batching")
+
     def list_llm_providers(self, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """List all LLM providers"""
+        """List all LLM providers, or those changed since updated_since / sync_token, with the version of their configuration"""
         try:
-            providers = self.db.get_all_providers()
-            return self._success_response("Providers retrieved successfully", {"providers": providers})
+            since = read_sync_position(data)
+            # Read first, so a concurrent change can only make the version and token older than the list
+            version = self.db.get_entity_version(LLM_CONFIG_VERSION)
+            sync_token = next_sync_token()
+            if since is None:
+                result = {"providers": self.db.get_all_providers()}
+            else:
+                changes = self.db.get_changes('providers', since)
+                result = {"providers": changes['changed'], "deleted": changes['deleted']}
+            for provider in result['providers']:
+                provider['stats'] = {
+                    "limiter": self.limiters.stats(provider['provider_id']),
+                    "endpoints": self.balancer.stats(provider['endpoints'])
+                }
+            result.update(sync_token=sync_token, version=version)
+            return self._success_response("Providers retrieved successfully", result)
+        except ValueError as e:
+            return self._error_response(str(e))
         except Exception as e:
             return self._error_response(f"Failed to list providers: {str(e)}")
     
@@ -96,19 +238,35 @@ class LLMManageUnit:
 
         logger.info(f"Adding LLM: {data['llm_name']} for provider: {data['provider_id']}")
         try:
-            llm_data = self.db.add_llm(name=data['llm_name'], provider_public_id=data['provider_id'])
+            llm_data = self.db.add_llm(
+                name=data['llm_name'],
+                provider_public_id=data['provider_id'],
+                fallback_llm_ids=data.get('fallback_llm_ids'),
+                generation_params=self._parse_generation_params(data)
+            )
             logger.info(f"LLM added: {llm_data}")
+            self.registry.put_llm(llm_data)
+            if data.get('warmup') if data.get('warmup') is not None else LLM_WARMUP_ON_ADD:
+                self.fanout_executor.submit(self.warm_up_llm, llm_data)
+                llm_data = dict(llm_data, state='warming')
             return self._success_response("LLM added successfully", {"llm": llm_data})
         except Exception as e:
             return self._error_response(f"Failed to add LLM: {str(e)}")
     
     def update_llm(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Update existing LLM"""
-        if not self._validate_data(data, ['llm_id', 'llm_name']):
-            return self._error_response("LLM ID and name are required")
+        updatable = ('llm_name', 'fallback_llm_ids', 'generation_params')
+        if not self._validate_data(data, ['llm_id']) or not any(key in data for key in updatable):
+            return self._error_response("LLM ID and name, fallback LLM IDs or generation params are required")
 
         try:
-            llm_data = self.db.update_llm(data['llm_id'], name=data['llm_name'])
+            llm_data = self.db.update_llm(
+                data['llm_id'],
+                name=data.get('llm_name'),
+                fallback_llm_ids=data.get('fallback_llm_ids'),
+                generation_params=self._parse_generation_params(data) if data.get('generation_params') is not None else None
+            )
+            self.registry.put_llm(llm_data)
             return self._success_response("LLM updated successfully", {"llm": llm_data})
         except Exception as e:
             return self._error_response(f"Failed to update LLM: {str(e)}")
@@ -120,6 +278,7 @@ class LLMManageUnit:
 
         try:
             self.db.delete_llm(data['llm_id'])
+            self.registry.remove_llm(data['llm_id'])
             return self._success_response("LLM deleted successfully")
         except NotFoundError:
             return self._error_response(f"LLM with ID {data['llm_id']} not found")
@@ -127,10 +286,22 @@ class LLMManageUnit:
             return self._error_response(f"Failed to delete LLM: {str(e)}")
     
     def list_llms(self, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """List all LLMs"""
+        """List all LLMs, or those changed since updated_since / sync_token, with the version of their configuration"""
         try:
-            llms = self.db.get_all_llms()
-            return self._success_response("LLMs retrieved successfully", {"llms": llms})
+            since = read_sync_position(data)
+            version = self.db.get_entity_version(LLM_CONFIG_VERSION)
+            sync_token = next_sync_token()
+            if since is None:
+                result = {"llms": self.db.get_all_llms()}
+            else:
+                changes = self.db.get_changes('llms', since)
+                result = {"llms": changes['changed'], "deleted": changes['deleted']}
+            for llm in result['llms']:
+                llm['state'] = self.warmth.state(llm['llm_id'])
+            result.update(sync_token=sync_token, version=version)
+            return self._success_response("LLMs retrieved successfully", result)
+        except ValueError as e:
+            return self._error_response(str(e))
         except Exception as e:
             return self._error_response(f"Failed to list LLMs: {str(e)}")
     
@@ -140,63 +311,206 @@ class LLMManageUnit:
             return self._error_response("Provider ID is required")
 
         try:
-            llms = self.db.get_llms_by_provider(data['provider_id'])
-            return self._success_response(f"LLMs retrieved for provider {data['provider_id']}", {"llms": llms})
+            since = read_sync_position(data)
+            version = self.db.get_entity_version(LLM_CONFIG_VERSION)
+            sync_token = next_sync_token()
+            if since is None:
+                result = {"llms": self.db.get_llms_by_provider(data['provider_id'])}
+            else:
+                changes = self.db.get_changes('llms', since, provider_public_id=data['provider_id'])
+                result = {"llms": changes['changed'], "deleted": changes['deleted']}
+            for llm in result['llms']:
+                llm['state'] = self.warmth.state(llm['llm_id'])
+            result.update(sync_token=sync_token, version=version)
+            return self._success_response(f"LLMs retrieved for provider {data['provider_id']}", result)
+        except ValueError as e:
+            return self._error_response(str(e))
         except Exception as e:
             return self._error_response(f"Failed to list provider LLMs: {str(e)}")
         
-    def generate_llm_response(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    def generate_llm_response(
+        self,
+        data: Dict[str, Any],
+        on_progress: Optional[Callable[[float], None]] = None,
+        cancelled: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
         """Generate response from LLM"""
         required_fields = ['chat_id', 'user_id', 'provider_id', 'llm_id', 'user_input']
         if not self._validate_data(data, required_fields):
             return self._error_response(f"Missing required fields: {', '.join(required_fields)}")
 
         try:
-            provider_data = self.db.get_provider_by_public_id(data['provider_id'])
-            endpoint = provider_data.get('api_endpoint')
-            api_key = provider_data.get('api_key')
-            model = self.db.get_llm_by_public_id(data['llm_id']).get('name')
+            quota_error = self._check_token_quota(data['user_id'])
+            if quota_error:
+                return quota_error
 
-            # already ordered by created_at
-            chat_messages = self.db.get_messages_by_chat(data['chat_id'])
-
-            message_history = [
-                {"role": message.get('role'), "content": message.get('content')} 
-                for message in chat_messages
-            ]
+            generation_params = self._parse_generation_params(data)
+            provider_data = self.registry.provider(data['provider_id'])
+            llm_data = self.registry.llm(data['llm_id'])
 
+            message_history = self._load_message_history(data['chat_id'])
             message_history.append({"role": "user", "content": data['user_input']})
 
-            response_content = self._call_llm_api(endpoint, model, message_history, api_key)
-
-            message_data = self.db.create_message(
+            # The user message is stored while the provider works on the reply
+            user_message = self.persist_executor.submit(
+                self.db.create_message,
                 chat_public_id=data['chat_id'],
                 user_public_id=data['user_id'],
                 content=data['user_input'],
                 role='user',
                 llm_public_id=data['llm_id']
             )
+            try:
+                llm_response, served_llm = self._call_unless_cancelled(
+                    cancelled, self._call_llm_with_failover,
+                    provider_data, llm_data, message_history, coalesce=True, params=generation_params
+                )
+            except BaseException:
+                self._discard_message(user_message)
+                raise
+            self._report_progress(on_progress, PROGRESS_ANSWERED)
 
+            message_data = user_message.result()
             if not message_data:
                 raise ValidationError("Failed to create user message")
 
-            llm_message_data = self.db.create_message(
+            # The reply is returned as soon as it is queued; failed writes are retried and reported separately
+            llm_message_data = self.db.create_message_behind(
                 chat_public_id=data['chat_id'],
                 user_public_id=data['user_id'],
-                content=response_content,
+                content=llm_response.content,
                 role='assistant',
-                llm_public_id=data['llm_id']
+                llm_public_id=served_llm['llm_id'],
+                parent_message_public_id=message_data['message_id'],
+                usage=llm_response.usage,
+                latency_ms=llm_response.latency_ms
             )
             return self._success_response("Response generated successfully", {"llm_response": llm_message_data})
+        except InstructionCancelled:
+            return self._cancelled_response()
         except Exception as e:
             return self._error_response(f"Failed to generate response: {str(e)}")
+
+    def generate_multi_llm_response(
+        self,
+        data: Dict[str, Any],
+        on_progress: Optional[Callable[[float], None]] = None,
+        cancelled: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """Generate responses from several LLMs concurrently for the same user input"""
+        required_fields = ['chat_id', 'user_id', 'llm_ids', 'user_input']
+        if not self._validate_data(data, required_fields):
+            return self._error_response(f"Missing required fields: {', '.join(required_fields)}")
+        if not isinstance(data['llm_ids'], list) or not data['llm_ids']:
+            return self._error_response("llm_ids must be a non-empty list")
+
+        try:
+            quota_error = self._check_token_quota(data['user_id'])
+            if quota_error:
+                return quota_error
+
+            generation_params = self._parse_generation_params(data)
+            targets = []
+            for llm_id in dict.fromkeys(data['llm_ids']):
+                llm_data = self.registry.llm(llm_id)
+                if not llm_data:
+                    return self._error_response(f"LLM with ID {llm_id} not found")
+                targets.append((llm_data, self.registry.provider(llm_data['provider_id'])))
+
+            # The history is loaded once and shared by every model
+            message_history = self._load_message_history(data['chat_id'])
+            message_history.append({"role": "user", "content": data['user_input']})
+
+            deadline = min(float(data.get('deadline') or LLM_MULTI_DEADLINE), LLM_MULTI_MAX_DEADLINE)
+            if deadline <= 0:
+                return self._error_response("deadline must be positive")
+            # Every call is bounded by the shared deadline, not only the wait below
+            expires_at = time.monotonic() + deadline
+            futures = {
+                self.fanout_executor.submit(
+                    self._call_llm_with_failover, provider_data, llm_data, message_history,
+                    deadline=expires_at, params=generation_params
+                ): llm_data
+                for llm_data, provider_data in targets
+            }
+            cancellation = self._cancellation_future(cancelled)
+            not_done = set(futures)
+            while not_done and not cancellation.done():
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = wait(not_done | {cancellation}, timeout=remaining, return_when=FIRST_COMPLETED)
+                not_done -= done
+                if done - {cancellation}:
+                    # Progress is the share of LLMs that have answered or failed
+                    self._report_progress(on_progress, PROGRESS_ANSWERED * (len(futures) - len(not_done)) / len(futures))
+            for future in not_done:
+                # Calls still queued behind other requests never start; running ones stop at the deadline
+                future.cancel()
+            unfinished = "Cancelled" if cancellation.done() else f"Timed out after {deadline:g}s"
+
+            answers, failures = [], []
+            for future, llm_data in futures.items():
+                if future in not_done:
+                    failures.append({"llm_id": llm_data['llm_id'], "error": unfinished})
+                elif future.exception() is not None:
+                    failures.append({"llm_id": llm_data['llm_id'], "error": str(future.exception())})
+                else:
+                    answers.append(future.result())
+
+            if cancellation.done() and not (data.get('keep_partial') and answers):
+                return self._cancelled_response()
+            if not answers:
+                return self._error_response("Failed to generate responses from every LLM", {"failures": failures})
+
+            message_data = self.db.create_message(
+                chat_public_id=data['chat_id'],
+                user_public_id=data['user_id'],
+                content=data['user_input'],
+                role='user',
+                llm_public_id=None
+            )
+            llm_messages = [
+                self.db.create_message(
+                    chat_public_id=data['chat_id'],
+                    user_public_id=data['user_id'],
+                    content=llm_response.content,
+                    role='assistant',
+                    llm_public_id=served_llm['llm_id'],
+                    parent_message_public_id=message_data['message_id'],
+                    usage=llm_response.usage,
+                    latency_ms=llm_response.latency_ms
+                )
+                for llm_response, served_llm in answers
+            ]
+            if cancellation.done():
+                return self._cancelled_response({"user_message": message_data, "llm_responses": llm_messages})
+            message = "Responses generated successfully" if not failures else "Responses partially generated"
+            return self._success_response(message, {
+                "user_message": message_data,
+                "llm_responses": llm_messages,
+                "failures": failures
+            })
+        except InstructionCancelled:
+            return self._cancelled_response()
+        except Exception as e:
+            return self._error_response(f"Failed to generate responses: {str(e)}")
     
-    def regenerate_llm_response(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    def regenerate_llm_response(
+        self,
+        data: Dict[str, Any],
+        on_progress: Optional[Callable[[float], None]] = None,
+        cancelled: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
         """Regenerate response from LLM"""
         if not self._validate_data(data, ['message_id']):
             return self._error_response("Message ID is required")
+        n = data.get('n', 1)
+        if not isinstance(n, int) or not 1 <= n <= LLM_REGENERATE_MAX_CANDIDATES:
+            return self._error_response(f"n must be an integer between 1 and {LLM_REGENERATE_MAX_CANDIDATES}")
 
         try:
+            generation_params = self._parse_generation_params(data)
             message_data = self.db.get_message_by_public_id(data['message_id'])
             if not message_data:
                 return self._error_response("Message not found")
@@ -204,71 +518,674 @@ class LLMManageUnit:
             if not message_data.get('llm_id'):
                 return self._error_response("Original message has no associated LLM")
 
-            llm_data = self.db.get_llm_by_public_id(message_data.get('llm_id'))
+            quota_error = self._check_token_quota(message_data['user_id'])
+            if quota_error:
+                return quota_error
+
+            llm_data = self.registry.llm(message_data.get('llm_id'))
             if not llm_data:
                 return self._error_response("LLM not found")
             
-            provider_data = self.db.get_provider_by_public_id(llm_data.get('provider_id'))
-            endpoint = provider_data.get('api_endpoint')
-            api_key = provider_data.get('api_key')
-            model = llm_data.get('name')
-
-            # already ordered by created_at
-            chat_messages = self.db.get_messages_by_chat(message_data.get('chat_id'))
-
-            def parse_datetime(date_string: str) -> datetime:
-                """Parse a datetime string into a datetime object."""
-                return datetime.fromisoformat(date_string)
-
-            # exclude the message which has the given message_id and the subsequent messages
-            message_history = [
-                {"role": message.get('role'), "content": message.get('content')} 
-                for message in chat_messages
-                if parse_datetime(message.get('created_at')) < parse_datetime(message_data.get('created_at'))
+            provider_data = self.registry.provider(llm_data.get('provider_id'))
+
+            # Only the messages before the regenerated one, cut by an indexed range query
+            message_history = self.db.get_message_history_before(data['message_id'])
+
+            if n == 1:
+                llm_response, served_llm = self._call_unless_cancelled(
+                    cancelled, self._call_llm_with_failover, provider_data, llm_data, message_history, params=generation_params
+                )
+                self._report_progress(on_progress, PROGRESS_ANSWERED)
+                answers = [(llm_response, served_llm)]
+            else:
+                answers = self._generate_candidates(
+                    provider_data, llm_data, message_history, n, on_progress, generation_params, cancelled
+                )
+                if cancelled is not None and cancelled.cancelled and not (data.get('keep_partial') and answers):
+                    return self._cancelled_response()
+                if not answers:
+                    return self._error_response(f"Failed to regenerate response: all {n} candidates failed")
+
+            # Candidates are ranked in the order they arrived and stored as siblings of the original answer
+            llm_messages = [
+                self.db.create_message(
+                    chat_public_id=message_data.get('chat_id'),
+                    user_public_id=message_data.get('user_id'),
+                    content=llm_response.content,
+                    role='assistant',
+                    llm_public_id=served_llm['llm_id'],
+                    parent_message_public_id=message_data.get('parent_message_id'),
+                    rank=rank if n > 1 else None,
+                    usage=llm_response.usage,
+                    latency_ms=llm_response.latency_ms
+                )
+                for rank, (llm_response, served_llm) in enumerate(answers)
             ]
-            # message_history = [
-            #     {"role": message.get('role'), "content": message.get('content')}
-            #     for message in chat_messages[:-1]
-            # ]
+            if cancelled is not None and cancelled.cancelled:
+                return self._cancelled_response({"llm_responses": llm_messages})
+            if n > 1:
+                return self._success_response(
+                    "Response candidates regenerated successfully",
+                    {"llm_response": llm_messages[0], "llm_responses": llm_messages, "failed": n - len(llm_messages)}
+                )
+            return self._success_response("Response regenerated successfully", {"llm_response": llm_messages[0]})
+        except InstructionCancelled:
+            return self._cancelled_response()
+        except Exception as e:
+            return self._error_response(f"Failed to regenerate response: {str(e)}")
 
-            response_content = self._call_llm_api(endpoint, model, message_history, api_key)
+    def get_usage_stats(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Get daily token usage and latency per user and LLM with their totals"""
+        try:
+            since = date.fromisoformat(data['since']) if data.get('since') else None
+            until = date.fromisoformat(data['until']) if data.get('until') else None
+        except ValueError:
+            return self._error_response("since and until must be ISO dates (YYYY-MM-DD)")
 
-            llm_message_data = self.db.create_message(
-                chat_public_id=message_data.get('chat_id'),
-                user_public_id=message_data.get('user_id'),
-                content=response_content,
-                role='assistant',
-                llm_public_id=message_data.get('llm_id')
+        try:
+            usage = self.db.get_usage_stats(data.get('user_id'), data.get('llm_id'), since, until)
+            requests_total = sum(row['requests'] for row in usage)
+            totals = {
+                "requests": requests_total,
+                "prompt_tokens": sum(row['prompt_tokens'] for row in usage),
+                "completion_tokens": sum(row['completion_tokens'] for row in usage),
+                "avg_latency_ms": round(sum(row['avg_latency_ms'] * row['requests'] for row in usage) / requests_total) if requests_total else None
+            }
+            return self._success_response("Usage statistics retrieved successfully", {"usage": usage, "totals": totals})
+        except Exception as e:
+            return self._error_response(f"Failed to get usage statistics: {str(e)}")
+
+    def _check_token_quota(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return an error response if the user has used up today's token quota"""
+        quota, used = self.db.get_token_quota(user_id)
+        if quota is not None and used >= quota:
+            return self._error_response(
+                f"Daily token quota exceeded ({used} of {quota} tokens used)",
+                {"daily_token_quota": quota, "tokens_used": used}
             )
-            return self._success_response("Response regenerated successfully", {"llm_response": llm_message_data})
+        return None
+
+    @staticmethod
+    def _parse_generation_params(data: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate the generation_params of an instruction"""
+        try:
+            return validate_generation_params(data.get('generation_params'))
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+    def _generate_candidates(
+        self,
+        provider: Dict[str, Any],
+        llm: Dict[str, Any],
+        messages: List[Dict[str, str]],
+        n: int,
+        on_progress: Optional[Callable[[float], None]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        cancelled: Optional[CancellationToken] = None
+    ) -> List[Tuple[ProviderResponse, Dict[str, Any]]]:
+        """Request n alternative answers concurrently and return the successful ones in arrival order
+
+        If cancelled is set first, the candidates that arrived until then are returned.
+        """
+        # Candidates must not be coalesced, each one is a separate sample
+        pending = {
+            self.fanout_executor.submit(self._call_llm_with_failover, provider, llm, messages, params=params)
+            for _ in range(n)
+        }
+        cancellation = self._cancellation_future(cancelled)
+        answers = []
+        while pending and not cancellation.done():
+            done, _ = wait(pending | {cancellation}, return_when=FIRST_COMPLETED)
+            for future in done - {cancellation}:
+                pending.discard(future)
+                try:
+                    answers.append(future.result())
+                except Exception as e:
+                    logger.warning(f"Candidate for LLM {llm['llm_id']} failed: {e}")
+            self._report_progress(on_progress, PROGRESS_ANSWERED * (n - len(pending)) / n)
+        for future in pending:
+            future.cancel()
+        return answers
+
+    def _call_unless_cancelled(self, cancelled: Optional[CancellationToken], call: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run call, but stop waiting for it and raise InstructionCancelled once cancelled is set
+
+        The call runs on the fan-out pool so the instruction's worker is freed at once; a request
+        already sent to a provider finishes there, bounded by its timeouts.
+        """
+        if cancelled is None:
+            return call(*args, **kwargs)
+        cancellation = self._cancellation_future(cancelled)
+        if cancellation.done():
+            raise InstructionCancelled()
+        future = self.fanout_executor.submit(call, *args, **kwargs)
+        wait([future, cancellation], return_when=FIRST_COMPLETED)
+        if not future.done():
+            future.cancel()
+            raise InstructionCancelled()
+        return future.result()
+
+    @staticmethod
+    def _cancellation_future(cancelled: Optional[CancellationToken]) -> Future:
+        """A future that completes when cancelled is set, so it can be waited on together with calls"""
+        future = Future()
+        if cancelled is not None:
+            cancelled.add_callback(lambda: future.set_result(None))
+        return future
+
+    def warm_up_llm(self, llm: Dict[str, Any]) -> bool:
+        """Send a tiny request so the model server loads the LLM; False if it failed or was already warming"""
+        if not self.warmth.start_warming(llm['llm_id']):
+            return False
+        try:
+            provider = self.registry.provider(llm['provider_id'])
+            if not provider:
+                return False
+            params = merge_generation_params(llm.get('generation_params'), WARMUP_PARAMS)
+            self._call_llm_api(provider, llm['name'], WARMUP_MESSAGES, params=params)
+            self.warmth.record_success(llm['llm_id'])
+            logger.info(f"LLM {llm['name']} is warm")
+            return True
         except Exception as e:
-            return self._error_response(f"Failed to regenerate response: {str(e)}")
+            logger.warning(f"Warmup of LLM {llm['name']} failed: {e}")
+            return False
+        finally:
+            self.warmth.finish_warming(llm['llm_id'])
+
+    def stop_keep_warm(self) -> None:
+        """Stop the keep-warm scheduler"""
+        self._stop_keep_warm.set()
+
+    def _keep_warm(self, interval: float) -> None:
+        """Every interval, warm up the LLMs that served no request during the last interval"""
+        while not self._stop_keep_warm.wait(interval):
+            try:
+                for llm in self.registry.llms():
+                    idle_for = self.warmth.idle_for(llm['llm_id'])
+                    if idle_for is None or idle_for >= interval:
+                        self.fanout_executor.submit(self.warm_up_llm, llm)
+            except Exception as e:
+                logger.error(f"Keep-warm round failed: {e}")
+
+    def submit_job(self, instruction_type: str, handler, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue an instruction as a background job and return the job immediately"""
+        request = {key: value for key, value in data.items() if key != 'async'}
+        job = self.db.create_job(instruction_type, request, user_public_id=request.get('user_id'))
+        self._publish_job_event(job)
+        self.job_executor.submit(self._run_job, job['job_id'], handler, request)
+        return self._success_response("Job queued", {"job": job})
+
+    def get_job_status(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the status, progress and result of a background job"""
+        if not self._validate_data(data, ['job_id']):
+            return self._error_response("Job ID is required")
+
+        # Jobs whose orchestrator stopped stay queued or running; fail them once they go stale
+        self.db.expire_stale_jobs(LLM_JOB_TIMEOUT)
+        job = self.db.get_job_by_public_id(data['job_id'])
+        if not job:
+            return self._error_response(f"Job with ID {data['job_id']} not found")
+        return self._success_response("Job retrieved successfully", {"job": job})
+
+    def _run_job(self, job_id: str, handler, request: Dict[str, Any]) -> None:
+        """Run a queued job's handler and store its outcome"""
+        def report(progress: float) -> None:
+            self._publish_job_event(self.db.update_job(job_id, progress=round(progress, 3)))
+
+        try:
+            self._publish_job_event(self.db.update_job(job_id, status='running'))
+            result = handler(request, on_progress=report)
+            if result['status'] == 'success':
+                job = self.db.update_job(job_id, status='succeeded', progress=1.0, result=result['data'])
+            else:
+                job = self.db.update_job(job_id, status='failed', progress=1.0, result=result['data'], error=result['message'])
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            try:
+                job = self.db.update_job(job_id, status='failed', progress=1.0, error=str(e))
+            except Exception as update_error:
+                # The job expires once it goes stale, see expire_stale_jobs
+                logger.error(f"Could not record failure of job {job_id}: {update_error}")
+                return
+        self._publish_job_event(job)
 
     @staticmethod
-    def _call_llm_api(endpoint: str, model: str, messages: List[Dict[str, str]], api_key: str = None) -> str:
-        """Call LLM API with error handling"""
+    def _report_progress(on_progress: Optional[Callable[[float], None]], progress: float) -> None:
+        """Report job progress; a failed progress update never fails the generation"""
+        if on_progress is None:
+            return
         try:
-            headers = {"Content-Type": "application/json"}
-            if api_key:
-                headers["Authorization"] = f"Bearer {api_key}"
-            
-            payload = {
-                "model": model,
-                "messages": messages
+            on_progress(progress)
+        except Exception as e:
+            logger.warning(f"Failed to report job progress: {e}")
+
+    def _discard_message(self, message: Future) -> None:
+        """Delete a user message stored ahead of a generation that did not produce a reply"""
+        try:
+            message_data = message.result()
+            if message_data:
+                self.db.delete_message(message_data['message_id'])
+        except Exception as e:
+            logger.warning(f"Could not discard user message of a failed generation: {e}")
+
+    def _publish_persist_failure(self, record: Dict[str, Any], error: Exception) -> None:
+        """Push a reply that could not be stored to subscribers of `chat.<chat_id>.message.persist_failed`"""
+        if self.events is not None:
+            self.events.publish(f"{CHAT_ROUTING_PREFIX}.{record['chat_public_id']}.message.persist_failed", {
+                "type": "message",
+                "action": "persist_failed",
+                "message_id": record['public_id'],
+                "chat_id": record['chat_public_id'],
+                "error": str(error)
+            })
+
+    def _publish_job_event(self, job: Dict[str, Any]) -> None:
+        """Push a job's state to subscribers of `job.<job_id>.<status>`"""
+        if self.events is not None:
+            self.events.publish(f"job.{job['job_id']}.{job['status']}", {"type": "job", "job": job})
+
+    def _load_message_history(self, chat_id: str) -> List[Dict[str, str]]:
+        """Load a chat's messages in the role/content shape sent to providers"""
+        # already ordered by created_at
+        chat_messages = self.db.get_messages_by_chat(chat_id)
+        return [
+            {"role": message.get('role'), "content": message.get('content')} 
+            for message in chat_messages
+        ]
+
+    def _call_llm_with_failover(
+        self,
+        provider: Dict[str, Any],
+        llm: Dict[str, Any],
+        messages: List[Dict[str, str]],
+        coalesce: bool = False,
+        deadline: Optional[float] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Tuple[ProviderResponse, Dict[str, Any]]:
+        """Call the LLM, falling back to its equivalent LLMs if the provider fails
+
+        deadline is an optional time.monotonic() value that bounds waiting, retries and failover.
+        The response's latency_ms covers all of them. params are per-request generation settings
+        that override those of whichever LLM serves the call.
+        """
+        started = time.monotonic()
+        response, served_llm = self._call_with_fallbacks(provider, llm, messages, coalesce, deadline, params)
+        self.warmth.record_success(served_llm['llm_id'])
+        return response._replace(latency_ms=round((time.monotonic() - started) * 1000)), served_llm
+
+    def _call_with_fallbacks(
+        self,
+        provider: Dict[str, Any],
+        llm: Dict[str, Any],
+        messages: List[Dict[str, str]],
+        coalesce: bool,
+        deadline: Optional[float],
+        params: Optional[Dict[str, Any]] = None
+    ) -> Tuple[ProviderResponse, Dict[str, Any]]:
+        try:
+            llm_params = merge_generation_params(llm.get('generation_params'), params)
+            return self._call_llm_api(provider, llm['name'], messages, coalesce, deadline, llm_params), llm
+        except FAILOVER_ERRORS as e:
+            last_error = e
+            for fallback_id in llm.get('fallback_llm_ids') or []:
+                fallback_llm = self.registry.llm(fallback_id)
+                fallback_provider = fallback_llm and self.registry.provider(fallback_llm['provider_id'])
+                if not fallback_provider:
+                    continue
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                logger.warning(f"LLM {llm['name']} failed ({last_error}); failing over to {fallback_llm['name']}")
+                try:
+                    fallback_params = merge_generation_params(fallback_llm.get('generation_params'), params)
+                    return self._call_llm_api(
+                        fallback_provider, fallback_llm['name'], messages, coalesce, deadline, fallback_params
+                    ), fallback_llm
+                except FAILOVER_ERRORS as fallback_error:
+                    last_error = fallback_error
+            raise last_error
+
+    def _call_llm_api(
+        self,
+        provider: Dict[str, Any],
+        model: str,
+        messages: List[Dict[str, str]],
+        coalesce: bool = False,
+        deadline: Optional[float] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> ProviderResponse:
+        """Call LLM API, optionally coalescing identical in-flight requests"""
+        # Regenerations and multi-model fan-outs want independent samples, so only callers that opt in share a call
+        if not (coalesce and LLM_COALESCE_REQUESTS):
+            return self._dispatch_llm_call(provider, model, messages, deadline, params)
+
+        key = fingerprint({
+            "provider_id": provider['provider_id'],
+            "endpoint": provider['api_endpoint'],
+            "api_key": provider.get('api_key'),
+            "model": model,
+            "messages": messages,
+            "params": params or {}
+        })
+        return self.inflight.do(key, self._dispatch_llm_call, provider, model, messages, deadline, params)
+
+    def _dispatch_llm_call(
+        self,
+        provider: Dict[str, Any],
+        model: str,
+        messages: List[Dict[str, str]],
+        deadline: Optional[float] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> ProviderResponse:
+        """Send the call on its own, or in a micro-batch if the provider has a batch window"""
+        if not provider.get('batch_window_ms') or not get_adapter(provider.get('kind')).supports_batch:
+            return self._call_llm_api_with_retries(provider, model, messages, deadline, params)
+        # Calls share a batch only if the batched request would be built identically for each
+        key = (provider['provider_id'], provider.get('api_key'), model, fingerprint(params or {}))
+        return self.batcher.submit(
+            key,
+            (messages, deadline),
+            functools.partial(self._send_batch, provider, model, params),
+            window=provider['batch_window_ms'] / 1000,
+            max_size=provider.get('batch_max_size') or LLM_BATCH_MAX_SIZE
+        )
+
+    def _call_llm_api_with_retries(
+        self,
+        provider: Dict[str, Any],
+        model: str,
+        messages: List[Dict[str, str]],
+        deadline: Optional[float] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> ProviderResponse:
+        """Call LLM API with load balancing, circuit breaking, rate limiting and jittered retries"""
+        limiter = self.limiters.limiter_for(provider)
+        return self._with_retries(
+            provider,
+            lambda failed_endpoints: self._call_llm_api_hedged(
+                provider, limiter, model, messages, failed_endpoints, deadline, params
+            ),
+            deadline
+        )
+
+    def _send_batch(
+        self,
+        provider: Dict[str, Any],
+        model: str,
+        params: Optional[Dict[str, Any]],
+        items: List[Tuple[List[Dict[str, str]], Optional[float]]]
+    ) -> List[Any]:
+        """Send a micro-batch of conversations as one request; the earliest caller deadline bounds it"""
+        conversations = [messages for messages, _ in items]
+        deadlines = [deadline for _, deadline in items if deadline is not None]
+        deadline = min(deadlines) if deadlines else None
+        limiter = self.limiters.limiter_for(provider)
+        return self._with_retries(
+            provider,
+            lambda failed_endpoints: self._call_llm_api_batched(
+                provider, limiter, model, conversations, failed_endpoints, deadline, params
+            ),
+            deadline
+        )
+
+    def _with_retries(self, provider: Dict[str, Any], attempt_call: Callable[[List[str]], Any], deadline: Optional[float] = None) -> Any:
+        """Run attempt_call with jittered retries; endpoints that failed are passed to later attempts"""
+        failed_endpoints: List[str] = []
+
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                return attempt_call(failed_endpoints)
+            except (ProviderHTTPError, requests.RequestException) as e:
+                retryable = not isinstance(e, ProviderHTTPError) or e.retryable
+                retry_after = getattr(e, 'retry_after', None)
+                if not retryable or attempt == LLM_MAX_RETRIES or (retry_after or 0) > LLM_RETRY_MAX_DELAY:
+                    raise
+                delay = backoff_delay(attempt, retry_after)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning(f"LLM call to provider {provider['name']} failed ({e}); retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _call_llm_api_hedged(
+        self,
+        provider: Dict[str, Any],
+        limiter: ProviderLimiter,
+        model: str,
+        messages: List[Dict[str, str]],
+        failed_endpoints: List[str],
+        deadline: Optional[float] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> ProviderResponse:
+        """Send the request, and a hedged duplicate if the first is slower than the observed p95
+
+        Every request actually sent holds its own limiter lease until it finishes,
+        so a hedge is only sent when the provider's limits have room for it.
+        """
+        endpoints = provider['endpoints']
+        api_key = provider.get('api_key')
+        adapter = get_adapter(provider.get('kind'))
+        tokens = estimate_tokens(messages)
+        lease = limiter.reserve(tokens, max_wait=self._time_left(deadline, RATE_LIMIT_MAX_WAIT))
+        try:
+            _, health = self.balancer.choose(endpoints, exclude=failed_endpoints)
+        except CircuitOpenError:
+            lease.release()
+            raise
+        hedge_delay = health.hedge_delay()
+        # Without a free hedge worker the primary runs inline rather than queueing behind other calls
+        if hedge_delay is None or not self.hedge_workers.acquire(blocking=False):
+            return self._timed_llm_request(lease, health, adapter, model, messages, api_key, failed_endpoints, deadline, params)
+
+        pending = {self.hedge_executor.submit(
+            self._hedged_task, lease, health, adapter, model, messages, api_key, failed_endpoints, deadline, params
+        )}
+        done, _ = wait(pending, timeout=hedge_delay)
+        if not done:
+            hedge = self._start_hedge(
+                provider, limiter, tokens, health, adapter, model, messages, api_key, failed_endpoints, deadline, params
+            )
+            if hedge is not None:
+                pending.add(hedge)
+
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The losing request keeps its own lease until it completes on the hedge pool
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _start_hedge(self, provider, limiter, tokens, health, adapter, model, messages, api_key, failed_endpoints, deadline, params):
+        """Send a hedged request if a hedge worker, limiter capacity and another healthy replica are free"""
+        if not self.hedge_workers.acquire(blocking=False):
+            return None
+        lease = limiter.try_reserve(tokens)
+        if lease is None:
+            self.hedge_workers.release()
+            logger.info(f"Skipping hedge for provider {provider['name']}: no limiter capacity")
+            return None
+        try:
+            # Prefer a different replica for the hedged request
+            _, hedge_health = self.balancer.choose(provider['endpoints'], exclude=failed_endpoints + [health.endpoint])
+        except CircuitOpenError:
+            lease.release()
+            self.hedge_workers.release()
+            return None
+        logger.info(f"Hedging slow request to {health.endpoint} on {hedge_health.endpoint}")
+        return self.hedge_executor.submit(
+            self._hedged_task, lease, hedge_health, adapter, model, messages, api_key, failed_endpoints, deadline, params
+        )
+
+    def _hedged_task(self, lease, health, adapter, model, messages, api_key, failed_endpoints, deadline, params) -> ProviderResponse:
+        try:
+            return self._timed_llm_request(lease, health, adapter, model, messages, api_key, failed_endpoints, deadline, params)
+        finally:
+            self.hedge_workers.release()
+
+    def _call_llm_api_batched(
+        self,
+        provider: Dict[str, Any],
+        limiter: ProviderLimiter,
+        model: str,
+        conversations: List[List[Dict[str, str]]],
+        failed_endpoints: List[str],
+        deadline: Optional[float] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> List[Any]:
+        """Send a batch to one endpoint; the batch holds a single limiter lease covering all its tokens"""
+        adapter = get_adapter(provider.get('kind'))
+        api_key = provider.get('api_key')
+        lease = limiter.reserve(sum(estimate_tokens(messages) for messages in conversations), max_wait=self._time_left(deadline, RATE_LIMIT_MAX_WAIT))
+        try:
+            _, health = self.balancer.choose(provider['endpoints'], exclude=failed_endpoints)
+        except CircuitOpenError:
+            lease.release()
+            raise
+
+        def send(timeout: Tuple[float, float]) -> Tuple[List[Any], Dict[str, int]]:
+            results = self._post_batch_request(
+                adapter, health.endpoint, model, conversations, api_key, timeout=timeout, params=params
+            )
+            answered = [result for result in results if isinstance(result, ProviderResponse)]
+            usage = {
+                key: sum(result.usage.get(key) or 0 for result in answered)
+                for key in ('prompt_tokens', 'completion_tokens')
             }
+            return results, usage
 
-            # logger.info(f"Calling LLM API at {endpoint} with payload: {json.dumps(payload)}")
+        return self._timed_request(lease, health, send, failed_endpoints, deadline, params)
 
-            response = requests.post(
-                endpoint,
-                headers=headers,
-                json=payload,
-                timeout=30
+    def _timed_llm_request(
+        self,
+        lease: LimiterLease,
+        health,
+        adapter: ProviderAdapter,
+        model: str,
+        messages: List[Dict[str, str]],
+        api_key: Optional[str],
+        failed_endpoints: List[str],
+        deadline: Optional[float] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> ProviderResponse:
+        """Send one chat request to an endpoint, see _timed_request"""
+        def send(timeout: Tuple[float, float]) -> Tuple[ProviderResponse, Dict[str, Optional[int]]]:
+            llm_response = self._post_llm_request(
+                adapter, health.endpoint, model, messages, api_key, timeout=timeout, params=params
             )
-            response.raise_for_status()
-            return response.json()['choices'][0]['message']['content']
-        except requests.RequestException as e:
-            raise Exception(f"API call failed: {str(e)}")
+            return llm_response, llm_response.usage
+
+        return self._timed_request(lease, health, send, failed_endpoints, deadline, params)
+
+    def _timed_request(
+        self,
+        lease: LimiterLease,
+        health,
+        send: Callable[[Tuple[float, float]], Tuple[Any, Dict[str, Optional[int]]]],
+        failed_endpoints: List[str],
+        deadline: Optional[float] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """Send one request to an endpoint with its adaptive timeout, record the outcome and release its lease
+
+        send posts the request with the given (connect, read) timeout and returns its result and token usage.
+        The read timeout is the endpoint's adaptive one, capped by the LLM's read_timeout and the deadline.
+        """
+        started = time.monotonic()
+        endpoint_timeout = health.timeout()
+        connect_timeout, read_timeout = request_timeouts(params)
+        limit = min(endpoint_timeout, read_timeout) if read_timeout else endpoint_timeout
+        # A read timeout shortened by the model's setting or the caller's deadline says nothing about the endpoint
+        capped = limit < endpoint_timeout or (deadline is not None and deadline - started < limit)
+        try:
+            timeout = self._time_left(deadline, limit)
+            result, usage = send((min(connect_timeout, timeout), timeout))
+        except ProviderHTTPError as e:
+            # Client errors still prove the endpoint is up
+            if e.retryable:
+                health.record_failure()
+                failed_endpoints.append(health.endpoint)
+            else:
+                health.record_success()
+            raise
+        except requests.Timeout as e:
+            # Failing to connect is the endpoint's fault whatever the read timeout was
+            if capped and not isinstance(e, requests.ConnectTimeout):
+                health.abandon()
+            else:
+                health.record_failure()
+                failed_endpoints.append(health.endpoint)
+            raise
+        except Exception:
+            health.record_failure()
+            failed_endpoints.append(health.endpoint)
+            raise
+        finally:
+            health.end()
+            lease.release()
+        health.record_success(time.monotonic() - started)
+        lease.record_usage(usage)
+        return result
+
+    @staticmethod
+    def _time_left(deadline: Optional[float], limit: float) -> float:
+        """Cap a wait or timeout at the time remaining before deadline"""
+        if deadline is None:
+            return limit
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.Timeout("Deadline exceeded")
+        return min(limit, remaining)
+
+    @staticmethod
+    def _post_llm_request(
+        adapter: ProviderAdapter,
+        endpoint: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        api_key: str = None,
+        timeout: Union[float, Tuple[float, float]] = (LLM_CONNECT_TIMEOUT, LLM_TIMEOUT_DEFAULT),
+        params: Optional[Dict[str, Any]] = None
+    ) -> ProviderResponse:
+        """Call LLM API with error handling"""
+        url, headers, payload = adapter.build_request(endpoint, model, messages, api_key, params)
+
+        # logger.info(f"Calling LLM API at {url} with payload: {json.dumps(payload)}")
+
+        response = requests.post(
+            url,
+            headers=headers,
+            json=payload,
+            timeout=timeout
+        )
+        if response.status_code >= 400:
+            raise ProviderHTTPError(
+                f"API call failed: {response.status_code} {response.reason} for url: {url}",
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get('Retry-After'))
+            )
+        return adapter.parse_response(response.json())
+
+    @staticmethod
+    def _post_batch_request(
+        adapter: ProviderAdapter,
+        endpoint: str,
+        model: str,
+        conversations: List[List[Dict[str, str]]],
+        api_key: str = None,
+        timeout: Union[float, Tuple[float, float]] = (LLM_CONNECT_TIMEOUT, LLM_TIMEOUT_DEFAULT),
+        params: Optional[Dict[str, Any]] = None
+    ) -> List[Any]:
+        """Call a batch-capable LLM API and return one answer or error per conversation"""
+        url, headers, payload = adapter.build_batch_request(endpoint, model, conversations, api_key, params)
+        response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+        if response.status_code >= 400:
+            raise ProviderHTTPError(
+                f"Batch API call failed: {response.status_code} {response.reason} for url: {url}",
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get('Retry-After'))
+            )
+        return adapter.parse_batch_response(response.json())
 
     @staticmethod
     def _validate_data(data: Dict[str, Any], required_keys: List[str]) -> bool:
@@ -284,4 +1201,9 @@ class LLMManageUnit:
     @staticmethod
     def _error_response(message: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Format error response"""
-        return {"status": "error", "message": message, "data": data or {}}
\ No newline at end of file
+        return {"status": "error", "message": message, "data": data or {}}
+
+    @classmethod
+    def _cancelled_response(cls, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Format the response of a cancelled instruction, with whatever was kept"""
+        return cls._error_response("Instruction cancelled", dict(data or {}, cancelled=True))
\ No newline at end of file
@@ -3,6 +3,9 @@
 from typing import Dict, Any, List, Optional
 import re
 from .database_manage_unit import DatabaseManageUnit, NotFoundError, ValidationError
+from ..versions import USERS_VERSION
+from ..sync import read_sync_position, next_sync_token
+from ..scheduler import SCHEDULER_TIER_WEIGHTS
 
 class UserManageUnit:
     def __init__(self, database_manage_unit: DatabaseManageUnit):
@@ -46,9 +49,16 @@ class UserManageUnit:
             return self._error_response("Invalid username format")
         display_name = data.get('display_name', username)
         profile = data.get('profile')
+        daily_token_quota = data.get('daily_token_quota')
+        priority_tier = data.get('priority_tier')
+        if priority_tier and priority_tier not in SCHEDULER_TIER_WEIGHTS:
+            return self._error_response(self._invalid_tier_message())
 
         try:
-            user_data = self.db.create_user(username=username, display_name=display_name, profile=profile)
+            user_data = self.db.create_user(
+                username=username, display_name=display_name, profile=profile, daily_token_quota=daily_token_quota,
+                priority_tier=priority_tier
+            )
             return self._success_response("User created successfully", {"user": user_data})
         except ValidationError as e:
             return self._error_response(str(e))
@@ -65,6 +75,8 @@ class UserManageUnit:
             if not self._is_valid_username(username):
                 return self._error_response("Invalid username format")
             data['username'] = username
+        if data.get('priority_tier') and data['priority_tier'] not in SCHEDULER_TIER_WEIGHTS:
+            return self._error_response(self._invalid_tier_message())
 
         try:
             user_id = data.pop('user_id')
@@ -89,21 +101,34 @@ class UserManageUnit:
             return self._error_response(f"Failed to delete user: {str(e)}")
     
     def list_users(self, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """List all users."""
+        """List all users, or those changed since updated_since / sync_token, with the version of the list."""
         try:
-            users = self.db.get_all_users()
-            return self._success_response("Users retrieved successfully", {"users": users})
+            since = read_sync_position(data)
+            fields = self.db.select_fields('users', (data or {}).get('fields'), (data or {}).get('view'))
+            # Read first, so a concurrent change can only make the version and token older than the list
+            version = self.db.get_entity_version(USERS_VERSION)
+            sync_token = next_sync_token()
+            if since is None:
+                result = {"users": self.db.get_all_users(fields)}
+            else:
+                changes = self.db.get_changes('users', since, fields=fields)
+                result = {"users": changes['changed'], "deleted": changes['deleted']}
+            result.update(sync_token=sync_token, version=version)
+            return self._success_response("Users retrieved successfully", result)
+        except ValueError as e:
+            return self._error_response(str(e))
         except Exception as e:
             return self._error_response(f"Failed to list users: {str(e)}")
     
     def get_user(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Get user by username or ID."""
+        """Get user by username or ID, optionally limited to fields or a view."""
         try:
             user = None
+            fields = self.db.select_fields('users', data.get('fields'), data.get('view'))
             if 'username' in data:
-                user = self.db.get_user_by_username(data['username'])
+                user = self.db.get_user_by_username(data['username'], fields)
             elif 'user_id' in data:
-                user = self.db.get_user_by_public_id(data['user_id'])
+                user = self.db.get_user_by_public_id(data['user_id'], fields)
             else:
                 return self._error_response("Username or user ID is required")
 
@@ -176,6 +201,10 @@ class UserManageUnit:
         pattern = r'^[a-zA-Z][a-zA-Z0-9_]{2,29}$'
         return bool(re.match(pattern, username))
 
+    @staticmethod
+    def _invalid_tier_message() -> str:
+        return f"priority_tier must be one of: {', '.join(SCHEDULER_TIER_WEIGHTS)}"
+
     @staticmethod
     def _validate_data(data: Dict[str, Any], required_keys: List[str]) -> bool:
         """Validate presence of required keys in data"""
@@ -0,0 +1,174 @@
+# llmchatlinker/units/write_behind.py
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Attempts of one write before it is reported as failed, and the delay before the first retry (doubled per retry)
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv('WRITE_BEHIND_MAX_ATTEMPTS', 5))
+WRITE_BEHIND_RETRY_DELAY = float(os.getenv('WRITE_BEHIND_RETRY_DELAY', 0.5))
+# Longest a read waits for pending writes before it goes ahead without them
+WRITE_BEHIND_FLUSH_TIMEOUT = float(os.getenv('WRITE_BEHIND_FLUSH_TIMEOUT', 10))
+# The journal is rewritten without completed writes once it has this many lines and nothing is pending
+WRITE_BEHIND_COMPACT_LINES = int(os.getenv('WRITE_BEHIND_COMPACT_LINES', 1000))
+
+class WriteBehindQueue:
+    """Applies writes on a background thread after their caller has moved on.
+
+    With a journal path, every record is appended (and fsynced) to the journal before
+    submit returns and marked done once written, so writes still pending when the
+    process stops are replayed by the next one; the write must therefore be idempotent
+    per record ID. A failing write is retried with exponential backoff, unless it raised
+    one of fatal_errors, and is then reported through on_failure and kept in the journal.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[Dict[str, Any]], Any],
+        journal_path: Optional[str] = None,
+        fatal_errors: Tuple[type, ...] = (),
+        max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS,
+        retry_delay: float = WRITE_BEHIND_RETRY_DELAY
+    ):
+        self.write = write
+        self.journal_path = journal_path
+        self.fatal_errors = fatal_errors
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        # Called with the record and the last error of a write that was given up
+        self.on_failure: Optional[Callable[[Dict[str, Any], Exception], None]] = None
+        self._cond = threading.Condition()
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._pending = 0
+        self._written = 0
+        # Failed entries stay in the journal until a later process replays them
+        self._failed: Dict[str, Dict[str, Any]] = {}
+        self._journal_lines = 0
+        self._thread: Optional[threading.Thread] = None
+        if journal_path:
+            self._replay()
+
+    def submit(self, record_id: str, record: Dict[str, Any]) -> None:
+        """Queue a JSON-serializable record for writing"""
+        entry = {"id": record_id, "record": record}
+        with self._cond:
+            self._append_journal(entry)
+            self._enqueue(entry)
+
+    def flush(self, timeout: float = WRITE_BEHIND_FLUSH_TIMEOUT) -> bool:
+        """Wait until every submitted write has been applied or given up and reported; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"pending": self._pending, "written": self._written, "failed": len(self._failed)}
+
+    def _enqueue(self, entry: Dict[str, Any]) -> None:
+        # Called with the lock held
+        self._queue.append(entry)
+        self._pending += 1
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                entry = self._queue.popleft()
+            error = self._apply(entry['record'])
+            if error is not None:
+                # Reported before the write stops counting as pending, so flush covers the report
+                self._report_failure(entry, error)
+            with self._cond:
+                if error is None:
+                    self._written += 1
+                    # Replays are idempotent, so losing a done marker in a crash only costs a rewrite
+                    self._append_journal({"done": entry['id']}, sync=False)
+                else:
+                    self._failed[entry['id']] = entry
+                self._pending -= 1
+                if self._pending == 0 and self._journal_lines >= WRITE_BEHIND_COMPACT_LINES:
+                    # Nothing is in flight, so only the given-up writes still need their lines
+                    self._rewrite_journal(self._failed.values())
+                self._cond.notify_all()
+
+    def _apply(self, record: Dict[str, Any]) -> Optional[Exception]:
+        """Write a record, retrying on errors; returns the last error if every attempt failed"""
+        for attempt in range(self.max_attempts):
+            try:
+                self.write(record)
+                return None
+            except self.fatal_errors as e:
+                return e
+            except Exception as e:
+                if attempt == self.max_attempts - 1:
+                    return e
+                delay = self.retry_delay * 2 ** attempt
+                logger.warning(f"Write-behind write failed ({e}); retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _report_failure(self, entry: Dict[str, Any], error: Exception) -> None:
+        logger.error(f"Gave up write-behind write {entry['id']}: {error}")
+        if self.on_failure is None:
+            return
+        try:
+            self.on_failure(entry['record'], error)
+        except Exception as e:
+            logger.error(f"Failed to report write-behind failure of {entry['id']}: {e}")
+
+    def _append_journal(self, line: Dict[str, Any], sync: bool = True) -> None:
+        # Called with the lock held
+        if not self.journal_path:
+            return
+        with open(self.journal_path, 'a', encoding='utf-8') as journal:
+            journal.write(json.dumps(line) + '\n')
+            if sync:
+                journal.flush()
+                os.fsync(journal.fileno())
+        self._journal_lines += 1
+
+    def _rewrite_journal(self, entries: Iterable[Dict[str, Any]]) -> None:
+        # Called with the lock held; the journal is replaced atomically
+        temporary_path = f"{self.journal_path}.tmp"
+        lines = 0
+        with open(temporary_path, 'w', encoding='utf-8') as journal:
+            for entry in entries:
+                journal.write(json.dumps(entry) + '\n')
+                lines += 1
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temporary_path, self.journal_path)
+        self._journal_lines = lines
+
+    def _replay(self) -> None:
+        """Queue the journaled writes that were never completed"""
+        if not os.path.exists(self.journal_path):
+            return
+        entries: Dict[str, Dict[str, Any]] = {}
+        with open(self.journal_path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line torn by a crash while it was being appended
+                    continue
+                if 'done' in entry:
+                    entries.pop(entry['done'], None)
+                else:
+                    entries[entry['id']] = entry
+        with self._cond:
+            # The replayed entries are marked done as usual once written
+            self._rewrite_journal(entries.values())
+            for entry in entries.values():
+                self._enqueue(entry)
+        if entries:
+            logger.info(f"Replaying {len(entries)} pending write-behind writes from {self.journal_path}")
@@ -0,0 +1,75 @@
+# llmchatlinker/versions.py
+
+import os
+import time
+import threading
+from typing import Dict, Optional, Tuple
+
+# Version counters, bumped in the same transaction as every change they cover
+USERS_VERSION = 'users'
+# Chats embed their users and messages, so this also covers those
+CHATS_VERSION = 'chats'
+LLM_CONFIG_VERSION = 'llm_config'
+
+# Bumped counters are broadcast as `version.<name>` events carrying the new value
+VERSION_ROUTING_PREFIX = 'version'
+
+# Seconds a known version is trusted to answer If-None-Match without asking an orchestrator
+ETAG_VERSION_TTL = float(os.getenv('ETAG_VERSION_TTL', 60))
+
+def make_etag(name: str, version: int) -> str:
+    """Weak ETag of everything the named counter covers at a version"""
+    return f'W/"{name}-{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names the ETag, using the weak comparison"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or _opaque_tag(etag) in [_opaque_tag(candidate) for candidate in candidates]
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith('W/') else etag
+
+class VersionCache:
+    """Latest known value of each version counter, kept up to date by version events.
+
+    A value is only used while version events are being received and for at most ttl
+    seconds after it was last confirmed, which bounds the damage of a lost event.
+    Values never go backwards, so a late event cannot undo an invalidation.
+    """
+
+    def __init__(self, ttl: float = ETAG_VERSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._listening = False
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        self._seen: Dict[str, int] = {}
+
+    def get(self, name: str) -> Optional[int]:
+        """The counter's value if it is known and fresh"""
+        with self._lock:
+            if not self._listening or name not in self._versions:
+                return None
+            version, confirmed_at = self._versions[name]
+            if time.monotonic() - confirmed_at >= self.ttl:
+                return None
+            return version
+
+    def update(self, name: str, version: int) -> None:
+        with self._lock:
+            if version < self._seen.get(name, 0):
+                return
+            self._seen[name] = version
+            self._versions[name] = (version, time.monotonic())
+
+    def invalidate(self, name: str) -> None:
+        """Forget a counter's value until a newer one is learned"""
+        with self._lock:
+            self._versions.pop(name, None)
+
+    def set_listening(self, listening: bool) -> None:
+        """Values learned while no events were received may be stale, so they are dropped"""
+        with self._lock:
+            self._listening = listening
+            self._versions.clear()
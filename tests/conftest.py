@@ -0,0 +1,40 @@
+import threading
+import pytest
+from llmchatlinker.providers.mock_server import create_server, MockProviderConfig
+from llmchatlinker.units.database_manage_unit import DatabaseManageUnit, DatabaseConfig, Base
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A DatabaseManageUnit backed by a throwaway SQLite file."""
+    monkeypatch.setattr(DatabaseConfig, "DATABASE_URI", f"sqlite:///{tmp_path / 'test.db'}")
+    unit = DatabaseManageUnit()
+    # init_db drops tables with CASCADE, which SQLite does not support
+    Base.metadata.create_all(unit.engine)
+    yield unit
+    unit.engine.dispose()
+
+class MockProviders:
+    """Mock provider servers started on free ports."""
+
+    def __init__(self):
+        self.servers = []
+
+    def __call__(self, **config):
+        server = create_server(port=0, config=MockProviderConfig(**config))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+    def requests_served(self):
+        return sum(server.RequestHandlerClass.requests_served for server in self.servers)
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+@pytest.fixture
+def mock_provider():
+    providers = MockProviders()
+    yield providers
+    providers.stop()
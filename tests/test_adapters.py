@@ -0,0 +1,72 @@
+import pytest
+from llmchatlinker.providers.adapters import get_adapter, OpenAIChatAdapter, OllamaChatAdapter
+from llmchatlinker.providers.health import ProviderHTTPError
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+def test_openai_request_and_response_shape():
+    adapter = get_adapter('openai')
+    url, headers, payload = adapter.build_request("http://e/v1/chat/completions", "gpt", MESSAGES, api_key="secret")
+    assert url == "http://e/v1/chat/completions"
+    assert headers["Authorization"] == "Bearer secret"
+    assert payload == {"model": "gpt", "messages": MESSAGES}
+
+    response = adapter.parse_response({
+        "choices": [{"message": {"role": "assistant", "content": "hello"}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 5}
+    })
+    assert response.content == "hello"
+    assert response.usage == {"prompt_tokens": 3, "completion_tokens": 5}
+
+def test_openai_response_without_usage():
+    response = OpenAIChatAdapter().parse_response({"choices": [{"message": {"content": "x"}}]})
+    assert response.usage == {"prompt_tokens": None, "completion_tokens": None}
+
+def test_ollama_request_and_response_shape():
+    adapter = get_adapter('ollama')
+    _, headers, payload = adapter.build_request("http://e/api/chat", "llama", MESSAGES)
+    assert "Authorization" not in headers
+    assert payload == {"model": "llama", "messages": MESSAGES, "stream": False}
+
+    response = adapter.parse_response({"message": {"content": "hello"}, "prompt_eval_count": 4, "eval_count": 6})
+    assert response.content == "hello"
+    assert response.usage == {"prompt_tokens": 4, "completion_tokens": 6}
+
+def test_default_and_unknown_kinds():
+    assert isinstance(get_adapter(None), OpenAIChatAdapter)
+    assert isinstance(get_adapter('ollama'), OllamaChatAdapter)
+    with pytest.raises(ValueError, match="Unknown provider kind"):
+        get_adapter('mlmodelscope')
+
+def test_openai_batch_request_and_response_shape():
+    adapter = get_adapter('openai')
+    assert adapter.supports_batch
+    url, _, payload = adapter.build_batch_request("http://e/v1/chat/completions/", "gpt", [MESSAGES, MESSAGES])
+    assert url == "http://e/v1/chat/completions/batch"
+    assert payload == {"model": "gpt", "requests": [{"messages": MESSAGES}, {"messages": MESSAGES}]}
+
+    results = adapter.parse_batch_response({"responses": [
+        {"choices": [{"message": {"content": "hello"}}], "usage": {"prompt_tokens": 1, "completion_tokens": 2}},
+        {"error": "context too long", "status": 400}
+    ]})
+    assert results[0].content == "hello"
+    assert isinstance(results[1], ProviderHTTPError)
+    assert results[1].status_code == 400 and not results[1].retryable
+
+def test_ollama_does_not_batch():
+    adapter = get_adapter('ollama')
+    assert not adapter.supports_batch
+    with pytest.raises(NotImplementedError):
+        adapter.build_batch_request("http://e/api/chat", "llama", [MESSAGES])
+
+def test_generation_params_are_mapped_per_api():
+    params = {"max_tokens": 64, "temperature": 0.2, "stop": ["\n\n"], "read_timeout": 10}
+    _, _, payload = get_adapter('openai').build_request("http://e", "gpt", MESSAGES, params=params)
+    # Timeouts bound the caller's side only and are never sent
+    assert payload == {"model": "gpt", "messages": MESSAGES, "max_tokens": 64, "temperature": 0.2, "stop": ["\n\n"]}
+
+    _, _, payload = get_adapter('ollama').build_request("http://e/api/chat", "llama", MESSAGES, params=params)
+    assert payload["options"] == {"num_predict": 64, "temperature": 0.2, "stop": ["\n\n"]}
+
+    _, _, payload = get_adapter('openai').build_batch_request("http://e", "gpt", [MESSAGES], params={"max_tokens": 8})
+    assert payload["requests"] == [{"messages": MESSAGES, "max_tokens": 8}]
@@ -0,0 +1,52 @@
+from collections import Counter
+import pytest
+from llmchatlinker.providers import health as health_module
+from llmchatlinker.providers.balancer import EndpointBalancer
+from llmchatlinker.providers.health import HealthTracker, CircuitOpenError
+
+ENDPOINTS = [{'url': 'http://a', 'weight': 2}, {'url': 'http://b', 'weight': 1}]
+
+def test_burst_spreads_by_weight():
+    balancer = EndpointBalancer(HealthTracker())
+    # Claims are never ended, as with a burst of concurrent in-flight requests
+    chosen = Counter(balancer.choose(ENDPOINTS)[0]['url'] for _ in range(30))
+    assert chosen == {'http://a': 20, 'http://b': 10}
+
+def test_choose_counts_request_as_outstanding():
+    tracker = HealthTracker()
+    balancer = EndpointBalancer(tracker)
+    _, health = balancer.choose(ENDPOINTS)
+    assert health.outstanding == 1
+    health.end()
+    assert health.outstanding == 0
+
+def test_excluded_endpoint_is_last_resort():
+    balancer = EndpointBalancer(HealthTracker())
+    for _ in range(5):
+        endpoint, health = balancer.choose(ENDPOINTS, exclude=['http://a'])
+        assert endpoint['url'] == 'http://b'
+        health.end()
+    endpoint, _ = balancer.choose([ENDPOINTS[0]], exclude=['http://a'])
+    assert endpoint['url'] == 'http://a'
+
+def test_open_circuit_is_ejected(monkeypatch):
+    monkeypatch.setattr(health_module, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    tracker = HealthTracker()
+    balancer = EndpointBalancer(tracker)
+    tracker.for_endpoint('http://a').record_failure()
+    for _ in range(5):
+        endpoint, health = balancer.choose(ENDPOINTS)
+        assert endpoint['url'] == 'http://b'
+        health.end()
+    tracker.for_endpoint('http://b').record_failure()
+    with pytest.raises(CircuitOpenError):
+        balancer.choose(ENDPOINTS)
+
+def test_ewma_strategy_prefers_faster_endpoint():
+    tracker = HealthTracker()
+    balancer = EndpointBalancer(tracker, strategy='ewma')
+    endpoints = [{'url': 'http://slow', 'weight': 1}, {'url': 'http://fast', 'weight': 1}]
+    tracker.for_endpoint('http://slow').record_success(2.0)
+    tracker.for_endpoint('http://fast').record_success(0.1)
+    endpoint, health = balancer.choose(endpoints)
+    assert endpoint['url'] == 'http://fast'
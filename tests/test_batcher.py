@@ -0,0 +1,85 @@
+import threading
+import time
+import pytest
+from llmchatlinker.providers.batcher import MicroBatcher
+
+def submit_concurrently(batcher, items, send, window=0.2, max_size=10, key="model"):
+    results = {}
+
+    def call(item):
+        try:
+            results[item] = batcher.submit(key, item, send, window=window, max_size=max_size)
+        except Exception as e:
+            results[item] = e
+
+    threads = [threading.Thread(target=call, args=(item,)) for item in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+def test_concurrent_items_are_sent_as_one_batch():
+    batches = []
+
+    def send(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    results = submit_concurrently(MicroBatcher(), [1, 2, 3], send)
+    assert results == {1: 10, 2: 20, 3: 30}
+    assert len(batches) == 1 and sorted(batches[0]) == [1, 2, 3]
+
+def test_full_batch_is_sent_before_the_window_closes():
+    batches = []
+
+    def send(items):
+        batches.append(len(items))
+        return list(items)
+
+    started = time.monotonic()
+    submit_concurrently(MicroBatcher(), [1, 2, 3, 4], send, window=5, max_size=2)
+    assert time.monotonic() - started < 2
+    assert batches == [2, 2]
+
+def test_lone_item_waits_at_most_the_window():
+    started = time.monotonic()
+    assert MicroBatcher().submit("model", 1, lambda items: ["done"], window=0.05, max_size=10) == "done"
+    assert time.monotonic() - started < 1
+
+def test_keys_are_batched_separately():
+    batcher = MicroBatcher()
+    batches = []
+
+    def send(items):
+        batches.append(list(items))
+        return list(items)
+
+    threads = [
+        threading.Thread(target=batcher.submit, args=(key, item, send), kwargs={"window": 0.2, "max_size": 10})
+        for key, item in (("a", 1), ("b", 2), ("a", 3))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert sorted(sorted(batch) for batch in batches) == [[1, 3], [2]]
+
+def test_errors_reach_the_right_callers():
+    def send(items):
+        return [ValueError(f"bad {item}") if item == 2 else item for item in items]
+
+    results = submit_concurrently(MicroBatcher(), [1, 2], send)
+    assert results[1] == 1
+    assert isinstance(results[2], ValueError)
+
+def test_failed_batch_fails_every_caller():
+    def send(items):
+        raise ConnectionError("down")
+
+    results = submit_concurrently(MicroBatcher(), [1, 2], send)
+    assert all(isinstance(result, ConnectionError) for result in results.values())
+
+def test_result_count_mismatch_is_an_error():
+    with pytest.raises(ValueError, match="returned 0 results"):
+        MicroBatcher().submit("model", 1, lambda items: [], window=0, max_size=10)
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+import pytest
+from llmchatlinker.cancellation import CancellationRegistry, CancellationToken
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+
+def test_cancel_reaches_running_instruction():
+    registry = CancellationRegistry()
+    token = registry.register("corr")
+    calls = []
+    token.add_callback(lambda: calls.append("cancelled"))
+    assert registry.cancel("corr")
+    assert token.cancelled and calls == ["cancelled"]
+    # Callbacks added after the cancellation run at once
+    token.add_callback(lambda: calls.append("late"))
+    assert calls == ["cancelled", "late"]
+
+def test_cancel_before_start_is_remembered():
+    registry = CancellationRegistry()
+    assert not registry.cancel("queued")
+    assert registry.register("queued").cancelled
+    # The cancellation is used up by the instruction it was meant for
+    registry.release("queued")
+    assert not registry.register("queued").cancelled
+
+def test_forgotten_cancellations_expire():
+    registry = CancellationRegistry(remember=0)
+    registry.cancel("old")
+    registry.cancel("new")
+    assert not registry.register("old").cancelled
+
+@pytest.fixture
+def setup(db, mock_provider):
+    """A user, a chat, a slow LLM and a fast LLM."""
+    unit = LLMManageUnit(db)
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    llms = {}
+    for name, latency in (("slow", 1.5), ("fast", 0)):
+        provider = unit.add_llm_provider({"name": name, "api_endpoint": mock_provider(latency=latency)})['data']['provider']
+        llms[name] = unit.add_llm({"provider_id": provider['provider_id'], "llm_name": name})['data']['llm']
+    return unit, user, chat, llms
+
+def cancel_after(token, delay):
+    threading.Timer(delay, token.cancel).start()
+    return token
+
+def test_cancelled_generation_returns_early_and_stores_nothing(db, setup):
+    unit, user, chat, llms = setup
+    request = {
+        "chat_id": chat['chat_id'], "user_id": user['user_id'],
+        "provider_id": llms['slow']['provider_id'], "llm_id": llms['slow']['llm_id'], "user_input": "hello"
+    }
+    started = time.monotonic()
+    response = unit.handle_instruction('LLM_RESPONSE_GENERATE', request, cancel_after(CancellationToken(), 0.2))
+    assert time.monotonic() - started < 1
+    assert response['status'] == 'error' and response['data']['cancelled']
+    assert db.get_messages_by_chat(chat['chat_id']) == []
+
+def test_already_cancelled_generation_sends_nothing(setup, mock_provider):
+    unit, user, chat, llms = setup
+    token = CancellationToken()
+    token.cancel()
+    request = {
+        "chat_id": chat['chat_id'], "user_id": user['user_id'],
+        "provider_id": llms['fast']['provider_id'], "llm_id": llms['fast']['llm_id'], "user_input": "hello"
+    }
+    assert unit.generate_llm_response(request, cancelled=token)['data']['cancelled']
+    assert mock_provider.requests_served() == 0
+
+@pytest.mark.parametrize("keep_partial", [False, True])
+def test_cancelled_multi_generation_keeps_partial_answers_on_request(db, setup, keep_partial):
+    unit, user, chat, llms = setup
+    request = {
+        "chat_id": chat['chat_id'], "user_id": user['user_id'], "user_input": "hello",
+        "llm_ids": [llms['slow']['llm_id'], llms['fast']['llm_id']], "keep_partial": keep_partial
+    }
+    response = unit.generate_multi_llm_response(request, cancelled=cancel_after(CancellationToken(), 0.3))
+    assert response['data']['cancelled']
+    stored = db.get_messages_by_chat(chat['chat_id'])
+    if keep_partial:
+        assert [message['llm_id'] for message in response['data']['llm_responses']] == [llms['fast']['llm_id']]
+        assert len(stored) == 2
+    else:
+        assert stored == []
+
+def test_api_cancels_instruction_when_client_disconnects(monkeypatch):
+    api = pytest.importorskip("llmchatlinker.api")
+    monkeypatch.setattr(api, "DISCONNECT_POLL_INTERVAL", 0.01)
+    released = threading.Event()
+    cancelled = []
+
+    def call(correlation_id):
+        released.wait(5)
+        return {"status": "error", "message": "Instruction cancelled", "data": {"cancelled": True}}
+
+    def cancel_instruction(correlation_id):
+        cancelled.append(correlation_id)
+        released.set()
+
+    class DisconnectedRequest:
+        async def is_disconnected(self):
+            return True
+
+    monkeypatch.setattr(api.client, "cancel_instruction", cancel_instruction)
+    response = asyncio.run(api.call_until_disconnected(DisconnectedRequest(), call))
+    assert response['data']['cancelled']
+    assert len(cancelled) == 1
@@ -0,0 +1,43 @@
+from llmchatlinker.units.chat_manage_unit import ChatManageUnit
+
+def test_messages_keep_the_chat_summary_current(db):
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    first = db.create_message(chat['chat_id'], user['user_id'], "first", "user", None)
+    second = db.create_message(chat['chat_id'], user['user_id'], "x" * 500, "user", None)
+    summary = db.get_chat_by_public_id(chat['chat_id'], fields=['message_count', 'last_message_preview', 'last_activity_at'])
+    assert summary['message_count'] == 2
+    assert summary['last_message_preview'] == "x" * 100
+    assert summary['last_activity_at'] == second['created_at']
+
+    db.update_message(second['message_id'], "edited")
+    assert db.get_chat_by_public_id(chat['chat_id'])['last_message_preview'] == "edited"
+    db.delete_message(second['message_id'])
+    summary = db.get_chat_by_public_id(chat['chat_id'])
+    assert (summary['message_count'], summary['last_message_preview'], summary['last_activity_at']) == (1, "first", first['created_at'])
+    db.delete_message(first['message_id'])
+    summary = db.get_chat_by_public_id(chat['chat_id'])
+    assert (summary['message_count'], summary['last_message_preview'], summary['last_activity_at']) == (0, None, summary['created_at'])
+
+def test_late_message_does_not_replace_newer_preview(db):
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    db.create_message(chat['chat_id'], user['user_id'], "question", "user", None)
+    late = db.create_message_behind(chat['chat_id'], user['user_id'], "answer", "assistant", None)
+    newer = db.create_message(chat['chat_id'], user['user_id'], "follow-up", "user", None)
+    db.write_behind.flush()
+    summary = db.get_chat_by_public_id(chat['chat_id'])
+    assert summary['message_count'] == 3
+    assert summary['last_message_preview'] == "follow-up"
+    assert late['created_at'] < newer['created_at']
+
+def test_user_chats_are_listed_by_last_activity(db):
+    chats = ChatManageUnit(db)
+    user = db.create_user("alice", "Alice", "")
+    older = db.create_chat("older", [user['user_id']])
+    newer = db.create_chat("newer", [user['user_id']])
+    deleted = db.create_chat("deleted", [user['user_id']])
+    db.delete_chat(deleted['chat_id'])
+    db.create_message(older['chat_id'], user['user_id'], "hi", "user", None)
+    listed = chats.list_chats_by_user({"user_id": user['user_id'], "view": "summary"})['data']['chats']
+    assert [(chat['title'], chat['message_count']) for chat in listed] == [("older", 1), ("newer", 0)]
@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+
+def test_message_changes_are_announced_after_commit(db):
+    announced = []
+    db.on_message_change = lambda action, message: announced.append((action, message['message_id'], message['chat_id']))
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    message = db.create_message(chat['chat_id'], user['user_id'], "hi", "user", None, public_id="fixed")
+    # Writing the same message again changes nothing
+    db.create_message(chat['chat_id'], user['user_id'], "hi", "user", None, public_id="fixed")
+    db.update_message(message['message_id'], "hello")
+    db.delete_message(message['message_id'])
+    assert announced == [
+        ("created", "fixed", chat['chat_id']), ("updated", "fixed", chat['chat_id']), ("deleted", "fixed", chat['chat_id'])
+    ]
+
+class FakeSubscriber:
+    """Stands in for EventSubscriber, delivering the given events and then idling until stopped."""
+
+    bindings = []
+
+    def __init__(self, binding_keys, events=({"type": "message", "action": "created"},)):
+        FakeSubscriber.bindings.append(binding_keys)
+        self._events = list(events)
+        self.closed = False
+
+    def events(self, timeout=None, poll_interval=1, stop=None):
+        for event in self._events:
+            yield "chat.c1.message.created", event
+        stop.wait(5)
+
+    def close(self):
+        self.closed = True
+
+class FakeWebSocket:
+    """Disconnects once it has been sent `expected` messages."""
+
+    def __init__(self, expected=2):
+        self.expected = expected
+        self.accepted = False
+        self.closed_with = None
+        self.sent = []
+
+    async def accept(self):
+        self.accepted = True
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def receive(self):
+        while len(self.sent) < self.expected:
+            await asyncio.sleep(0.01)
+        return {"type": "websocket.disconnect"}
+
+@pytest.fixture
+def api(monkeypatch):
+    api = pytest.importorskip("llmchatlinker.api")
+    chat = {"status": "success", "message": "", "data": {"chat": {"chat_id": "c1", "users": [{"user_id": "u1"}]}}}
+    monkeypatch.setattr(api.client, "get_chat", lambda chat_id, **kwargs: chat)
+    monkeypatch.setattr(api, "EventSubscriber", FakeSubscriber)
+    return api
+
+def test_participant_receives_chat_events(api):
+    websocket = FakeWebSocket()
+    asyncio.run(asyncio.wait_for(api.chat_updates(websocket, "c1", "u1"), 5))
+    assert websocket.accepted
+    assert FakeSubscriber.bindings[-1] == ["chat.c1.#"]
+    assert websocket.sent == [{"type": "subscribed", "chat_id": "c1"}, {"type": "message", "action": "created"}]
+
+def test_non_participant_is_rejected(api):
+    websocket = FakeWebSocket()
+    asyncio.run(api.chat_updates(websocket, "c1", "u2"))
+    assert not websocket.accepted and websocket.closed_with == 1008
@@ -103,6 +103,36 @@ def test_generate_llm_response(client, config):
     
     print(f" [x] Message ID: {message_id}")
 
+def test_generate_multi_llm_response(client, config):
+    response = client.generate_multi_llm_response(
+        user_id=config['user_id'],
+        chat_id=config['chat_id'],
+        llm_ids=[config['llm_id']],
+        user_input="What is the tallest mountain in the world?"
+    )
+    assert response["status"] == "success"
+    user_message_id = response["data"]["user_message"]["message_id"]
+    llm_responses = response["data"]["llm_responses"]
+    assert len(llm_responses) == 1
+    assert llm_responses[0]["parent_message_id"] == user_message_id
+
+def test_generate_llm_response_async(client, config):
+    response = client.generate_llm_response(
+        user_id=config['user_id'],
+        chat_id=config['chat_id'],
+        provider_id=config['provider_id'],
+        llm_id=config['llm_id'],
+        user_input="What is the longest river in the world?",
+        run_async=True
+    )
+    assert response["status"] == "success"
+    job_id = response["data"]["job"]["job_id"]
+
+    response = client.wait_for_job(job_id, timeout=120)
+    assert response["status"] == "success"
+    assert response["data"]["job"]["status"] == "succeeded"
+    assert response["data"]["job"]["result"]["llm_response"]["role"] == "assistant"
+
 def test_regenerate_llm_response(client, config):
     message_id = config['message_id']
     response = client.regenerate_llm_response(message_id=message_id)
@@ -0,0 +1,44 @@
+import pytest
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+from llmchatlinker.providers.generation import (
+    LLM_CONNECT_TIMEOUT, validate_generation_params, merge_generation_params, request_timeouts
+)
+
+@pytest.mark.parametrize("params, error", [
+    ({"top_k": 5}, "Unknown generation params"),
+    ({"max_tokens": 0}, "max_tokens"),
+    ({"max_tokens": True}, "max_tokens"),
+    ({"temperature": 2.5}, "temperature"),
+    ({"stop": [""]}, "stop"),
+    ({"stop": ["a", "b", "c", "d", "e"]}, "at most"),
+    ({"read_timeout": 0}, "read_timeout"),
+    ({"connect_timeout": "5"}, "connect_timeout"),
+])
+def test_invalid_generation_params(params, error):
+    with pytest.raises(ValueError, match=error):
+        validate_generation_params(params)
+
+def test_valid_generation_params_are_normalized():
+    assert validate_generation_params(None) == {}
+    assert validate_generation_params({"max_tokens": 16, "stop": "END", "temperature": None}) == {"max_tokens": 16, "stop": ["END"]}
+
+def test_request_params_override_llm_defaults():
+    merged = merge_generation_params({"max_tokens": 256, "read_timeout": 20}, {"max_tokens": 16, "temperature": None})
+    assert merged == {"max_tokens": 16, "read_timeout": 20}
+    assert request_timeouts(merged) == (LLM_CONNECT_TIMEOUT, 20)
+
+def test_llm_generation_params_are_stored(db):
+    unit = LLMManageUnit(db)
+    provider = unit.add_llm_provider({"name": "provider", "api_endpoint": "http://127.0.0.1:1/v1/chat/completions"})['data']['provider']
+
+    response = unit.add_llm({"provider_id": provider['provider_id'], "llm_name": "model", "generation_params": {"temperature": 3}})
+    assert response['status'] == 'error'
+
+    llm = unit.add_llm({
+        "provider_id": provider['provider_id'], "llm_name": "model", "generation_params": {"max_tokens": 128, "read_timeout": 15}
+    })['data']['llm']
+    assert db.get_llm_by_public_id(llm['llm_id'])['generation_params'] == {"max_tokens": 128, "read_timeout": 15}
+
+    # Renaming leaves the settings alone, an empty object clears them
+    assert unit.update_llm({"llm_id": llm['llm_id'], "llm_name": "renamed"})['data']['llm']['generation_params']['max_tokens'] == 128
+    assert unit.update_llm({"llm_id": llm['llm_id'], "generation_params": {}})['data']['llm']['generation_params'] == {}
@@ -0,0 +1,79 @@
+import datetime
+from email.utils import format_datetime
+import pytest
+from llmchatlinker.providers import health as health_module
+from llmchatlinker.providers.health import (
+    EndpointHealth, ProviderHTTPError, parse_retry_after, backoff_delay, CLOSED, OPEN, HALF_OPEN
+)
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    retry_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=30)
+    assert 25 <= parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
+
+def test_backoff_prefers_retry_after():
+    assert backoff_delay(3, retry_after=1.5) == 1.5
+    for attempt in range(5):
+        assert 0 <= backoff_delay(attempt) <= health_module.LLM_RETRY_MAX_DELAY
+
+def test_retryable_status_codes():
+    assert ProviderHTTPError("x", 503).retryable
+    assert ProviderHTTPError("x", 429).retryable
+    assert not ProviderHTTPError("x", 400).retryable
+
+def test_circuit_opens_half_opens_and_closes(monkeypatch):
+    monkeypatch.setattr(health_module, "CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(health_module, "CIRCUIT_RESET_TIMEOUT", 10)
+    clock = [100.0]
+    monkeypatch.setattr(health_module.time, "monotonic", lambda: clock[0])
+    endpoint = EndpointHealth("http://e")
+
+    endpoint.record_failure()
+    assert endpoint.state == CLOSED
+    endpoint.record_failure()
+    assert endpoint.state == OPEN
+    assert not endpoint.available()
+    assert not endpoint.allow_request()
+
+    clock[0] += 10
+    assert endpoint.available()
+    # Exactly one probe is let through while half-open
+    assert endpoint.allow_request()
+    assert endpoint.state == HALF_OPEN
+    assert not endpoint.allow_request()
+
+    endpoint.record_success(0.2)
+    assert endpoint.state == CLOSED
+    assert endpoint.allow_request()
+
+def test_failed_probe_reopens_circuit(monkeypatch):
+    monkeypatch.setattr(health_module, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    clock = [0.0]
+    monkeypatch.setattr(health_module.time, "monotonic", lambda: clock[0])
+    endpoint = EndpointHealth("http://e")
+    endpoint.record_failure()
+    clock[0] += health_module.CIRCUIT_RESET_TIMEOUT
+    assert endpoint.allow_request()
+    endpoint.record_failure()
+    assert endpoint.state == OPEN
+    assert not endpoint.allow_request()
+
+def test_timeout_adapts_to_observed_latency(monkeypatch):
+    monkeypatch.setattr(health_module, "LATENCY_MIN_SAMPLES", 5)
+    endpoint = EndpointHealth("http://e")
+    assert endpoint.timeout() == health_module.LLM_TIMEOUT_DEFAULT
+    for _ in range(5):
+        endpoint.record_success(100.0)
+    assert endpoint.timeout() == health_module.LLM_TIMEOUT_MAX
+
+def test_hedge_delay_requires_opt_in(monkeypatch):
+    monkeypatch.setattr(health_module, "LATENCY_MIN_SAMPLES", 1)
+    endpoint = EndpointHealth("http://e")
+    endpoint.record_success(0.5)
+    monkeypatch.setattr(health_module, "LLM_HEDGE_REQUESTS", False)
+    assert endpoint.hedge_delay() is None
+    monkeypatch.setattr(health_module, "LLM_HEDGE_REQUESTS", True)
+    assert endpoint.hedge_delay() == pytest.approx(0.5)
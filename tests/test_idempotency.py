@@ -0,0 +1,107 @@
+import json
+import asyncio
+import threading
+import pytest
+from llmchatlinker import orchestrator as orchestrator_module
+from llmchatlinker.orchestrator import Orchestrator
+from llmchatlinker.cancellation import CancellationToken
+
+class CountingControlUnit:
+    """Answers every instruction with its data, optionally holding executions until released."""
+
+    def __init__(self, status="success"):
+        self.status = status
+        self.executions = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def decode_and_execute_instruction(self, instruction, cancelled):
+        self.executions += 1
+        self.release.wait(5)
+        return {"status": self.status, "message": "", "data": {"execution": self.executions}}
+
+@pytest.fixture
+def orchestrator(db, monkeypatch):
+    monkeypatch.setattr(orchestrator_module, "IDEMPOTENCY_POLL_INTERVAL", 0.01)
+    # Only the parts of an orchestrator that execute instructions; no message queue is needed
+    orchestrator = Orchestrator.__new__(Orchestrator)
+    orchestrator.database_manage_unit = db
+    orchestrator.control_unit = CountingControlUnit()
+    orchestrator._idempotency_purged_at = 0.0
+    return orchestrator
+
+def instruction(key, user_input="hi"):
+    return {"type": "LLM_RESPONSE_GENERATE", "data": {"user_input": user_input}, "idempotency_key": key}
+
+def test_repeats_return_the_first_result(orchestrator):
+    first = orchestrator._execute_once(instruction("k1"), CancellationToken())
+    assert orchestrator._execute_once(instruction("k1"), CancellationToken()) == first
+    assert orchestrator.control_unit.executions == 1
+    # Instructions without a key always execute
+    orchestrator._execute_once({"type": "USER_LIST", "data": {}}, CancellationToken())
+    assert orchestrator.control_unit.executions == 2
+
+def test_key_reused_for_another_request_is_refused(orchestrator):
+    orchestrator._execute_once(instruction("k1"), CancellationToken())
+    result = orchestrator._execute_once(instruction("k1", "bye"), CancellationToken())
+    assert result['status'] == 'error'
+    assert orchestrator.control_unit.executions == 1
+
+def test_failed_instructions_execute_again(orchestrator):
+    orchestrator.control_unit.status = "error"
+    orchestrator._execute_once(instruction("k1"), CancellationToken())
+    orchestrator._execute_once(instruction("k1"), CancellationToken())
+    assert orchestrator.control_unit.executions == 2
+
+def test_concurrent_repeat_waits_for_the_first_execution(orchestrator):
+    orchestrator.control_unit.release.clear()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(orchestrator._execute_once(instruction("k1"), CancellationToken())))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    orchestrator.control_unit.release.set()
+    for thread in threads:
+        thread.join(10)
+    assert orchestrator.control_unit.executions == 1
+    assert results[0] == results[1]
+
+def test_api_sends_the_header_with_the_instruction(monkeypatch):
+    api = pytest.importorskip("llmchatlinker.api")
+    from llmchatlinker import client as client_module
+    sent = []
+
+    def publish_message(message, correlation_id=None):
+        sent.append(json.loads(message))
+        return json.dumps({"status": "success", "message": "", "data": {}}).encode()
+
+    monkeypatch.setattr(client_module, "publish_message", publish_message)
+
+    async def post(path, body, headers):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+            "headers": [(b"content-type", b"application/json")] + [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+            "client": ("127.0.0.1", 1), "server": ("testserver", 80)
+        }
+        messages = [{"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}]
+        statuses = []
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        await api.app(scope, receive, send)
+        return statuses[0]
+
+    assert asyncio.run(post("/user/create", {"username": "alice"}, {"Idempotency-Key": "k1"})) == 200
+    generate = {"user_id": "u", "chat_id": "c", "provider_id": "p", "llm_id": "l", "user_input": "hi"}
+    assert asyncio.run(post("/llm/response_generate", generate, {"Idempotency-Key": "k2"})) == 200
+    assert asyncio.run(post("/user/create", {"username": "bob"}, {})) == 200
+    assert [instruction.get("idempotency_key") for instruction in sent] == ["k1", "k2", None]
+    assert asyncio.run(post("/user/create", {"username": "carol"}, {"Idempotency-Key": "k" * 256})) == 400
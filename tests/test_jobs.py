@@ -0,0 +1,135 @@
+import datetime
+import time
+import pytest
+from llmchatlinker import client as client_module
+from llmchatlinker.client import LLMChatLinkerClient
+from llmchatlinker.units.database_manage_unit import Job
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+
+def wait_until_finished(unit, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = unit.get_job_status({"job_id": job_id})['data']['job']
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+def test_job_reports_progress_and_result(db):
+    unit = LLMManageUnit(db)
+    reported = []
+
+    def handler(request, on_progress=None):
+        for progress in (0.3, 0.6):
+            on_progress(progress)
+            reported.append(db.get_job_by_public_id(job_id)['progress'])
+        return {"status": "success", "message": "done", "data": {"answer": 42}}
+
+    job_id = unit.submit_job("LLM_RESPONSE_GENERATE", handler, {"async": True})['data']['job']['job_id']
+    job = wait_until_finished(unit, job_id)
+    assert reported == [0.3, 0.6]
+    assert job['status'] == 'succeeded'
+    assert job['progress'] == 1.0
+    assert job['result'] == {"answer": 42}
+
+def test_job_records_handler_exception(db):
+    unit = LLMManageUnit(db)
+
+    def handler(request, on_progress=None):
+        raise RuntimeError("provider exploded")
+
+    job_id = unit.submit_job("LLM_RESPONSE_GENERATE", handler, {})['data']['job']['job_id']
+    job = wait_until_finished(unit, job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == "provider exploded"
+
+def test_job_records_error_response(db):
+    unit = LLMManageUnit(db)
+
+    def handler(request, on_progress=None):
+        return {"status": "error", "message": "LLM not found", "data": {}}
+
+    job_id = unit.submit_job("LLM_RESPONSE_GENERATE", handler, {})['data']['job']['job_id']
+    job = wait_until_finished(unit, job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == "LLM not found"
+
+def test_stale_jobs_expire(db, monkeypatch):
+    unit = LLMManageUnit(db)
+    fresh = db.create_job("LLM_RESPONSE_GENERATE", {})
+    stale = db.create_job("LLM_RESPONSE_GENERATE", {})
+    db.update_job(stale['job_id'], status='running')
+    # Simulate an orchestrator that stopped long ago while running the job
+    with db.session_scope() as session:
+        long_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
+        session.query(Job).filter_by(public_id=stale['job_id']).update({Job.updated_at: long_ago})
+
+    job = unit.get_job_status({"job_id": stale['job_id']})['data']['job']
+    assert job['status'] == 'failed'
+    assert 'expired' in job['error']
+    assert unit.get_job_status({"job_id": fresh['job_id']})['data']['job']['status'] == 'queued'
+
+class FakeSubscriber:
+    """Stands in for EventSubscriber, delivering the given events."""
+
+    instances = []
+
+    def __init__(self, binding_keys, events=()):
+        self.binding_keys = binding_keys
+        self._events = list(events)
+        self.closed = False
+        FakeSubscriber.instances.append(self)
+
+    def events(self, timeout=None, poll_interval=1):
+        yield from self._events
+        if timeout is not None:
+            time.sleep(timeout)
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def job_client(monkeypatch):
+    FakeSubscriber.instances = []
+    client = LLMChatLinkerClient()
+    statuses = []
+    monkeypatch.setattr(client, "get_job_status", lambda job_id: {"status": "success", "message": "", "data": {"job": statuses.pop(0)}})
+    return client, statuses
+
+def test_wait_for_job_times_out_with_current_status(job_client, monkeypatch):
+    client, statuses = job_client
+    monkeypatch.setattr(client_module, "EventSubscriber", FakeSubscriber)
+    statuses.extend([{"job_id": "job", "status": "running"}, {"job_id": "job", "status": "running", "progress": 0.5}])
+
+    started = time.monotonic()
+    response = client.wait_for_job("job", timeout=0.1)
+    assert time.monotonic() - started >= 0.1
+    assert response['data']['job'] == {"job_id": "job", "status": "running", "progress": 0.5}
+    assert FakeSubscriber.instances[0].binding_keys == ["job.job.succeeded", "job.job.failed"]
+    assert FakeSubscriber.instances[0].closed
+
+def test_wait_for_job_returns_pushed_failure(job_client, monkeypatch):
+    client, statuses = job_client
+    failed = {"job_id": "job", "status": "failed", "error": "boom"}
+    monkeypatch.setattr(client_module, "EventSubscriber", lambda keys: FakeSubscriber(keys, [("job.job.failed", {"job": failed})]))
+    statuses.append({"job_id": "job", "status": "running"})
+
+    response = client.wait_for_job("job", timeout=5)
+    assert response['data']['job'] == failed
+
+def test_multi_llm_job_reports_progress_per_llm(db, mock_provider):
+    unit = LLMManageUnit(db)
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    llm_ids = []
+    for latency in (0.0, 0.3):
+        provider = unit.add_llm_provider({"name": f"provider-{latency}", "api_endpoint": mock_provider(latency=latency)})['data']['provider']
+        llm_ids.append(unit.add_llm({"provider_id": provider['provider_id'], "llm_name": "model"})['data']['llm']['llm_id'])
+
+    reported = []
+    response = unit.generate_multi_llm_response(
+        {"chat_id": chat['chat_id'], "user_id": user['user_id'], "llm_ids": llm_ids, "user_input": "hi"},
+        on_progress=reported.append
+    )
+    assert response['status'] == 'success'
+    assert reported == [0.45, 0.9]
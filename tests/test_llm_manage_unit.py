@@ -0,0 +1,127 @@
+import threading
+import time
+import pytest
+import requests
+from llmchatlinker.providers import health as health_module
+from llmchatlinker.units import llm_manage_unit
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+def make_provider(endpoints, **limits):
+    return dict({
+        'provider_id': 'provider',
+        'name': 'provider',
+        'kind': 'openai',
+        'api_endpoint': endpoints[0]['url'],
+        'endpoints': endpoints,
+        'api_key': None
+    }, **limits)
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr(health_module, "LLM_HEDGE_REQUESTS", True)
+    monkeypatch.setattr(health_module, "LATENCY_MIN_SAMPLES", 1)
+
+def prime_latency(unit, url, latency):
+    unit.health.for_endpoint(url).record_success(latency)
+
+@pytest.mark.parametrize("max_concurrency, expected_requests", [(1, 1), (2, 2)])
+def test_hedged_requests_respect_concurrency_limit(hedging, mock_provider, max_concurrency, expected_requests):
+    slow = mock_provider(latency=0.6)
+    fast = mock_provider()
+    unit = LLMManageUnit(None)
+    # The heavy weight makes the slow replica the primary choice
+    provider = make_provider([{'url': slow, 'weight': 10}, {'url': fast, 'weight': 1}], max_concurrency=max_concurrency)
+    prime_latency(unit, slow, 0.05)
+    prime_latency(unit, fast, 0.05)
+
+    started = time.monotonic()
+    response = unit._call_llm_api(provider, "model", MESSAGES)
+    elapsed = time.monotonic() - started
+    assert response.content
+
+    if expected_requests == 1:
+        # No capacity for a hedge, so the primary is simply awaited
+        assert elapsed >= 0.5
+    else:
+        assert elapsed < 0.5
+
+    # Wait for the losing request to finish and give back its lease
+    limiter = unit.limiters.limiter_for(provider)
+    deadline = time.monotonic() + 5
+    while limiter.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert limiter.stats()['in_flight'] == 0
+    assert limiter.stats()['acquired'] == expected_requests
+    assert limiter.stats()['rejected'] == 0
+    assert mock_provider.requests_served() == expected_requests
+
+def test_deadline_bounds_attempts_without_blaming_endpoint(mock_provider):
+    slow = mock_provider(latency=2)
+    unit = LLMManageUnit(None)
+    provider = make_provider([{'url': slow, 'weight': 1}])
+    llm = {'llm_id': 'llm', 'name': 'model', 'fallback_llm_ids': []}
+
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        unit._call_llm_with_failover(provider, llm, MESSAGES, deadline=started + 0.3)
+    assert time.monotonic() - started < 1
+    # No retries were started after the deadline, and the endpoint was not marked as failing
+    assert mock_provider.requests_served() == 1
+    stats = unit.health.stats(slow)
+    assert stats['failures'] == 0
+    assert stats['outstanding'] == 0
+    assert unit.limiters.limiter_for(provider).stats()['in_flight'] == 0
+
+def test_expired_deadline_sends_nothing(mock_provider):
+    url = mock_provider()
+    unit = LLMManageUnit(None)
+    provider = make_provider([{'url': url, 'weight': 1}])
+    with pytest.raises(requests.Timeout):
+        unit._call_llm_api(provider, "model", MESSAGES, deadline=time.monotonic() - 1)
+    assert mock_provider.requests_served() == 0
+
+def test_micro_batching_sends_concurrent_calls_together(mock_provider):
+    url = mock_provider(latency=0.2)
+    unit = LLMManageUnit(None)
+    provider = dict(make_provider([{'url': url, 'weight': 1}]), batch_window_ms=100, batch_max_size=8)
+    results = []
+
+    def call(content):
+        results.append(unit._call_llm_api(provider, "model", [{"role": "user", "content": content}]))
+
+    threads = [threading.Thread(target=call, args=(" ".join(["word"] * count),)) for count in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert mock_provider.requests_served() == 1
+    assert sorted(response.usage['prompt_tokens'] for response in results) == [1, 2, 3]
+    assert unit.limiters.limiter_for(provider).stats()['in_flight'] == 0
+
+def test_generation_params_from_llm_and_request(mock_provider):
+    url = mock_provider(completion_tokens=32)
+    unit = LLMManageUnit(None)
+    provider = make_provider([{'url': url, 'weight': 1}])
+    llm = {'llm_id': 'llm', 'name': 'model', 'fallback_llm_ids': [], 'generation_params': {'max_tokens': 5}}
+
+    response, _ = unit._call_llm_with_failover(provider, llm, MESSAGES)
+    assert response.usage['completion_tokens'] == 5
+    response, _ = unit._call_llm_with_failover(provider, llm, MESSAGES, params={'max_tokens': 3})
+    assert response.usage['completion_tokens'] == 3
+
+def test_llm_read_timeout_bounds_call_without_blaming_endpoint(mock_provider, monkeypatch):
+    monkeypatch.setattr(llm_manage_unit, "LLM_MAX_RETRIES", 0)
+    slow = mock_provider(latency=2)
+    unit = LLMManageUnit(None)
+    provider = make_provider([{'url': slow, 'weight': 1}])
+    llm = {'llm_id': 'llm', 'name': 'model', 'fallback_llm_ids': [], 'generation_params': {'read_timeout': 0.3}}
+
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        unit._call_llm_with_failover(provider, llm, MESSAGES)
+    assert time.monotonic() - started < 1
+    # The model's own latency bound says nothing about the endpoint's health
+    assert unit.health.stats(slow)['failures'] == 0
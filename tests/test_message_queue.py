@@ -0,0 +1,278 @@
+import threading
+from types import SimpleNamespace
+from pika.exceptions import StreamLostError
+from llmchatlinker import message_queue
+from llmchatlinker.scheduler import FairScheduler
+
+def properties(headers=None, correlation_id="cid"):
+    return SimpleNamespace(headers=headers, correlation_id=correlation_id, reply_to="callback")
+
+class FakeConnection:
+    """Collects callbacks handed back from worker threads."""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.append(callback)
+
+class FakeChannel:
+    """Delivers scripted messages from start_consuming, then raises `stop_with`."""
+
+    def __init__(self, bodies, stop_with=KeyboardInterrupt, headers=None):
+        self.bodies = bodies
+        self.headers = headers
+        self.stop_with = stop_with
+        self.connection = FakeConnection()
+        self.is_open = True
+        self.prefetch_count = None
+        self.consumer = None
+        self.acks = []
+        self.nacks = []
+        self.published = []
+        self.declared = []
+
+    def queue_declare(self, queue, durable=False, arguments=None, passive=False):
+        self.declared.append(queue)
+
+    def exchange_declare(self, exchange, exchange_type, durable=False):
+        self.declared.append(exchange)
+
+    def queue_bind(self, exchange, queue, routing_key):
+        pass
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.published.append((exchange, routing_key, properties, body))
+
+    def basic_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback):
+        self.consumer = on_message_callback
+
+    def start_consuming(self):
+        for tag, body in enumerate(self.bodies, start=1):
+            method = SimpleNamespace(delivery_tag=tag, redelivered=False)
+            self.consumer(self, method, properties(self.headers), body)
+        raise self.stop_with()
+
+    def stop_consuming(self):
+        pass
+
+    def basic_ack(self, delivery_tag):
+        self.acks.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue):
+        self.nacks.append((delivery_tag, requeue))
+
+    def settle_pending(self):
+        for callback in self.connection.callbacks:
+            callback()
+
+def test_single_worker_settles_inline():
+    channel = FakeChannel([b"ok", b"bad"])
+
+    def callback(body, properties):
+        if body == b"bad":
+            raise ValueError("bad message")
+
+    message_queue.consume_messages(channel, "queue", callback)
+
+    assert channel.prefetch_count == 1
+    # The failed message is acknowledged once a copy waits in the delay queue
+    assert channel.acks == [1, 2]
+    assert channel.nacks == []
+    assert channel.connection.callbacks == []
+    [(exchange, routing_key, published, body)] = channel.published
+    assert (exchange, routing_key, body) == ("", "queue.retry", b"bad")
+    assert published.headers["x-retry-count"] == 1
+    assert published.headers["x-last-error"] == "bad message"
+    assert published.expiration == str(int(message_queue.INSTRUCTION_RETRY_DELAY * 1000))
+    assert (published.correlation_id, published.reply_to) == ("cid", "callback")
+
+def test_message_is_dead_lettered_after_max_retries():
+    channel = FakeChannel([b"poison"], headers={"x-retry-count": 2})
+
+    def callback(body, properties):
+        raise ValueError("still bad")
+
+    message_queue.consume_messages(channel, "queue", callback, max_retries=2)
+
+    assert channel.acks == [1]
+    [(exchange, routing_key, published, body)] = channel.published
+    assert (exchange, routing_key, body) == (message_queue.DEAD_LETTER_EXCHANGE, "queue", b"poison")
+    assert published.headers["x-retry-count"] == 2
+    assert published.headers["x-last-error"] == "still bad"
+    assert published.expiration is None
+    assert "queue.dead" in channel.declared
+
+def test_failed_message_is_requeued_when_retry_cannot_be_published():
+    class PublishFails(FakeChannel):
+        def basic_publish(self, exchange, routing_key, properties, body):
+            raise StreamLostError("connection lost")
+
+    channel = PublishFails([b"bad"])
+
+    def callback(body, properties):
+        raise ValueError("bad message")
+
+    message_queue.consume_messages(channel, "queue", callback)
+
+    assert channel.acks == []
+    assert channel.nacks == [(1, True)]
+
+def test_replay_dead_letters_requeues_matching_messages(monkeypatch):
+    dead = [
+        (SimpleNamespace(delivery_tag=1), properties({"x-retry-count": 3}, "a"), b'{"type": "USER_GET"}'),
+        (SimpleNamespace(delivery_tag=2), properties({"x-retry-count": 3}, "b"), b"not json")
+    ]
+
+    class DeadLetterChannel(FakeChannel):
+        commits = 0
+
+        def tx_select(self):
+            pass
+
+        def tx_commit(self):
+            self.commits += 1
+
+        def queue_declare(self, queue, durable=False, arguments=None, passive=False):
+            return SimpleNamespace(method=SimpleNamespace(message_count=len(dead)))
+
+        def basic_get(self, queue, auto_ack):
+            assert queue == "instruction_queue.dead"
+            return dead.pop(0) if dead else (None, None, None)
+
+    channel = DeadLetterChannel([])
+    connection = SimpleNamespace(channel=lambda: channel, close=lambda: None)
+    monkeypatch.setattr(message_queue.pika, "BlockingConnection", lambda parameters: connection)
+
+    assert message_queue.replay_dead_letters(["b"]) == 1
+
+    [(exchange, routing_key, published, body)] = channel.published
+    assert (exchange, routing_key, body) == ("", "instruction_queue", b"not json")
+    # Replayed with no retries used and nobody to reply to
+    assert published.headers is None and published.reply_to is None
+    # The other message was only taken, so closing the connection returns it
+    assert channel.acks == [2]
+    assert channel.commits == 1
+
+class ReplyConnection:
+    """Answers each published instruction through the consumer registered on direct reply-to."""
+
+    def __init__(self):
+        self.is_open = True
+        self.is_closed = False
+        self.published = []
+        self.consumers = {}
+        self.opened = 0
+
+    def channel(self):
+        self.opened += 1
+        return self
+
+    def queue_declare(self, queue, durable=False):
+        pass
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False):
+        self.consumers[queue] = on_message_callback
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.published.append((routing_key, properties))
+
+    def process_data_events(self, time_limit=None):
+        for routing_key, properties in self.published:
+            self.consumers[properties.reply_to](self, None, SimpleNamespace(correlation_id=properties.correlation_id), b"reply")
+
+def test_instructions_reuse_the_thread_connection_and_reply_directly(monkeypatch):
+    connection = ReplyConnection()
+    monkeypatch.setattr(message_queue.pika, "BlockingConnection", lambda parameters: connection)
+    monkeypatch.setattr(message_queue, "_clients", threading.local())
+
+    assert message_queue.publish_message("first", "c1") == b"reply"
+    assert message_queue.publish_message("second", "c2") == b"reply"
+
+    assert connection.opened == 1
+    assert [properties.reply_to for _, properties in connection.published] == [message_queue.DIRECT_REPLY_TO] * 2
+    assert all(properties.delivery_mode == 2 for _, properties in connection.published)
+
+def test_responses_are_transient():
+    channel = FakeChannel([])
+
+    message_queue.publish_response(channel, "result", "cid", "amq.rabbitmq.reply-to.abc")
+
+    [(exchange, routing_key, published, body)] = channel.published
+    assert (exchange, routing_key, body) == ("", "amq.rabbitmq.reply-to.abc", "result")
+    assert published.correlation_id == "cid"
+    assert published.delivery_mode is None
+
+def test_workers_run_concurrently_and_hand_acks_back():
+    channel = FakeChannel([b"a", b"b"])
+    # Both messages must be in flight at once for the barrier to open
+    barrier = threading.Barrier(2, timeout=5)
+    threads = set()
+
+    def callback(body, properties):
+        threads.add(threading.current_thread().name)
+        barrier.wait()
+
+    message_queue.consume_messages(channel, "queue", callback, workers=2)
+
+    assert channel.prefetch_count == 2
+    assert len(threads) == 2
+    # Nothing is settled from the worker threads themselves
+    assert channel.acks == []
+    channel.settle_pending()
+    assert sorted(channel.acks) == [1, 2]
+    assert channel.nacks == []
+
+def test_reconnects_and_reregisters_consumer(monkeypatch):
+    lost = FakeChannel([], stop_with=StreamLostError)
+    fresh = FakeChannel([b"after reconnect"])
+    monkeypatch.setattr(message_queue, "RETRY_DELAY", 0)
+    monkeypatch.setattr(message_queue, "init_message_queue", lambda queue_name: (fresh, queue_name))
+    received = []
+
+    message_queue.consume_messages(lost, "queue", lambda body, properties: received.append(body), workers=3)
+
+    assert fresh.prefetch_count == 3
+    assert fresh.consumer is not None
+    assert received == [b"after reconnect"]
+    fresh.settle_pending()
+    assert fresh.acks == [1]
+
+def test_scheduler_runs_prefetched_messages_and_leaves_queued_ones_on_stop():
+    started = threading.Event()
+    release = threading.Event()
+    received = []
+
+    class StopsOnceStarted(FakeChannel):
+        def start_consuming(self):
+            for tag, body in enumerate(self.bodies, start=1):
+                self.consumer(self, SimpleNamespace(delivery_tag=tag, redelivered=False), properties(), body)
+            started.wait(5)
+            raise KeyboardInterrupt()
+
+        def stop_consuming(self):
+            # Lets the running message finish after the queued ones have been dropped
+            threading.Timer(0.2, release.set).start()
+
+    channel = StopsOnceStarted([b"alice:1", b"bob:1", b"alice:2"])
+    scheduler = FairScheduler(1)
+
+    def callback(body, properties):
+        received.append(body)
+        started.set()
+        release.wait(5)
+
+    message_queue.consume_messages(
+        channel, "queue", callback, workers=1,
+        scheduler=scheduler, scheduling_key=lambda body: body.split(b":")[0].decode(), prefetch_count=8
+    )
+
+    assert channel.prefetch_count == 8
+    assert received == [b"alice:1"]
+    channel.settle_pending()
+    # The queued messages stay unacked, so the broker redelivers them
+    assert channel.acks == [1]
+    assert channel.nacks == []
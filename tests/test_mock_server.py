@@ -0,0 +1,51 @@
+import threading
+import pytest
+from llmchatlinker.providers.adapters import get_adapter
+from llmchatlinker.providers.health import ProviderHTTPError
+from llmchatlinker.providers.mock_server import create_server, MockProviderConfig
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+
+MESSAGES = [{"role": "user", "content": "one two three"}]
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(config):
+        server = create_server(port=0, config=config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_openai_shape_with_usage(serve):
+    server, base = serve(MockProviderConfig(completion_tokens=7))
+    response = LLMManageUnit._post_llm_request(get_adapter('openai'), f"{base}/v1/chat/completions", "m", MESSAGES)
+    assert len(response.content.split()) == 7
+    assert response.usage == {"prompt_tokens": 3, "completion_tokens": 7}
+    assert server.RequestHandlerClass.requests_served == 1
+
+def test_ollama_shape(serve):
+    _, base = serve(MockProviderConfig(completion_tokens=4))
+    response = LLMManageUnit._post_llm_request(get_adapter('ollama'), f"{base}/api/chat", "m", MESSAGES)
+    assert len(response.content.split()) == 4
+    assert response.usage == {"prompt_tokens": 3, "completion_tokens": 4}
+
+def test_injected_errors_carry_status_and_retry_after(serve):
+    _, base = serve(MockProviderConfig(error_rate=1.0, error_status=429, retry_after=2))
+    with pytest.raises(ProviderHTTPError) as error:
+        LLMManageUnit._post_llm_request(get_adapter('openai'), f"{base}/v1/chat/completions", "m", MESSAGES)
+    assert error.value.status_code == 429
+    assert error.value.retry_after == 2.0
+    assert error.value.retryable
+
+def test_servers_count_requests_separately(serve):
+    first, first_base = serve(MockProviderConfig())
+    second, _ = serve(MockProviderConfig())
+    LLMManageUnit._post_llm_request(get_adapter('openai'), first_base, "m", MESSAGES)
+    assert first.RequestHandlerClass.requests_served == 1
+    assert second.RequestHandlerClass.requests_served == 0
@@ -0,0 +1,44 @@
+from sqlalchemy import event
+from llmchatlinker.units.chat_manage_unit import ChatManageUnit
+from llmchatlinker.units.user_manage_unit import UserManageUnit
+
+def test_summary_view_leaves_out_related_rows(db):
+    chats = ChatManageUnit(db)
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    db.create_message(chat['chat_id'], user['user_id'], "hi", "user", None)
+    summary = chats.list_chats({"view": "summary"})['data']['chats']
+    assert list(summary[0]) == [
+        "chat_id", "title", "message_count", "last_message_preview", "last_activity_at", "created_at", "updated_at"
+    ]
+    assert (summary[0]['chat_id'], summary[0]['last_message_preview']) == (chat['chat_id'], "hi")
+    full = chats.get_chat({"chat_id": chat['chat_id'], "view": "full"})['data']['chat']
+    assert [message['content'] for message in full['messages']] == ["hi"]
+
+def test_fields_select_message_columns(db):
+    chats = ChatManageUnit(db)
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    message = db.create_message(chat['chat_id'], user['user_id'], "hi", "user", None)
+    listed = chats.list_messages({"chat_id": chat['chat_id'], "fields": "message_id,user_id"})['data']['messages']
+    assert listed == [{"message_id": message['message_id'], "user_id": user['user_id']}]
+
+def test_projection_is_pushed_into_the_query(db):
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    db.create_message(chat['chat_id'], user['user_id'], "hi", "user", None)
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        db.get_all_chats(fields=db.select_fields('chats', view='summary'))
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    # Neither messages nor participants are loaded
+    assert len(statements) == 1
+    assert "messages" not in statements[0] and "user_chats" not in statements[0]
+
+def test_unknown_fields_and_views_are_rejected(db):
+    users = UserManageUnit(db)
+    assert users.list_users({"fields": ["user_id", "password"]})['status'] == 'error'
+    assert users.list_users({"view": "tiny"})['status'] == 'error'
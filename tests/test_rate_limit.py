@@ -0,0 +1,97 @@
+import threading
+import time
+import pytest
+from llmchatlinker.providers.rate_limit import (
+    LocalLimiterStore, ProviderLimiter, RateLimiterRegistry, RateLimitExceeded, estimate_tokens
+)
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+def test_token_bucket_refills_over_time():
+    store = LocalLimiterStore()
+    assert store.take("k", capacity=2, refill_per_second=20, amount=1) == 0
+    assert store.take("k", capacity=2, refill_per_second=20, amount=1) == 0
+    wait = store.take("k", capacity=2, refill_per_second=20, amount=1)
+    assert 0 < wait <= 0.05
+    time.sleep(wait + 0.01)
+    assert store.take("k", capacity=2, refill_per_second=20, amount=1) == 0
+
+def test_adjust_can_put_bucket_into_debt():
+    store = LocalLimiterStore()
+    store.adjust("k", capacity=10, refill_per_second=1, amount=15)
+    assert store.take("k", capacity=10, refill_per_second=1, amount=1) > 5
+
+def test_requests_per_minute_rejects_past_deadline():
+    limiter = ProviderLimiter("p", LocalLimiterStore(), requests_per_minute=1)
+    with limiter.acquire(max_wait=0):
+        pass
+    with pytest.raises(RateLimitExceeded):
+        with limiter.acquire(max_wait=0.1):
+            pass
+    assert limiter.stats()['rejected'] == 1
+
+def test_requests_per_minute_waits_for_refill():
+    limiter = ProviderLimiter("p", LocalLimiterStore(), requests_per_minute=600)
+    for _ in range(600):
+        limiter.reserve(max_wait=0).release()
+    started = time.monotonic()
+    with limiter.acquire(max_wait=1):
+        pass
+    assert 0.05 <= time.monotonic() - started < 1
+
+def test_concurrency_slot_rejection_burns_no_rate_tokens():
+    store = LocalLimiterStore()
+    limiter = ProviderLimiter("p", store, requests_per_minute=2, max_concurrency=1)
+    held = limiter.reserve()
+    for _ in range(3):
+        with pytest.raises(RateLimitExceeded):
+            limiter.reserve(max_wait=0.01)
+    held.release()
+    # One request token is left for the next caller
+    with limiter.acquire(max_wait=0):
+        pass
+
+def test_queue_is_bounded():
+    limiter = ProviderLimiter("p", LocalLimiterStore(), max_concurrency=1, max_queue=1)
+    held = limiter.reserve()
+    waiter = threading.Thread(target=lambda: limiter.reserve(max_wait=5).release())
+    waiter.start()
+    wait_until(lambda: limiter.stats()['queued'] == 1)
+    with pytest.raises(RateLimitExceeded, match="Too many requests queued"):
+        limiter.reserve(max_wait=5)
+    held.release()
+    waiter.join(5)
+    assert limiter.stats()['in_flight'] == 0
+
+def test_lease_release_is_idempotent_and_cross_thread():
+    limiter = ProviderLimiter("p", LocalLimiterStore(), max_concurrency=1)
+    lease = limiter.reserve()
+    releaser = threading.Thread(target=lease.release)
+    releaser.start()
+    releaser.join(5)
+    lease.release()
+    assert limiter.stats()['in_flight'] == 0
+    limiter.reserve(max_wait=0).release()
+
+def test_usage_reconciles_tokens_per_minute():
+    store = LocalLimiterStore()
+    limiter = ProviderLimiter("p", store, tokens_per_minute=100)
+    with limiter.acquire(tokens=10, max_wait=0) as lease:
+        lease.record_usage({'prompt_tokens': 40, 'completion_tokens': 50})
+    # 90 of 100 tokens were used, so a 20 token request no longer fits
+    with pytest.raises(RateLimitExceeded):
+        limiter.reserve(tokens=20, max_wait=0)
+
+def test_registry_rebuilds_limiter_when_limits_change():
+    registry = RateLimiterRegistry()
+    provider = {'provider_id': 'p', 'requests_per_minute': 10}
+    limiter = registry.limiter_for(provider)
+    assert registry.limiter_for(dict(provider)) is limiter
+    assert registry.limiter_for(dict(provider, requests_per_minute=20)) is not limiter
+
+def test_estimate_tokens_grows_with_content():
+    assert estimate_tokens([{"role": "user", "content": "x" * 400}]) > estimate_tokens([{"role": "user", "content": "x"}])
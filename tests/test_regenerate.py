@@ -0,0 +1,58 @@
+import pytest
+from llmchatlinker.units.database_manage_unit import NotFoundError
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+
+@pytest.fixture
+def chat(db, mock_provider):
+    """A chat with two question/answer turns served by a mock provider."""
+    unit = LLMManageUnit(db)
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    provider = unit.add_llm_provider({"name": "provider", "api_endpoint": mock_provider()})['data']['provider']
+    llm = unit.add_llm({"provider_id": provider['provider_id'], "llm_name": "model"})['data']['llm']
+    messages = []
+    for turn in ("first", "second"):
+        question = db.create_message(chat['chat_id'], user['user_id'], turn, 'user', None)
+        answer = db.create_message(chat['chat_id'], user['user_id'], f"answer to {turn}", 'assistant', llm['llm_id'], question['message_id'])
+        messages += [question, answer]
+    return unit, messages
+
+def test_history_before_stops_at_the_message(db, chat):
+    _, messages = chat
+    history = db.get_message_history_before(messages[3]['message_id'])
+    assert history == [
+        {"role": "user", "content": "first"},
+        {"role": "assistant", "content": "answer to first"},
+        {"role": "user", "content": "second"}
+    ]
+    assert db.get_message_history_before(messages[0]['message_id']) == []
+
+def test_history_before_unknown_message(db):
+    with pytest.raises(NotFoundError):
+        db.get_message_history_before("missing")
+
+def test_regenerate_single_response(chat):
+    unit, messages = chat
+    response = unit.regenerate_llm_response({"message_id": messages[3]['message_id']})
+    assert response['status'] == 'success'
+    assert response['data']['llm_response']['parent_message_id'] == messages[2]['message_id']
+    assert response['data']['llm_response']['rank'] is None
+
+def test_regenerate_ranked_candidates(db, chat):
+    unit, messages = chat
+    progress = []
+    response = unit.regenerate_llm_response({"message_id": messages[3]['message_id'], "n": 3}, on_progress=progress.append)
+    assert response['status'] == 'success'
+    candidates = response['data']['llm_responses']
+    assert [candidate['rank'] for candidate in candidates] == [0, 1, 2]
+    assert {candidate['parent_message_id'] for candidate in candidates} == {messages[2]['message_id']}
+    assert response['data']['failed'] == 0
+    assert progress[-1] == pytest.approx(0.9)
+    # The original answer and the three candidates are siblings in the chat
+    assert len(db.get_messages_by_chat(messages[0]['chat_id'])) == 7
+
+@pytest.mark.parametrize("n", [0, -1, 9, "2"])
+def test_regenerate_rejects_invalid_n(chat, n):
+    unit, messages = chat
+    response = unit.regenerate_llm_response({"message_id": messages[3]['message_id'], "n": n})
+    assert response['status'] == 'error'
@@ -0,0 +1,72 @@
+import pytest
+from llmchatlinker.providers.registry import ConfigRegistry
+from llmchatlinker.units.database_manage_unit import LLM_CONFIG_VERSION
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+
+class CountingDatabase:
+    """Wraps a DatabaseManageUnit and counts the calls made through it."""
+
+    def __init__(self, db):
+        self.db = db
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+
+        def counted(*args, **kwargs):
+            self.calls.append(name)
+            return method(*args, **kwargs)
+        return counted
+
+@pytest.fixture
+def config(db):
+    unit = LLMManageUnit(db)
+    provider = unit.add_llm_provider({"name": "provider", "api_endpoint": "http://127.0.0.1:1/v1/chat/completions"})['data']['provider']
+    llm = unit.add_llm({"provider_id": provider['provider_id'], "llm_name": "model"})['data']['llm']
+    return unit, provider, llm
+
+def test_lookups_are_served_from_memory(db, config):
+    _, provider, llm = config
+    counting = CountingDatabase(db)
+    registry = ConfigRegistry(counting, LLM_CONFIG_VERSION, poll_interval=60)
+    for _ in range(3):
+        assert registry.provider(provider['provider_id'])['name'] == "provider"
+        assert registry.llm(llm['llm_id'])['name'] == "model"
+    assert counting.calls == ['get_entity_version', 'get_all_providers', 'get_all_llms']
+
+def test_unchanged_version_does_not_reload(db, config):
+    _, provider, _ = config
+    counting = CountingDatabase(db)
+    registry = ConfigRegistry(counting, LLM_CONFIG_VERSION, poll_interval=0)
+    registry.provider(provider['provider_id'])
+    registry.provider(provider['provider_id'])
+    assert counting.calls.count('get_all_providers') == 1
+    assert counting.calls.count('get_entity_version') == 2
+
+def test_local_changes_apply_immediately(config):
+    unit, provider, llm = config
+    unit.registry.poll_interval = 60
+    unit.update_llm_provider({"provider_id": provider['provider_id'], "max_concurrency": 3})
+    assert unit.registry.provider(provider['provider_id'])['max_concurrency'] == 3
+    unit.delete_llm({"llm_id": llm['llm_id']})
+    assert unit.registry.llm(llm['llm_id']) is None
+
+def test_changes_from_other_processes_are_polled(db, config):
+    unit, provider, llm = config
+    other = LLMManageUnit(db)
+    other.registry.poll_interval = 0
+    assert other.registry.provider(provider['provider_id'])['max_concurrency'] is None
+
+    unit.update_llm_provider({"provider_id": provider['provider_id'], "max_concurrency": 5})
+    unit.delete_llm({"llm_id": llm['llm_id']})
+    assert other.registry.provider(provider['provider_id'])['max_concurrency'] == 5
+    assert other.registry.llm(llm['llm_id']) is None
+
+def test_new_entities_are_found_before_the_next_poll(db, config):
+    unit, provider, _ = config
+    other = LLMManageUnit(db)
+    other.registry.poll_interval = 60
+    other.registry.provider(provider['provider_id'])
+
+    llm = unit.add_llm({"provider_id": provider['provider_id'], "llm_name": "other"})['data']['llm']
+    assert other.registry.llm(llm['llm_id'])['name'] == "other"
@@ -0,0 +1,54 @@
+import threading
+from llmchatlinker.scheduler import FairScheduler, parse_tier_weights, SCHEDULER_TIER_WEIGHTS
+from llmchatlinker.orchestrator import Orchestrator
+from llmchatlinker.units.user_manage_unit import UserManageUnit
+
+def run_backlog(scheduler, submissions):
+    """Submit while the only worker is busy, then return the order the work ran in."""
+    gate = threading.Event()
+    done = threading.Event()
+    order = []
+    scheduler.submit("gate", gate.wait)
+    for key, label in submissions:
+        scheduler.submit(key, lambda label=label: order.append(label))
+    scheduler.submit("last", done.set)
+    gate.set()
+    assert done.wait(5)
+    scheduler.shutdown()
+    return order
+
+def test_light_user_is_not_stuck_behind_a_backlog():
+    scheduler = FairScheduler(1)
+    order = run_backlog(scheduler, [("heavy", f"h{i}") for i in range(10)] + [("light", "l0")])
+    assert order.index("l0") == 1
+
+def test_users_get_work_started_in_proportion_to_their_weight():
+    weights = {"heavy": 3, "light": 1}
+    scheduler = FairScheduler(1, weight_of=weights.get)
+    order = run_backlog(scheduler, [("heavy", "h")] * 6 + [("light", "l")] * 6)
+    assert "".join(order[:8]) == "hhhlhhhl"
+
+def test_stats_report_waits_per_user():
+    scheduler = FairScheduler(1, weight_of=lambda key: 2)
+    run_backlog(scheduler, [("alice", "a"), ("alice", "a")])
+    stats = scheduler.stats()
+    assert stats["alice"]["started"] == 2 and stats["alice"]["queued"] == 0
+    assert stats["alice"]["weight"] == 2
+    assert stats["alice"]["max_wait"] >= stats["alice"]["average_wait"] > 0
+
+def test_parse_tier_weights():
+    assert parse_tier_weights("low=1, high=8,") == {"low": 1, "high": 8}
+
+def test_users_are_weighted_by_their_priority_tier(db):
+    users = UserManageUnit(db)
+    assert users.create_user({"username": "alice", "priority_tier": "urgent"})['status'] == 'error'
+    alice = users.create_user({"username": "alice", "priority_tier": "high"})['data']['user']
+    bob = users.create_user({"username": "bob"})['data']['user']
+    orchestrator = Orchestrator.__new__(Orchestrator)
+    orchestrator.database_manage_unit = db
+    assert orchestrator._scheduling_weight(alice['user_id']) == SCHEDULER_TIER_WEIGHTS['high']
+    assert orchestrator._scheduling_weight(bob['user_id']) == SCHEDULER_TIER_WEIGHTS['normal']
+    users.update_user({"user_id": alice['user_id'], "priority_tier": ""})
+    assert orchestrator._scheduling_weight(alice['user_id']) == SCHEDULER_TIER_WEIGHTS['normal']
+    assert Orchestrator._scheduling_key(b'{"type": "LLM_RESPONSE_GENERATE", "data": {"user_id": "u1"}}') == "u1"
+    assert Orchestrator._scheduling_key(b'not json') == ""
@@ -0,0 +1,81 @@
+import threading
+import time
+from llmchatlinker.providers.singleflight import SingleFlight, fingerprint
+
+class ObservedSingleFlight(SingleFlight):
+    """Records whether each caller led or joined a call."""
+
+    def __init__(self):
+        super().__init__()
+        self.joins = []
+
+    def _join(self, key):
+        future, leader = super()._join(key)
+        self.joins.append(leader)
+        return future, leader
+
+    def wait_for_joins(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.joins) < count and time.monotonic() < deadline:
+            time.sleep(0.005)
+        assert len(self.joins) == count
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+def test_concurrent_callers_share_one_execution():
+    flight = ObservedSingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    flight.wait_for_joins(4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert flight.joins.count(True) == 1
+    assert results == ["answer"] * 4
+    assert flight.in_flight() == 0
+
+def test_exception_is_shared_and_key_is_forgotten():
+    flight = ObservedSingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        release.wait(5)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flight.do("key", fail)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    flight.wait_for_joins(2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["boom", "boom"]
+    assert flight.in_flight() == 0
+    assert flight.do("key", lambda: "fresh") == "fresh"
+
+def test_distinct_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
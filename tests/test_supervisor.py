@@ -0,0 +1,40 @@
+import sys
+import time
+import pytest
+from llmchatlinker.supervisor import Supervisor
+
+SLEEPER = [sys.executable, "-c", "import time; time.sleep(60)"]
+CRASHER = [sys.executable, "-c", "raise SystemExit(3)"]
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+@pytest.fixture
+def supervisor():
+    supervisor = Supervisor({"api": (SLEEPER, 2), "orchestrator": (CRASHER, 1)}, graceful_timeout=5, restart_delay=0)
+    yield supervisor
+    supervisor.stop()
+
+def test_exited_processes_are_restarted(supervisor):
+    supervisor.start()
+    crasher = next(slot for slot in supervisor.slots if slot.role == "orchestrator")
+    first = crasher.process
+    wait_until(lambda: first.poll() is not None)
+    supervisor.check()
+    assert crasher.process is not first
+    assert [slot.name for slot in supervisor.slots] == ["api-0", "api-1", "orchestrator-0"]
+
+def test_reload_replaces_every_process(supervisor):
+    supervisor.start()
+    old = [slot.process for slot in supervisor.slots]
+    supervisor.reload()
+    assert all(process.poll() is not None for process in old)
+    assert all(slot.process not in old for slot in supervisor.slots)
+
+def test_stop_terminates_running_processes(supervisor):
+    supervisor.start()
+    supervisor.stop()
+    assert all(slot.process.poll() is not None for slot in supervisor.slots)
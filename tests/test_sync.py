@@ -0,0 +1,60 @@
+import datetime
+import pytest
+from llmchatlinker import sync
+from llmchatlinker.units.chat_manage_unit import ChatManageUnit
+from llmchatlinker.units.user_manage_unit import UserManageUnit
+
+@pytest.fixture(autouse=True)
+def no_overlap(monkeypatch):
+    # Every row in these tests is seconds old at most
+    monkeypatch.setattr(sync, "SYNC_OVERLAP_SECONDS", 0)
+
+def test_sync_token_returns_changes_and_tombstones(db):
+    users = UserManageUnit(db)
+    alice = users.create_user({"username": "alice"})['data']['user']
+    bob = users.create_user({"username": "bob"})['data']['user']
+    users.create_user({"username": "carol"})
+    token = users.list_users()['data']['sync_token']
+
+    users.update_user({"user_id": alice['user_id'], "display_name": "Al"})
+    users.delete_user({"user_id": bob['user_id']})
+    dave = users.create_user({"username": "dave"})['data']['user']
+
+    changes = users.list_users({"sync_token": token})['data']
+    assert [user['user_id'] for user in changes['users']] == [alice['user_id'], dave['user_id']]
+    assert changes['users'][0]['display_name'] == "Al"
+    assert [tombstone['user_id'] for tombstone in changes['deleted']] == [bob['user_id']]
+    # Nothing changed since the new token
+    assert users.list_users({"sync_token": changes['sync_token']})['data']['users'] == []
+
+def test_updated_since_lists_message_changes(db):
+    chats = ChatManageUnit(db)
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    first = db.create_message(chat['chat_id'], user['user_id'], "one", "user", None)
+    since = datetime.datetime.now()
+    second = db.create_message(chat['chat_id'], user['user_id'], "two", "user", None)
+    db.delete_message(first['message_id'])
+
+    changes = chats.list_messages({"chat_id": chat['chat_id'], "updated_since": since.isoformat()})['data']
+    assert [message['message_id'] for message in changes['messages']] == [second['message_id']]
+    assert [tombstone['message_id'] for tombstone in changes['deleted']] == [first['message_id']]
+    # Without a position the listing is complete and has no tombstones
+    full = chats.list_messages({"chat_id": chat['chat_id']})['data']
+    assert [message['message_id'] for message in full['messages']] == [second['message_id']]
+    assert 'deleted' not in full
+
+def test_chat_changes_are_limited_to_the_user(db):
+    chats = ChatManageUnit(db)
+    alice = db.create_user("alice", "Alice", "")
+    bob = db.create_user("bob", "Bob", "")
+    since = datetime.datetime.now().isoformat()
+    own = db.create_chat("own", [alice['user_id']])
+    db.create_chat("other", [bob['user_id']])
+    changes = chats.list_chats_by_user({"user_id": alice['user_id'], "updated_since": since})['data']
+    assert [chat['chat_id'] for chat in changes['chats']] == [own['chat_id']]
+
+def test_invalid_sync_position_is_rejected(db):
+    users = UserManageUnit(db)
+    assert users.list_users({"sync_token": "not-a-token"})['status'] == 'error'
+    assert users.list_users({"updated_since": "yesterday"})['status'] == 'error'
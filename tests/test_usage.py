@@ -0,0 +1,54 @@
+import datetime
+import pytest
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+
+@pytest.fixture
+def setup(db, mock_provider):
+    """A user, a chat and an LLM whose mock provider answers with 5 completion tokens."""
+    unit = LLMManageUnit(db)
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    provider = unit.add_llm_provider({"name": "provider", "api_endpoint": mock_provider(completion_tokens=5)})['data']['provider']
+    llm = unit.add_llm({"provider_id": provider['provider_id'], "llm_name": "model"})['data']['llm']
+    request = {"chat_id": chat['chat_id'], "user_id": user['user_id'], "provider_id": provider['provider_id'], "llm_id": llm['llm_id']}
+    return unit, user, llm, request
+
+def test_assistant_message_records_usage_and_latency(setup):
+    unit, _, _, request = setup
+    message = unit.generate_llm_response(dict(request, user_input="one two three"))['data']['llm_response']
+    assert message['prompt_tokens'] == 3
+    assert message['completion_tokens'] == 5
+    assert message['latency_ms'] >= 0
+
+def test_usage_stats_aggregate_per_user_llm_and_day(setup):
+    unit, user, llm, request = setup
+    for user_input in ("one", "one two"):
+        assert unit.generate_llm_response(dict(request, user_input=user_input))['status'] == 'success'
+
+    stats = unit.get_usage_stats({"user_id": user['user_id']})['data']
+    today = datetime.date.today().isoformat()
+    assert len(stats['usage']) == 1
+    row = stats['usage'][0]
+    assert (row['day'], row['llm_id'], row['requests']) == (today, llm['llm_id'], 2)
+    # The second prompt also carries the first turn: "one" + answer + "one two"
+    assert row['prompt_tokens'] == 1 + (1 + 5 + 2)
+    assert row['completion_tokens'] == 10
+    assert stats['totals']['requests'] == 2
+
+    assert unit.get_usage_stats({"since": "2000-01-01", "until": "2000-01-31"})['data']['usage'] == []
+    assert unit.get_usage_stats({"since": "yesterday"})['status'] == 'error'
+
+def test_token_quota_is_enforced_before_the_call(db, setup, mock_provider):
+    unit, user, _, request = setup
+    db.update_user(user['user_id'], daily_token_quota=6)
+    assert unit.generate_llm_response(dict(request, user_input="hello"))['status'] == 'success'
+
+    served = mock_provider.requests_served()
+    response = unit.generate_llm_response(dict(request, user_input="hello again"))
+    assert response['status'] == 'error'
+    assert response['data'] == {"daily_token_quota": 6, "tokens_used": 6}
+    assert mock_provider.requests_served() == served
+
+    # A quota of 0 removes the limit
+    db.update_user(user['user_id'], daily_token_quota=0)
+    assert unit.generate_llm_response(dict(request, user_input="hello again"))['status'] == 'success'
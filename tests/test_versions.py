@@ -0,0 +1,93 @@
+import pytest
+from llmchatlinker.units.chat_manage_unit import ChatManageUnit
+from llmchatlinker.units.user_manage_unit import UserManageUnit
+from llmchatlinker.versions import VersionCache, make_etag, etag_matches, USERS_VERSION, CHATS_VERSION
+
+def test_etag_matching():
+    etag = make_etag("users", 3)
+    assert etag_matches(etag, etag)
+    assert etag_matches('"other", "users-3"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(make_etag("users", 2), etag)
+    assert not etag_matches(None, etag)
+
+def test_version_cache_only_answers_while_listening():
+    cache = VersionCache(ttl=60)
+    cache.update("users", 2)
+    # Versions learned before events were received may already be stale
+    cache.set_listening(True)
+    assert cache.get("users") is None
+    cache.update("users", 3)
+    assert cache.get("users") == 3
+    cache.set_listening(False)
+    assert cache.get("users") is None
+
+def test_version_cache_ignores_older_versions():
+    cache = VersionCache(ttl=60)
+    cache.set_listening(True)
+    cache.update("users", 3)
+    cache.invalidate("users")
+    cache.update("users", 2)
+    assert cache.get("users") is None
+    cache.update("users", 4)
+    assert cache.get("users") == 4
+
+def test_version_cache_expires_versions():
+    cache = VersionCache(ttl=0)
+    cache.set_listening(True)
+    cache.update("users", 1)
+    assert cache.get("users") is None
+
+def test_changes_bump_and_announce_versions(db):
+    announced = []
+    db.on_version_change = lambda name, version: announced.append((name, version))
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    db.create_message(chat['chat_id'], user['user_id'], "hi", "user", None)
+    db.update_user(user['user_id'], display_name="Al")
+    assert announced == [
+        (USERS_VERSION, 1), (CHATS_VERSION, 1), (CHATS_VERSION, 2), (USERS_VERSION, 2), (CHATS_VERSION, 3)
+    ]
+    # Failed changes announce nothing
+    with pytest.raises(Exception):
+        db.update_chat("missing", "title")
+    assert len(announced) == 5
+
+def test_lists_report_their_version(db):
+    users = UserManageUnit(db)
+    chats = ChatManageUnit(db)
+    user = users.create_user({"username": "alice"})['data']['user']
+    assert users.list_users()['data']['version'] == 1
+    chats.create_chat({"title": "chat", "user_ids": [user['user_id']]})
+    assert chats.list_chats()['data']['version'] == 1
+
+class ConditionalRequest:
+    def __init__(self, if_none_match=None):
+        self.headers = {"if-none-match": if_none_match} if if_none_match else {}
+
+class RecordingResponse:
+    def __init__(self):
+        self.headers = {}
+
+def test_api_answers_current_etag_without_calling(monkeypatch):
+    api = pytest.importorskip("llmchatlinker.api")
+    cache = VersionCache(ttl=60)
+    cache.set_listening(True)
+    monkeypatch.setattr(api, "entity_versions", cache)
+    calls = []
+
+    def list_users():
+        calls.append(1)
+        return {"status": "success", "message": "", "data": {"users": [], "version": 7}}
+
+    response = RecordingResponse()
+    assert api.conditional_get(ConditionalRequest(), response, USERS_VERSION, list_users)['data']['version'] == 7
+    etag = response.headers['ETag']
+    assert etag == make_etag(USERS_VERSION, 7)
+    not_modified = api.conditional_get(ConditionalRequest(etag), RecordingResponse(), USERS_VERSION, list_users)
+    assert not_modified.status_code == 304
+    assert len(calls) == 1
+    # A newer version announced by an orchestrator makes the client's copy stale
+    cache.update(USERS_VERSION, 8)
+    api.conditional_get(ConditionalRequest(etag), RecordingResponse(), USERS_VERSION, list_users)
+    assert len(calls) == 2
@@ -0,0 +1,68 @@
+import threading
+import time
+import pytest
+from llmchatlinker.providers.warmup import WarmthTracker
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+def test_tracker_states():
+    tracker = WarmthTracker(ttl=0.1)
+    assert tracker.state("llm") == 'cold'
+    assert tracker.start_warming("llm")
+    assert not tracker.start_warming("llm")
+    assert tracker.state("llm") == 'warming'
+    tracker.record_success("llm")
+    tracker.finish_warming("llm")
+    assert tracker.state("llm") == 'warm'
+    time.sleep(0.15)
+    assert tracker.state("llm") == 'cold'
+    assert tracker.idle_for("llm") >= 0.1
+    assert tracker.idle_for("other") is None
+
+@pytest.fixture
+def provider(db, mock_provider):
+    unit = LLMManageUnit(db)
+    url = mock_provider(latency=0.1)
+    provider = unit.add_llm_provider({"name": "provider", "api_endpoint": url})['data']['provider']
+    return unit, provider
+
+def state_of(unit, llm_id):
+    return {llm['llm_id']: llm['state'] for llm in unit.list_llms()['data']['llms']}[llm_id]
+
+def test_llm_add_warms_up_in_the_background(provider, mock_provider):
+    unit, provider_data = provider
+    llm = unit.add_llm({"provider_id": provider_data['provider_id'], "llm_name": "model", "warmup": True})['data']['llm']
+    assert llm['state'] == 'warming'
+    wait_for(lambda: state_of(unit, llm['llm_id']) == 'warm')
+    assert mock_provider.requests_served() == 1
+
+def test_llm_add_without_warmup_stays_cold(provider, mock_provider):
+    unit, provider_data = provider
+    llm = unit.add_llm({"provider_id": provider_data['provider_id'], "llm_name": "model", "warmup": False})['data']['llm']
+    assert state_of(unit, llm['llm_id']) == 'cold'
+    assert mock_provider.requests_served() == 0
+
+def test_keep_warm_pings_only_idle_llms(provider, mock_provider):
+    unit, provider_data = provider
+    idle = unit.add_llm({"provider_id": provider_data['provider_id'], "llm_name": "idle"})['data']['llm']
+    busy = unit.add_llm({"provider_id": provider_data['provider_id'], "llm_name": "busy"})['data']['llm']
+    served = threading.Event()
+
+    def serve_busy():
+        # Real traffic keeps the busy LLM from ever being idle for a whole interval
+        while not served.wait(0.05):
+            unit.warmth.record_success(busy['llm_id'])
+
+    threading.Thread(target=serve_busy, daemon=True).start()
+    threading.Thread(target=unit._keep_warm, args=(0.3,), daemon=True).start()
+    try:
+        wait_for(lambda: state_of(unit, idle['llm_id']) == 'warm')
+        assert mock_provider.requests_served() == 1
+    finally:
+        unit.stop_keep_warm()
+        served.set()
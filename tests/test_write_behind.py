@@ -0,0 +1,80 @@
+import json
+import pytest
+from llmchatlinker.units.database_manage_unit import NotFoundError
+from llmchatlinker.units.llm_manage_unit import LLMManageUnit
+from llmchatlinker.units.write_behind import WriteBehindQueue
+
+class FlakyWrite:
+    """Fails the first `failures` calls, then records what it is given."""
+
+    def __init__(self, failures=0, error=ConnectionError):
+        self.failures = failures
+        self.error = error
+        self.written = []
+
+    def __call__(self, record):
+        if self.failures:
+            self.failures -= 1
+            raise self.error("database unavailable")
+        self.written.append(record)
+
+def test_failed_writes_are_retried():
+    write = FlakyWrite(failures=2)
+    queue = WriteBehindQueue(write, max_attempts=3, retry_delay=0)
+    queue.submit("a", {"n": 1})
+    assert queue.flush(5)
+    assert write.written == [{"n": 1}]
+    assert queue.stats() == {"pending": 0, "written": 1, "failed": 0}
+
+def test_given_up_writes_are_reported():
+    reported = []
+    queue = WriteBehindQueue(FlakyWrite(failures=1, error=NotFoundError), fatal_errors=(NotFoundError,), retry_delay=0)
+    queue.on_failure = lambda record, error: reported.append((record, str(error)))
+    queue.submit("a", {"n": 1})
+    assert queue.flush(5)
+    # Fatal errors are not retried
+    assert reported == [({"n": 1}, "database unavailable")]
+    assert queue.stats()['failed'] == 1
+
+def test_pending_writes_are_replayed_from_the_journal(tmp_path):
+    journal = tmp_path / "journal"
+    journal.write_text(
+        json.dumps({"id": "a", "record": {"n": 1}}) + "\n"
+        + json.dumps({"id": "b", "record": {"n": 2}}) + "\n"
+        + json.dumps({"done": "a"}) + "\n"
+        + '{"id": "c", "rec'
+    )
+    write = FlakyWrite()
+    queue = WriteBehindQueue(write, journal_path=str(journal))
+    assert queue.flush(5)
+    # The completed write and the torn line are skipped
+    assert write.written == [{"n": 2}]
+    # Nothing is left for the next process
+    replayed = FlakyWrite()
+    assert WriteBehindQueue(replayed, journal_path=str(journal)).flush(5)
+    assert replayed.written == []
+
+def test_generated_reply_is_written_behind(db, mock_provider):
+    unit = LLMManageUnit(db)
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    provider = unit.add_llm_provider({"name": "mock", "api_endpoint": mock_provider()})['data']['provider']
+    llm = unit.add_llm({"provider_id": provider['provider_id'], "llm_name": "model"})['data']['llm']
+    response = unit.generate_llm_response({
+        "chat_id": chat['chat_id'], "user_id": user['user_id'],
+        "provider_id": provider['provider_id'], "llm_id": llm['llm_id'], "user_input": "hello"
+    })
+    reply = response['data']['llm_response']
+    # Reads wait for pending writes, so the reply is stored as it was returned
+    stored = db.get_messages_by_chat(chat['chat_id'])
+    assert [message['role'] for message in stored] == ['user', 'assistant']
+    assert stored[1]['message_id'] == reply['message_id']
+    assert stored[1]['parent_message_id'] == stored[0]['message_id']
+    assert stored[1]['created_at'] == reply['created_at']
+
+def test_writing_a_message_twice_stores_it_once(db):
+    user = db.create_user("alice", "Alice", "")
+    chat = db.create_chat("chat", [user['user_id']])
+    for _ in range(2):
+        db.create_message(chat['chat_id'], user['user_id'], "hi", "user", None, public_id="fixed")
+    assert len(db.get_messages_by_chat(chat['chat_id'])) == 1